@@ -1,8 +1,7 @@
-import requests
 from config import GITLAB_CLIENT_ID, GITLAB_CLIENT_SECRET, GITLAB_REDIRECT_URI
+from utils.gitlab_client import get_gitlab_client
 
-def exchange_code_for_token(code: str) -> str:
-    token_url = "https://gitlab.com/oauth/token"
+async def exchange_code_for_token(code: str) -> str:
     payload = {
         "client_id": GITLAB_CLIENT_ID,
         "client_secret": GITLAB_CLIENT_SECRET,
@@ -10,6 +9,7 @@ def exchange_code_for_token(code: str) -> str:
         "grant_type": "authorization_code",
         "redirect_uri": GITLAB_REDIRECT_URI
     }
-    response = requests.post(token_url, data=payload)
+    # Authorization codes are single-use, so a retry could only fail with invalid_grant
+    response = await get_gitlab_client().post("/oauth/token", data=payload, max_retries=0)
     response.raise_for_status()
-    return response.json()["access_token"]
\ No newline at end of file
+    return response.json()["access_token"]
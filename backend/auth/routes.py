@@ -1,12 +1,12 @@
 # auth/routes.py
-import requests
 from fastapi import APIRouter, Request, HTTPException, Response, Cookie
 from fastapi.responses import RedirectResponse
 from config import settings
 from models.user import UserCreate
 from db.crud_user import upsert_user
 from db.init import db
-from utils.token import create_jwt_token
+from utils.token import create_jwt_token, get_current_user
+from utils.gitlab_client import get_gitlab_client
 import secrets
 from fastapi import Depends
 
@@ -43,7 +43,7 @@ async def gitlab_callback(request: Request, response: Response):
         raise HTTPException(status_code=400, detail="Missing code in callback")
 
     # 1. Exchange code for access_token
-    token_url = "https://gitlab.com/oauth/token"
+    gitlab = get_gitlab_client()
     data = {
         "client_id": settings.GITLAB_CLIENT_ID,
         "client_secret": settings.GITLAB_CLIENT_SECRET,
@@ -51,16 +51,14 @@ async def gitlab_callback(request: Request, response: Response):
         "grant_type": "authorization_code",
         "redirect_uri": settings.GITLAB_REDIRECT_URI
     }
-    token_resp = requests.post(token_url, data=data)
+    # Authorization codes are single-use, so a retry could only fail with invalid_grant
+    token_resp = await gitlab.post("/oauth/token", data=data, max_retries=0)
     if token_resp.status_code != 200:
         raise HTTPException(status_code=400, detail="Failed to exchange code for token")
     access_token = token_resp.json().get("access_token")
 
     # 2. Fetch GitLab user info
-    user_resp = requests.get(
-        "https://gitlab.com/api/v4/user",
-        headers={"Authorization": f"Bearer {access_token}"}
-    )
+    user_resp = await gitlab.get("/api/v4/user", access_token)
     if user_resp.status_code != 200:
         raise HTTPException(status_code=400, detail="Failed to fetch user info")
     user_json = user_resp.json()
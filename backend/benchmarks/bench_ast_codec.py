@@ -0,0 +1,98 @@
+# benchmarks/bench_ast_codec.py
+"""
+Compare the compact columnar AST encoding with the sexp strings it replaced.
+
+    python benchmarks/bench_ast_codec.py [--path DIR] [--rounds 5]
+
+For every parsable file under --path, reports total stored size (raw and gzipped, as
+written to AST packs), encode time from a parsed tree, and decode time. Decoding a sexp
+only yields a string; to be usable it has to be re-parsed from source, so the "usable"
+column compares re-parsing against loading the compact form and finding all definitions.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from worker.ast_codec import CompactAST, encode_tree  # noqa: E402
+from worker.batching import DEFINITION_NODE_TYPES  # noqa: E402
+from worker.grammars import grammars  # noqa: E402
+
+
+def collect_files(path: str):
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [d for d in dirs if d not in (".git", "node_modules", "__pycache__")]
+        for name in names:
+            language = grammars.language_for_path(name)
+            if language is not None:
+                with open(os.path.join(root, name), "rb") as f:
+                    files.append((language, f.read()))
+    return files
+
+
+def timed(fn, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=BACKEND_DIR, help="Directory of source files to encode")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    if not grammars.available():
+        sys.exit("Run scripts/build_grammars.py first")
+    files = collect_files(args.path)
+    trees = [(language, source, grammars.parse(language, source)) for language, source in files]
+    source_bytes = sum(len(source) for _, source, _ in trees)
+
+    sexp_payloads = [
+        json.dumps({"type": "ast", "language": language.name, "tree": tree.root_node.sexp()}).encode()
+        for language, _, tree in trees
+    ]
+    compact_payloads = [encode_tree(tree, language.name).to_bytes() for language, _, tree in trees]
+
+    def reparse():
+        for language, source, _ in trees:
+            grammars.parse(language, source).root_node
+
+    def load_and_find():
+        for payload in compact_payloads:
+            CompactAST.from_buffer(payload).find(DEFINITION_NODE_TYPES)
+
+    results = {
+        "sexp": {
+            "raw": sum(map(len, sexp_payloads)),
+            "gzip": sum(len(gzip.compress(p)) for p in sexp_payloads),
+            "encode": timed(lambda: [tree.root_node.sexp() for _, _, tree in trees], args.rounds),
+            "decode": timed(lambda: [json.loads(p) for p in sexp_payloads], args.rounds),
+            "usable": timed(reparse, args.rounds),
+        },
+        "compact": {
+            "raw": sum(map(len, compact_payloads)),
+            "gzip": sum(len(gzip.compress(p)) for p in compact_payloads),
+            "encode": timed(lambda: [encode_tree(tree, language.name).to_bytes() for language, _, tree in trees], args.rounds),
+            "decode": timed(lambda: [CompactAST.from_buffer(p) for p in compact_payloads], args.rounds),
+            "usable": timed(load_and_find, args.rounds),
+        },
+    }
+
+    print(f"{len(files)} files, {source_bytes / 1024:.0f} KB of source, {args.rounds} rounds")
+    print(f"{'format':>8} {'raw KB':>9} {'x src':>6} {'gzip KB':>8} {'encode ms':>10} {'decode ms':>10} {'usable ms':>10}")
+    for name, r in results.items():
+        print(
+            f"{name:>8} {r['raw'] / 1024:>9.0f} {r['raw'] / source_bytes:>6.2f} {r['gzip'] / 1024:>8.0f} "
+            f"{r['encode'] * 1000:>10.1f} {r['decode'] * 1000:>10.2f} {r['usable'] * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# benchmarks/bench_grammars.py
+"""
+Measure Tree-sitter cold-start cost and parse throughput.
+
+    python benchmarks/bench_grammars.py [--path DIR] [--source-dir vendor] [--rounds 3]
+
+Cold start is measured in a fresh interpreter: importing the grammar registry and loading
+every prebuilt grammar, versus compiling them with Language.build_library as the worker
+used to on every start (only when --source-dir points at grammar checkouts). Throughput
+compares creating a Parser per file with reusing the pooled per-thread parsers.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from tree_sitter import Language, Parser
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from worker.grammars import EXTENSION_LANGUAGES, GRAMMAR_SOURCES, grammars  # noqa: E402
+
+COLD_START_SNIPPET = """
+import time
+started = time.perf_counter()
+from worker.grammars import grammars
+for name in grammars.available():
+    grammars.language(name)
+print(time.perf_counter() - started)
+"""
+
+
+def cold_start_load_seconds() -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", COLD_START_SNIPPET],
+        cwd=BACKEND_DIR, env={**os.environ, "PYTHONPATH": BACKEND_DIR},
+        capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def build_library_seconds(source_dir: str) -> float:
+    paths = []
+    for url, _, subdir in GRAMMAR_SOURCES.values():
+        paths.append(os.path.join(source_dir, url.rstrip("/").rsplit("/", 1)[-1], subdir))
+    with tempfile.TemporaryDirectory() as out:
+        started = time.perf_counter()
+        Language.build_library(os.path.join(out, "languages.so"), paths)
+        return time.perf_counter() - started
+
+
+def collect_files(path: str):
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [d for d in dirs if d not in (".git", "node_modules", "__pycache__")]
+        for name in names:
+            language = grammars.language_for_path(name)
+            if language is None:
+                continue
+            with open(os.path.join(root, name), "rb") as f:
+                files.append((language, f.read()))
+    return files
+
+
+def parse_throughput(files, pooled: bool, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for language, content in files:
+            if pooled:
+                grammars.parse(language, content)
+            else:
+                parser = Parser()
+                parser.set_language(language)
+                parser.parse(content)
+    return len(files) * rounds / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=BACKEND_DIR, help="Directory of source files to parse")
+    parser.add_argument("--source-dir", help="Grammar checkouts, to time building them from source")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    available = grammars.available()
+    print(f"Prebuilt grammars: {', '.join(available) or 'none'} ({grammars.grammar_dir})")
+    if not available:
+        sys.exit("Run scripts/build_grammars.py first")
+
+    print(f"Cold start, load prebuilt grammars: {cold_start_load_seconds() * 1000:.1f} ms")
+    if args.source_dir:
+        print(f"Cold start, build_library from source: {build_library_seconds(args.source_dir) * 1000:.1f} ms")
+
+    files = collect_files(args.path)
+    total_mb = sum(len(content) for _, content in files) / (1024 * 1024)
+    print(f"Parsing {len(files)} files ({total_mb:.2f} MB) x {args.rounds} rounds, extensions: {sorted(EXTENSION_LANGUAGES)}")
+    for label, pooled in (("new Parser per file", False), ("pooled parser", True)):
+        files_per_second = parse_throughput(files, pooled, args.rounds)
+        mb_per_second = files_per_second * total_mb / max(len(files), 1)
+        print(f"  {label:>20}: {files_per_second:,.0f} files/sec, {mb_per_second:.1f} MB/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/bench_repo_summaries.py
+"""
+Measure dashboard (repo list) summary latency against MongoDB.
+
+    MONGODB_URI=... python benchmarks/bench_repo_summaries.py [--repos 10 100 1000]
+                                                             [--scans-per-repo 5] [--findings 200]
+
+Seeds a scratch database (dropped afterwards) with synthetic scans, their violations
+and compliance scores, then times, for each repo count:
+
+  per-repo      the previous loop: get_repo_summary's four queries per repo, one
+                repo after another (latest completed scan, active scan, last two
+                scores, 30-day score history)
+  materialize   ScanCRUD.get_repo_summaries on first sight of the repos: three
+                aggregations for all repos, stored in repo_summaries (run once)
+  point read    ScanCRUD.get_repo_summaries afterwards: one _id lookup
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from db import crud_scan  # noqa: E402
+from db.crud_scan import ScanCRUD  # noqa: E402
+from db.init import client  # noqa: E402
+
+USER_ID = "bench-user"
+SEVERITIES = ["critical", "high", "medium", "low", "info"]
+
+
+async def seed(db, repos: int, scans_per_repo: int, findings: int) -> None:
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    scans, scores = [], []
+    for repo_id in range(1, repos + 1):
+        for i in range(scans_per_repo):
+            when = now - timedelta(days=(scans_per_repo - i) * 3)
+            overall = rng.randint(40, 100)
+            scans.append({
+                "repo_id": repo_id,
+                "user_id": USER_ID,
+                "repo_name": f"repo-{repo_id}",
+                "status": "completed",
+                "created_at": when,
+                "updated_at": when,
+                "results": {"scores": {"overall_score": overall, "total_violations": findings}},
+            })
+            scores.append({"repo_id": repo_id, "user_id": USER_ID, "scan_date": when, "overall_score": overall,
+                           "security_score": overall, "compliance_score": overall, "quality_score": overall})
+        if repo_id % 10 == 0:
+            scans.append({"repo_id": repo_id, "user_id": USER_ID, "repo_name": f"repo-{repo_id}",
+                          "status": "in_progress", "created_at": now, "updated_at": now})
+    inserted = await db.scans.insert_many(scans)
+    await db.compliance_scores.insert_many(scores)
+    for scan, scan_id in zip(scans, inserted.inserted_ids):
+        if scan["status"] == "completed":
+            await ScanCRUD.save_violations(scan["repo_id"], USER_ID, str(scan_id), (
+                {"violation_id": f"{scan_id}-{j}", "severity": rng.choice(SEVERITIES),
+                 "description": "x" * 200, "location": f"src/f{j}.py"}
+                for j in range(findings)
+            ))
+    await db.scans.create_index([("user_id", 1), ("repo_id", 1), ("status", 1), ("updated_at", -1)])
+    await db.compliance_scores.create_index([("repo_id", 1), ("scan_date", -1)])
+    await db.violations.create_index([("scan_id", 1), ("_id", 1)])
+
+
+async def per_repo(db, repo_ids):
+    start_date = datetime.utcnow() - timedelta(days=30)
+    for repo_id in repo_ids:
+        query = {"repo_id": repo_id, "user_id": USER_ID}
+        await db.scans.find_one({**query, "status": "completed"}, sort=[("updated_at", -1)])
+        await db.scans.find_one({**query, "status": {"$in": ["queued", "in_progress"]}}, sort=[("created_at", -1)])
+        await db.compliance_scores.find(query, sort=[("scan_date", -1)]).limit(2).to_list(length=2)
+        await db.compliance_scores.find({**query, "scan_date": {"$gte": start_date}}).sort("scan_date", 1).to_list(length=None)
+
+
+async def timed(fn, runs: int = 3) -> float:
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return statistics.median(latencies)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--scans-per-repo", type=int, default=5)
+    parser.add_argument("--findings", type=int, default=200)
+    args = parser.parse_args()
+
+    db_name = f"bench_repo_summaries_{int(time.time())}"
+    db = client[db_name]
+    crud_scan.db = db
+    try:
+        await seed(db, max(args.repos), args.scans_per_repo, args.findings)
+        print(f"{args.scans_per_repo} scans per repo, {args.findings} findings per scan (median of 3 runs)")
+        for count in args.repos:
+            repo_ids = list(range(1, count + 1))
+            await db.repo_summaries.delete_many({})
+            materialize = await timed(lambda: ScanCRUD.get_repo_summaries(repo_ids, USER_ID), runs=1)
+            assert len(await ScanCRUD.get_repo_summaries(repo_ids, USER_ID)) == count
+            old = await timed(lambda: per_repo(db, repo_ids))
+            new = await timed(lambda: ScanCRUD.get_repo_summaries(repo_ids, USER_ID))
+            print(f"  {count:>5} repos: per-repo {old:9.1f} ms, materialize {materialize:8.1f} ms, "
+                  f"point read {new:7.1f} ms ({old / new:5.1f}x)")
+    finally:
+        await client.drop_database(db_name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
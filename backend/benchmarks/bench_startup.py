@@ -0,0 +1,68 @@
+# benchmarks/bench_startup.py
+"""
+Report import time per module for each app profile and check it against a budget.
+
+    python benchmarks/bench_startup.py [--profile api|worker|all] [--top 15] [--budget-ms 1500]
+
+Each profile is imported in a fresh interpreter with `python -X importtime -c "import main"`
+and exits non-zero if any profile's total import time exceeds the budget.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILES = ("api", "worker", "all")
+
+
+def import_times(profile: str) -> List[Tuple[str, int, int]]:
+    """Return (module, self_us, cumulative_us) for every module imported by `import main`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "APP_PROFILE": profile, "PYTHONPATH": BACKEND_DIR},
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing main with APP_PROFILE={profile} failed:\n{result.stderr[-2000:]}")
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nesting is encoded as indentation after the single separator space
+        modules.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def report(profile: str, top: int) -> float:
+    modules = import_times(profile)
+    total_ms = next(cumulative for name, _, cumulative in modules if name == "main") / 1000
+    print(f"\nAPP_PROFILE={profile}: {total_ms:.0f} ms to import main, {len(modules)} modules")
+    print(f"  {'cumulative ms':>13}  {'self ms':>8}  module")
+    for name, self_us, cumulative_us in sorted(modules, key=lambda m: m[2], reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:>13.1f}  {self_us / 1000:>8.1f}  {name.strip()}")
+    return total_ms
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=PROFILES, action="append", help="Profiles to measure (default: all three)")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list per profile")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1500")))
+    args = parser.parse_args()
+
+    over_budget = []
+    for profile in args.profile or PROFILES:
+        total_ms = report(profile, args.top)
+        if total_ms > args.budget_ms:
+            over_budget.append(f"{profile} ({total_ms:.0f} ms)")
+    if over_budget:
+        sys.exit(f"\nOver the {args.budget_ms:.0f} ms import budget: {', '.join(over_budget)}")
+    print(f"\nAll profiles within the {args.budget_ms:.0f} ms import budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/bench_vector_store.py
+"""
+Measure latency and recall of the local vector index.
+
+    python benchmarks/bench_vector_store.py [--vectors 200000] [--dim 256] [--queries 200]
+                                            [--nprobe 8 16 32] [--repo-id ID]
+
+Builds a synthetic clustered corpus in a temporary directory and reports build time,
+query latency (p50/p95) and recall@10 of the IVF index against exact brute force, for
+each --nprobe. With --repo-id, also times the same query texts against the hosted
+Pinecone index for that repository (requires network and credentials).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from search import vector_store  # noqa: E402
+from search.vector_store import LocalVectorStore, PineconeVectorStore  # noqa: E402
+
+TOP_K = 10
+
+
+def make_corpus(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, count // 500), dim))
+    vectors = centers[rng.integers(0, len(centers), count)] + rng.normal(scale=1.0, size=(count, dim))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def timed_search(store, queries):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        hits = store.search(1, query, top_k=TOP_K)
+        latencies.append(time.perf_counter() - started)
+        results.append({hit["id"] for hit in hits})
+    return np.array(latencies) * 1000, results
+
+
+def build(root: str, vectors: np.ndarray, ivf: bool, nprobe: int) -> LocalVectorStore:
+    lookup = {f"v{i}": v for i, v in enumerate(vectors)}
+    store = LocalVectorStore(root, embed=lambda texts: np.stack([lookup[t] for t in texts]), nprobe=nprobe)
+    vector_store.LOCAL_INDEX_IVF_THRESHOLD = 1 if ivf else len(vectors) + 1
+    if not os.path.exists(os.path.join(root, "1", "manifest.json")):
+        records = [{"_id": f"1:{i}", "text": f"v{i}", "repo_id": 1, "file_path": f"f{i}.py"} for i in range(len(vectors))]
+        vector_store.LOCAL_INDEX_MAX_SEGMENTS = len(records)
+        store.upsert_records("__default__", records)
+        store.compact(1)
+    return store
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--repo-id", type=int, help="Also time the hosted Pinecone index for this repository")
+    args = parser.parse_args()
+
+    vectors = make_corpus(args.vectors, args.dim)
+    queries = [f"v{i}" for i in np.random.default_rng(1).choice(args.vectors, args.queries, replace=False)]
+    print(f"{args.vectors:,} vectors x {args.dim} dims, {args.queries} queries, top {TOP_K}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        exact_store = build(os.path.join(tmp, "exact"), vectors, ivf=False, nprobe=0)
+        print(f"  brute force build: {time.perf_counter() - started:.1f}s")
+        latencies, exact = timed_search(exact_store, queries)
+        print(f"  {'brute force':>14}: p50 {np.percentile(latencies, 50):6.2f} ms, p95 {np.percentile(latencies, 95):6.2f} ms, recall 1.000")
+
+        started = time.perf_counter()
+        ivf_root = os.path.join(tmp, "ivf")
+        build(ivf_root, vectors, ivf=True, nprobe=0)
+        print(f"  IVF build (k-means + int8 codes): {time.perf_counter() - started:.1f}s")
+        for nprobe in args.nprobe:
+            latencies, found = timed_search(build(ivf_root, vectors, ivf=True, nprobe=nprobe), queries)
+            recall = np.mean([len(a & b) / TOP_K for a, b in zip(found, exact)])
+            print(f"  {f'IVF nprobe={nprobe}':>14}: p50 {np.percentile(latencies, 50):6.2f} ms, p95 {np.percentile(latencies, 95):6.2f} ms, recall {recall:.3f}")
+
+    if args.repo_id is not None:
+        from utils.clients import get_pinecone_index
+        index = get_pinecone_index()
+        if index is None:
+            sys.exit("Pinecone is not available")
+        hosted = PineconeVectorStore(index)
+        latencies = []
+        for query in ["authentication token validation", "sql query construction", "password hashing"] * 10:
+            started = time.perf_counter()
+            hosted.search(args.repo_id, query, top_k=TOP_K)
+            latencies.append((time.perf_counter() - started) * 1000)
+        print(f"  {'Pinecone':>14}: p50 {np.percentile(latencies, 50):6.2f} ms, p95 {np.percentile(latencies, 95):6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# benchmarks/load_gitlab_client.py
+"""
+Load-test the shared GitLab client against a local fake GitLab server.
+
+    python benchmarks/load_gitlab_client.py [--requests 500] [--concurrency 20]
+                                            [--latency-ms 20] [--error-rate 0.05]
+
+The fake server answers GET /api/v4/projects/{id} after --latency-ms (standing in for
+the round trip to gitlab.com), fails a fraction of requests with 502, and sends
+GitLab's RateLimit-* headers. It reports throughput, latency and the number of TCP
+connections opened for:
+
+  requests  one blocking requests.get per call, as the routes did before; each call
+            holds the event loop, so calls run one after another on fresh connections
+  pooled    the shared GitLabClient, --concurrency calls in flight on pooled
+            keep-alive connections, retrying the injected 502s
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from utils import gitlab_client  # noqa: E402
+from utils.gitlab_client import GitLabClient  # noqa: E402
+
+
+class FakeGitLab:
+    """Minimal HTTP/1.1 keep-alive server speaking just enough of the GitLab API."""
+
+    def __init__(self, latency: float, error_rate: float, rate_limit: int = 2000):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(0)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode().split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+                length = int(headers.get("Content-Length", headers.get("content-length", "0")))
+                if length:
+                    await reader.readexactly(length)
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                if self._rng.random() < self.error_rate:
+                    self.errors += 1
+                    status, body = "502 Bad Gateway", b'{"message": "502 Bad Gateway"}'
+                else:
+                    project_id = path.split("?")[0].rstrip("/").rsplit("/", 1)[-1]
+                    status = "200 OK"
+                    body = json.dumps({
+                        "id": int(project_id) if project_id.isdigit() else 0,
+                        "name": f"project-{project_id}",
+                        "http_url_to_repo": f"https://gitlab.example/group/project-{project_id}.git",
+                    }).encode()
+                remaining = max(0, self.rate_limit - self.requests)
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\nRateLimit-Limit: {self.rate_limit}\r\n"
+                    f"RateLimit-Remaining: {remaining}\r\nRateLimit-Reset: {int(time.time()) + 60}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+                if headers.get("Connection", headers.get("connection", "")).lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+
+def report(name: str, server: FakeGitLab, latencies: list, elapsed: float, ok: int) -> None:
+    latencies = np.array(latencies) * 1000
+    print(
+        f"  {name:>8}: {len(latencies) / elapsed:7.1f} req/s, p50 {np.percentile(latencies, 50):6.1f} ms, "
+        f"p95 {np.percentile(latencies, 95):6.1f} ms, {ok}/{len(latencies)} ok, "
+        f"{server.connections} connections, {server.requests} server requests"
+    )
+
+
+async def run_requests(args) -> None:
+    import requests
+    server = FakeGitLab(args.latency_ms / 1000, args.error_rate)
+    base_url = await server.start()
+    latencies, ok = [], 0
+    started = time.perf_counter()
+    for i in range(args.requests):
+        call_started = time.perf_counter()
+        # Blocking on purpose: this is what the routes did inside async handlers. The
+        # server shares the loop, so run the call in a thread to let it respond.
+        resp = await asyncio.to_thread(
+            requests.get, f"{base_url}/api/v4/projects/{i}", headers={"Authorization": "Bearer token"}
+        )
+        ok += resp.status_code == 200
+        latencies.append(time.perf_counter() - call_started)
+    report("requests", server, latencies, time.perf_counter() - started, ok)
+    await server.stop()
+
+
+async def run_pooled(args) -> None:
+    server = FakeGitLab(args.latency_ms / 1000, args.error_rate)
+    base_url = await server.start()
+    gitlab_client.RETRY_BASE_DELAY_SECONDS = 0.01
+    client = GitLabClient(base_url=base_url, max_connections=args.concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def call(i: int) -> bool:
+        async with semaphore:
+            call_started = time.perf_counter()
+            resp = await client.get_project(i, "token")
+            latencies.append(time.perf_counter() - call_started)
+            return resp.status_code == 200
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(call(i) for i in range(args.requests)))
+    report("pooled", server, latencies, time.perf_counter() - started, sum(results))
+    print(f"{'':12}{client.retries} retries, {server.errors} injected errors")
+    await client.aclose()
+    await server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    args = parser.parse_args()
+    logging.getLogger(gitlab_client.__name__).setLevel(logging.ERROR)
+
+    print(f"{args.requests} project lookups, {args.latency_ms:g} ms server latency, {args.error_rate:.0%} injected 502s")
+    asyncio.run(run_requests(args))
+    asyncio.run(run_pooled(args))
+
+
+if __name__ == "__main__":
+    main()
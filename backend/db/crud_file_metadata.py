@@ -0,0 +1,77 @@
+# db/crud_file_metadata.py
+import logging
+from datetime import datetime
+from typing import Dict, Iterable
+from pymongo import UpdateOne
+from db.init import db
+
+logger = logging.getLogger(__name__)
+
+# Upserts per bulk_write call; keeps each request well under the 48 MB message limit
+BULK_WRITE_BATCH_SIZE = 1000
+# Bump when what counts as an analyzed file changes; hashes committed under an older
+# version are ignored, so those files are analyzed again
+FILE_ANALYSIS_VERSION = 2
+
+class FileMetadataCRUD:
+    """
+    CRUD operations for the file hash cache. Hashes are kept per repository and user,
+    like the scans whose findings they stand for: a file's hash only means "analyzed"
+    against that user's previous scan.
+    """
+
+    @staticmethod
+    async def get_hash_map(repo_id: int, user_id: str) -> Dict[str, str]:
+        """Load every known file hash for a user's repository in a single projected query."""
+        try:
+            cursor = db.get_collection("file_metadata").find(
+                {"repo_id": repo_id, "user_id": user_id, "analysis_version": FILE_ANALYSIS_VERSION},
+                projection={"_id": 0, "path": 1, "hash": 1}
+            )
+            hash_map = {}
+            async for doc in cursor:
+                if doc.get("hash"):
+                    hash_map[doc["path"]] = doc["hash"]
+            logger.info(f"Loaded {len(hash_map)} cached file hashes for repo {repo_id}")
+            return hash_map
+        except Exception as e:
+            logger.error(f"Failed to load file hashes for repo {repo_id}: {str(e)}")
+            return {}
+
+    @staticmethod
+    async def bulk_upsert_hashes(repo_id: int, user_id: str, file_hashes: Dict[str, str]) -> int:
+        """
+        Commit analyzed file hashes with unordered bulk upserts.
+        Returns the number of documents upserted or modified.
+        """
+        if not file_hashes:
+            return 0
+
+        collection = db.get_collection("file_metadata")
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"repo_id": repo_id, "user_id": user_id, "path": path},
+                {"$set": {"hash": file_hash, "analysis_version": FILE_ANALYSIS_VERSION, "last_scanned": now}},
+                upsert=True
+            )
+            for path, file_hash in file_hashes.items()
+        ]
+
+        written = 0
+        for start in range(0, len(operations), BULK_WRITE_BATCH_SIZE):
+            result = await collection.bulk_write(operations[start:start + BULK_WRITE_BATCH_SIZE], ordered=False)
+            written += result.upserted_count + result.modified_count
+        logger.info(f"Committed {len(file_hashes)} file hashes for repo {repo_id}")
+        return written
+
+    @staticmethod
+    async def delete_paths(repo_id: int, user_id: str, paths: Iterable[str]) -> int:
+        """Forget cached hashes for files that no longer exist in the repository."""
+        paths = list(paths)
+        if not paths:
+            return 0
+        result = await db.get_collection("file_metadata").delete_many(
+            {"repo_id": repo_id, "user_id": user_id, "path": {"$in": paths}}
+        )
+        return result.deleted_count
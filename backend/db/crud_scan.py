@@ -1,13 +1,47 @@
 # db/crud_scan.py
+import asyncio
 import logging
-from typing import List, Optional, Dict, Any
+import os
+from typing import AsyncIterator, Iterable, List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
 from db.init import db
 from models.scan import Violation, ComplianceScore, ScanResult, ScanSummary, RepoComplianceSummary
 
 logger = logging.getLogger(__name__)
 
+ACTIVE_SCAN_STATUSES = ["queued", "in_progress"]
+SUMMARY_SEVERITIES = ("critical", "high", "medium", "low")
+# Findings in these statuses count as open violations
+OPEN_VIOLATION_STATUSES = ["open", "in_progress"]
+
+REPO_SUMMARIES_COLLECTION = "repo_summaries"
+REPO_SUMMARY_HISTORY_POINTS = 30
+REPO_SUMMARY_COUNT_FIELDS = ("open_violations_count", *(f"{s}_violations_count" for s in SUMMARY_SEVERITIES))
+
+# Findings live only in the violations collection; scan documents keep the summary and scores
+VIOLATIONS_COLLECTION = "violations"
+VIOLATION_FIELDS = (
+    "violation_id", "type", "severity", "description", "recommendation", "location", "line", "rule_id",
+    "status", "assigned_priority", "category", "estimated_fix_time", "compliance_impact", "risk_level",
+    "discovered_date",
+)
+VIOLATION_INSERT_BATCH_SIZE = int(os.getenv("VIOLATION_INSERT_BATCH_SIZE", "1000"))
+VIOLATIONS_PAGE_SIZE = int(os.getenv("VIOLATIONS_PAGE_SIZE", "500"))
+# Scans from before findings moved out still carry them inline; never read them back
+SCAN_PROJECTION = {"results.findings": 0}
+
+# Per-user, per-day score rollups behind the analytics trend
+ANALYTICS_DAILY_COLLECTION = "analytics_daily"
+ANALYTICS_TREND_DAYS = 30
+
+
+def without_findings(results: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of a scan's results stored on the scan document and sent to clients"""
+    return {k: v for k, v in results.items() if k != "findings"}
+
+
 class ScanCRUD:
     """CRUD operations for scan-related data"""
     
@@ -32,41 +66,90 @@ class ScanCRUD:
             raise
     
     @staticmethod
-    async def save_violations(repo_id: int, user_id: str, scan_id: str, violations: List[Dict[str, Any]]) -> None:
-        """Save violations to database"""
+    async def save_violations(repo_id: int, user_id: str, scan_id: str, violations: Iterable[Dict[str, Any]]) -> int:
+        """Save a scan's findings to the violations collection in unordered bulk inserts; returns how many"""
         try:
-            violations_collection = db.get_collection("violations")
-            violations_to_insert = []
-            
+            violations_collection = db.get_collection(VIOLATIONS_COLLECTION)
+            saved = 0
+            batch = []
+            now = datetime.utcnow()
             for violation in violations:
-                violation_doc = {
-                    "violation_id": violation.get("violation_id"),
+                violation_doc = {field: violation.get(field) for field in VIOLATION_FIELDS}
+                violation_doc.update({
                     "repo_id": repo_id,
                     "user_id": user_id,
                     "scan_id": scan_id,
-                    "type": violation.get("type"),
-                    "severity": violation.get("severity"),
-                    "description": violation.get("description"),
-                    "location": violation.get("location"),
-                    "status": violation.get("status", "open"),
-                    "assigned_priority": violation.get("assigned_priority"),
-                    "category": violation.get("category"),
-                    "estimated_fix_time": violation.get("estimated_fix_time"),
-                    "compliance_impact": violation.get("compliance_impact"),
-                    "risk_level": violation.get("risk_level"),
-                    "discovered_date": violation.get("discovered_date"),
-                    "created_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                }
-                violations_to_insert.append(violation_doc)
-            
-            if violations_to_insert:
-                await violations_collection.insert_many(violations_to_insert)
-                logger.info(f"Saved {len(violations_to_insert)} violations for repo {repo_id}")
-                
+                    "status": violation.get("status") or "open",
+                    "created_at": now,
+                    "updated_at": now,
+                })
+                batch.append(violation_doc)
+                if len(batch) >= VIOLATION_INSERT_BATCH_SIZE:
+                    await violations_collection.insert_many(batch, ordered=False)
+                    saved += len(batch)
+                    batch = []
+            if batch:
+                await violations_collection.insert_many(batch, ordered=False)
+                saved += len(batch)
+            if saved:
+                logger.info(f"Saved {saved} violations for repo {repo_id}")
+            return saved
+
         except Exception as e:
             logger.error(f"Failed to save violations: {str(e)}")
             raise
+
+    @staticmethod
+    async def get_violations_page(
+        scan_id: str,
+        after: Optional[str] = None,
+        limit: int = VIOLATIONS_PAGE_SIZE,
+        projection: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of a scan's violations in the order they were saved, and the cursor
+        for the next page (None on the last one). Pages are keyed on _id, so each is an
+        index range scan however deep it is. `projection` must be an inclusion projection.
+        """
+        query: Dict[str, Any] = {"scan_id": scan_id}
+        if after:
+            query["_id"] = {"$gt": ObjectId(after)}
+        try:
+            cursor = db.get_collection(VIOLATIONS_COLLECTION).find(query, projection).sort("_id", 1).limit(limit + 1)
+            docs = await cursor.to_list(length=limit + 1)
+        except Exception as e:
+            logger.error(f"Failed to get violations for scan {scan_id}: {str(e)}")
+            raise
+        if len(docs) > limit:
+            docs = docs[:limit]
+            return docs, str(docs[-1]["_id"])
+        return docs, None
+
+    @staticmethod
+    async def iter_violations(
+        scan_id: str,
+        projection: Optional[Dict[str, Any]] = None,
+        page_size: int = VIOLATIONS_PAGE_SIZE,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield a scan's violations page by page"""
+        after = None
+        while True:
+            page, after = await ScanCRUD.get_violations_page(scan_id, after, page_size, projection)
+            if page:
+                yield page
+            if after is None:
+                return
+
+    @staticmethod
+    async def get_scan_findings(scan_id: str) -> List[Dict[str, Any]]:
+        """Get a scan's violations in the shape the worker produced them, e.g. to carry them forward"""
+        projection = {field: 1 for field in VIOLATION_FIELDS}
+        findings = []
+        async for page in ScanCRUD.iter_violations(scan_id, projection):
+            for doc in page:
+                doc.pop("_id", None)
+                findings.append(doc)
+        return findings
     
     @staticmethod
     async def save_compliance_score(repo_id: int, user_id: str, scan_id: str, scores: Dict[str, Any]) -> None:
@@ -113,6 +196,19 @@ class ScanCRUD:
             logger.error(f"Failed to get latest scan: {str(e)}")
             return None
     
+    @staticmethod
+    async def get_latest_completed_scan(repo_id: int, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get the most recent completed scan, used as the baseline for incremental scans"""
+        try:
+            return await db.get_collection("scans").find_one(
+                {"repo_id": repo_id, "user_id": user_id, "status": "completed"},
+                SCAN_PROJECTION,
+                sort=[("updated_at", -1)]
+            )
+        except Exception as e:
+            logger.error(f"Failed to get latest completed scan: {str(e)}")
+            return None
+    
     @staticmethod
     async def get_scan_history(repo_id: int, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get scan history for a repository"""
@@ -218,99 +314,283 @@ class ScanCRUD:
     @staticmethod
     async def get_repo_summary(repo_id: int, user_id: str) -> Optional[Dict[str, Any]]:
         """Get comprehensive repository compliance summary"""
+        summaries = await ScanCRUD.get_repo_summaries([repo_id], user_id)
+        return summaries.get(repo_id)
+
+    @staticmethod
+    async def get_repo_summaries(repo_ids: List[int], user_id: str) -> Dict[int, Dict[str, Any]]:
+        """
+        Get compliance summaries for many repositories at once, keyed by repo id.
+
+        Summaries are materialized in the repo_summaries collection as scans complete, so
+        this is one _id lookup. Repos never seen before are built once from the scan
+        history and stored. Repos without scans are omitted.
+        """
+        if not repo_ids:
+            return {}
         try:
-            # Get latest completed scan for historical data
-            latest_completed_scan = await db.get_collection("scans").find_one(
-                {"repo_id": repo_id, "user_id": user_id, "status": "completed"},
-                sort=[("updated_at", -1)]
-            )
-            
-            # Check for an active scan (queued or in_progress)
-            active_scan = await db.get_collection("scans").find_one(
-                {"repo_id": repo_id, "user_id": user_id, "status": {"$in": ["queued", "in_progress"]}},
-                sort=[("created_at", -1)]
+            cursor = db.get_collection(REPO_SUMMARIES_COLLECTION).find(
+                {"_id": {"$in": [ScanCRUD._repo_summary_id(repo_id, user_id) for repo_id in repo_ids]}}
             )
+            docs = {doc["repo_id"]: doc async for doc in cursor}
+            missing = [repo_id for repo_id in repo_ids if repo_id not in docs]
+            if missing:
+                docs.update(await ScanCRUD._materialize_repo_summaries(missing, user_id))
+            summaries = {}
+            for repo_id in repo_ids:
+                summary = ScanCRUD._summary_from_doc(docs[repo_id]) if repo_id in docs else None
+                if summary:
+                    summaries[repo_id] = summary
+            return summaries
+        except Exception as e:
+            logger.error(f"Failed to get repo summaries for {len(repo_ids)} repos: {e}")
+            return {}
 
-            if not latest_completed_scan and not active_scan:
-                return None # No scans at all for this repo
-            
-            summary_data = {
+    @staticmethod
+    def _repo_summary_id(repo_id: int, user_id: str) -> str:
+        return f"{user_id}:{repo_id}"
+
+    @staticmethod
+    def _summary_from_doc(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Shape a repo_summaries document as the API's summary; None if the repo has no scans"""
+        if not doc.get("last_scan_id") and not doc.get("active_scan_id"):
+            return None
+        overall_score = doc.get("overall_score", 0)
+        status = "completed" if doc.get("last_scan_id") else "N/A"
+        last_scan_date = doc.get("last_scan_date")
+        return {
+            "repo_id": doc["repo_id"],
+            "repo_name": doc.get("repo_name") or "N/A",
+            "last_scan_date": last_scan_date.isoformat() if last_scan_date else None,
+            "overall_score": overall_score,
+            "grade": ScanCRUD._get_grade_from_score(overall_score) if doc.get("last_scan_id") else "N/A",
+            # An active scan's status takes precedence
+            "status": doc.get("active_status") or status,
+            "trend": doc.get("trend", "stable"),
+            "open_violations_count": doc.get("open_violations_count", 0),
+            **{f"{severity}_violations_count": doc.get(f"{severity}_violations_count", 0) for severity in SUMMARY_SEVERITIES},
+            "compliance_history": [
+                {
+                    "date": point["date"].isoformat(),
+                    "overall_score": point.get("overall_score") or 0,
+                    "security_score": point.get("security_score") or 0,
+                    "compliance_score": point.get("compliance_score") or 0,
+                    "quality_score": point.get("quality_score") or 0,
+                    "grade": ScanCRUD._get_grade_from_score(point.get("overall_score") or 0)
+                }
+                for point in doc.get("compliance_history", [])
+            ],
+            "violation_history": [],
+            "active_scan_id": doc.get("active_scan_id"),
+        }
+
+    @staticmethod
+    async def _materialize_repo_summaries(repo_ids: List[int], user_id: str) -> Dict[int, Dict[str, Any]]:
+        """
+        Build repo_summaries documents from the scan history of repos that don't have one yet.
+
+        Two aggregations cover all the repos: one picks each repo's latest completed and
+        latest active scan, the other each repo's last score points. A third counts the
+        open violations of the completed scans by severity. Every repo gets a document,
+        even without scans, so later reads never fall back here; writes from a concurrent
+        scan win.
+        """
+        scans_pipeline = [
+            {"$match": {
+                "user_id": user_id,
+                "repo_id": {"$in": repo_ids},
+                "status": {"$in": ["completed", *ACTIVE_SCAN_STATUSES]}
+            }},
+            # Keep only the fields the summary needs so only small documents are sorted and grouped
+            {"$project": {
+                "repo_id": 1,
+                "repo_name": 1,
+                "status": 1,
+                "updated_at": 1,
+                "active": {"$in": ["$status", ACTIVE_SCAN_STATUSES]},
+                # Active scans are ordered by creation, completed ones by completion
+                "sort_date": {"$cond": [{"$in": ["$status", ACTIVE_SCAN_STATUSES]}, "$created_at", "$updated_at"]},
+                "overall_score": {"$ifNull": ["$results.scores.overall_score", 0]},
+            }},
+            {"$sort": {"sort_date": -1}},
+            {"$group": {"_id": {"repo_id": "$repo_id", "active": "$active"}, "scan": {"$first": "$$ROOT"}}},
+        ]
+        scores_pipeline = [
+            {"$match": {"user_id": user_id, "repo_id": {"$in": repo_ids}}},
+            {"$sort": {"scan_date": -1}},
+            {"$group": {
+                "_id": "$repo_id",
+                # $push + $slice rather than $firstN, which needs MongoDB 5.2+
+                "history": {"$push": {
+                    "date": "$scan_date",
+                    "overall_score": "$overall_score",
+                    "security_score": "$security_score",
+                    "compliance_score": "$compliance_score",
+                    "quality_score": "$quality_score",
+                }},
+            }},
+            {"$project": {"history": {"$slice": ["$history", REPO_SUMMARY_HISTORY_POINTS]}}},
+        ]
+        scans, scores = await asyncio.gather(
+            db.get_collection("scans").aggregate(scans_pipeline).to_list(length=None),
+            db.get_collection("compliance_scores").aggregate(scores_pipeline).to_list(length=None),
+        )
+        completed_scan_ids = [str(doc["scan"]["_id"]) for doc in scans if not doc["_id"]["active"]]
+        counts_by_scan: Dict[str, Dict[str, int]] = {}
+        if completed_scan_ids:
+            violations_pipeline = [
+                {"$match": {"scan_id": {"$in": completed_scan_ids}, "status": {"$in": OPEN_VIOLATION_STATUSES}}},
+                {"$group": {
+                    "_id": {"scan_id": "$scan_id", "severity": {"$toLower": {"$ifNull": ["$severity", "info"]}}},
+                    "count": {"$sum": 1},
+                }},
+            ]
+            async for doc in db.get_collection(VIOLATIONS_COLLECTION).aggregate(violations_pipeline):
+                counts = counts_by_scan.setdefault(doc["_id"]["scan_id"], {field: 0 for field in REPO_SUMMARY_COUNT_FIELDS})
+                counts["open_violations_count"] += doc["count"]
+                if doc["_id"]["severity"] in SUMMARY_SEVERITIES:
+                    counts[f"{doc['_id']['severity']}_violations_count"] += doc["count"]
+        latest_scans = {(doc["_id"]["repo_id"], doc["_id"]["active"]): doc["scan"] for doc in scans}
+        history_by_repo = {doc["_id"]: list(reversed(doc["history"])) for doc in scores}
+
+        now = datetime.utcnow()
+        docs = {}
+        for repo_id in repo_ids:
+            completed = latest_scans.get((repo_id, False))
+            active = latest_scans.get((repo_id, True))
+            history = history_by_repo.get(repo_id, [])
+            doc = {
+                "_id": ScanCRUD._repo_summary_id(repo_id, user_id),
                 "repo_id": repo_id,
-                "repo_name": "N/A", # Will be fetched from repo details later
-                "last_scan_date": None,
-                "overall_score": 0,
-                "grade": "N/A",
-                "status": "N/A",
-                "trend": "stable",
-                "open_violations_count": 0,
-                "critical_violations_count": 0,
-                "high_violations_count": 0,
-                "medium_violations_count": 0,
-                "low_violations_count": 0,
-                "compliance_history": [],
-                "violation_history": [],
-                "active_scan_id": None
+                "user_id": user_id,
+                "repo_name": (completed or active or {}).get("repo_name"),
+                "compliance_history": history,
+                "trend": ScanCRUD._trend(history),
+                "updated_at": now,
             }
-
-            scan_to_process = latest_completed_scan
-            
-            # If there's an active scan, its status takes precedence
-            if active_scan:
-                summary_data["active_scan_id"] = str(active_scan["_id"])
-                summary_data["status"] = active_scan["status"]
-            
-            if scan_to_process:
-                results = scan_to_process.get("results", {})
-                scores = results.get("scores", {})
-                findings = results.get("findings", [])
-                
-                # Correctly calculate violation counts from the findings list
-                critical_count = 0
-                high_count = 0
-                medium_count = 0
-                low_count = 0
-                for finding in findings:
-                    severity = finding.get("severity", "info").lower()
-                    if severity == "critical":
-                        critical_count += 1
-                    elif severity == "high":
-                        high_count += 1
-                    elif severity == "medium":
-                        medium_count += 1
-                    elif severity == "low":
-                        low_count += 1
-                
-                summary_data.update({
-                    "last_scan_date": scan_to_process.get("updated_at").isoformat(),
-                    "overall_score": scores.get("overall_score", 0),
-                    "grade": ScanCRUD._get_grade_from_score(scores.get("overall_score", 0)),
-                    "open_violations_count": len(findings),
-                    "critical_violations_count": critical_count,
-                    "high_violations_count": high_count,
-                    "medium_violations_count": medium_count,
-                    "low_violations_count": low_count,
-                    "status": active_scan["status"] if active_scan else scan_to_process.get("status", "completed"),
+            if completed:
+                doc.update({
+                    "last_scan_id": str(completed["_id"]),
+                    "last_scan_date": completed.get("updated_at"),
+                    "overall_score": completed.get("overall_score", 0),
+                    **counts_by_scan.get(str(completed["_id"]), {field: 0 for field in REPO_SUMMARY_COUNT_FIELDS}),
                 })
-            
-            # Determine trend based on historical data
-            summary_data["trend"] = await ScanCRUD._determine_trend(repo_id, user_id)
-            
-            # Fetch compliance history regardless of current scan status
-            summary_data["compliance_history"] = await ScanCRUD.get_compliance_trends(repo_id, user_id, days=30)
+            if active:
+                doc.update({"active_scan_id": str(active["_id"]), "active_status": active["status"]})
+            docs[repo_id] = doc
+
+        await db.get_collection(REPO_SUMMARIES_COLLECTION).bulk_write(
+            [UpdateOne({"_id": doc["_id"]}, {"$setOnInsert": doc}, upsert=True) for doc in docs.values()],
+            ordered=False
+        )
+        return docs
 
-            return summary_data
-        
+    @staticmethod
+    def _trend(history: List[Dict[str, Any]]) -> str:
+        """Compare the last two score points, oldest first"""
+        if len(history) < 2:
+            return "stable"
+        latest, previous = history[-1].get("overall_score") or 0, history[-2].get("overall_score") or 0
+        if latest > previous:
+            return "improving"
+        if latest < previous:
+            return "declining"
+        return "stable"
+
+    @staticmethod
+    async def record_repo_summary(repo_id: int, user_id: str, scan_id: str, results: Dict[str, Any]) -> None:
+        """
+        Fold a completed scan into its repo's materialized summary in one atomic update:
+        replace the counts and score, append the score point and recompute the trend.
+        """
+        scores = results.get("scores", {})
+        counts = {field: 0 for field in REPO_SUMMARY_COUNT_FIELDS}
+        for finding in results.get("findings", []):
+            if finding.get("status", "open") not in OPEN_VIOLATION_STATUSES:
+                continue
+            counts["open_violations_count"] += 1
+            severity = (finding.get("severity") or "info").lower()
+            if severity in SUMMARY_SEVERITIES:
+                counts[f"{severity}_violations_count"] += 1
+        now = datetime.utcnow()
+        point = {
+            "date": now,
+            "overall_score": scores.get("overall_score"),
+            "security_score": scores.get("security_score"),
+            "compliance_score": scores.get("compliance_score"),
+            "quality_score": scores.get("quality_score"),
+        }
+        scores_history = {"$ifNull": ["$compliance_history.overall_score", []]}
+        pipeline = [
+            {"$set": {
+                "last_scan_id": scan_id,
+                "last_scan_date": now,
+                "overall_score": scores.get("overall_score", 0),
+                **counts,
+                "compliance_history": {"$slice": [
+                    {"$concatArrays": [{"$ifNull": ["$compliance_history", []]}, [{"$literal": point}]]},
+                    -REPO_SUMMARY_HISTORY_POINTS
+                ]},
+                # This scan is no longer active
+                "active_scan_id": {"$cond": [{"$eq": ["$active_scan_id", scan_id]}, "$$REMOVE", "$active_scan_id"]},
+                "active_status": {"$cond": [{"$eq": ["$active_scan_id", scan_id]}, "$$REMOVE", "$active_status"]},
+                "updated_at": now,
+            }},
+            {"$set": {"trend": {"$let": {
+                "vars": {"scores": scores_history},
+                "in": {"$let": {
+                    "vars": {
+                        "latest": {"$ifNull": [{"$arrayElemAt": ["$$scores", -1]}, 0]},
+                        "previous": {"$ifNull": [{"$arrayElemAt": ["$$scores", -2]}, 0]},
+                    },
+                    "in": {"$switch": {
+                        "branches": [
+                            {"case": {"$lt": [{"$size": "$$scores"}, 2]}, "then": "stable"},
+                            {"case": {"$gt": ["$$latest", "$$previous"]}, "then": "improving"},
+                            {"case": {"$lt": ["$$latest", "$$previous"]}, "then": "declining"},
+                        ],
+                        "default": "stable"
+                    }}
+                }}
+            }}}},
+        ]
+        try:
+            result = await db.get_collection(REPO_SUMMARIES_COLLECTION).update_one(
+                {"_id": ScanCRUD._repo_summary_id(repo_id, user_id)}, pipeline
+            )
+            if result.matched_count == 0:
+                # First summary for this repo; the scan and its score are already saved
+                await ScanCRUD._materialize_repo_summaries([repo_id], user_id)
         except Exception as e:
-            logger.error(f"Failed to get repo summary for {repo_id}: {e}")
-            return None
+            logger.error(f"Failed to update repo summary for {repo_id}: {str(e)}")
+
+    @staticmethod
+    async def _set_repo_summary_activity(repo_id: int, user_id: str, scan_id: str, status: str) -> None:
+        """Track the repo's active scan on its summary; repos without one are materialized on first read"""
+        summaries = db.get_collection(REPO_SUMMARIES_COLLECTION)
+        summary_id = ScanCRUD._repo_summary_id(repo_id, user_id)
+        try:
+            if status in ACTIVE_SCAN_STATUSES:
+                await summaries.update_one(
+                    {"_id": summary_id},
+                    {"$set": {"active_scan_id": scan_id, "active_status": status}}
+                )
+            else:
+                await summaries.update_one(
+                    {"_id": summary_id, "active_scan_id": scan_id},
+                    {"$unset": {"active_scan_id": "", "active_status": ""}}
+                )
+        except Exception as e:
+            logger.error(f"Failed to update active scan for repo {repo_id}: {str(e)}")
     
     @staticmethod
-    async def create_scan(repo_id: int, user_id: str, repo_name: str) -> str:
-        """Create a new scan record in the database"""
+    async def create_scan(repo_id: int, user_id: str, repo_name: str, repo_url: Optional[str] = None) -> str:
+        """Create a new scan record in the database, with the repo's name and URL as of its creation"""
         scan_doc = {
             "repo_id": repo_id,
             "user_id": user_id,
             "repo_name": repo_name,
+            "repo_url": repo_url,
             "status": "queued",
             "progress": 0,
             "summary": "Scan has been queued for processing.",
@@ -318,7 +598,12 @@ class ScanCRUD:
             "updated_at": datetime.utcnow(),
         }
         result = await db.get_collection("scans").insert_one(scan_doc)
-        return str(result.inserted_id)
+        scan_id = str(result.inserted_id)
+        await db.get_collection(REPO_SUMMARIES_COLLECTION).update_one(
+            {"_id": ScanCRUD._repo_summary_id(repo_id, user_id)},
+            {"$set": {"repo_name": repo_name, "active_scan_id": scan_id, "active_status": "queued"}}
+        )
+        return scan_id
 
     @staticmethod
     async def update_scan_status(scan_id: str, status: str, progress: int, summary: str, results: Optional[Dict] = None):
@@ -330,7 +615,28 @@ class ScanCRUD:
             "updated_at": datetime.utcnow(),
         }
         if results:
-            update_doc["results"] = results
+            update_doc["results"] = without_findings(results)
+
+        scan = await db.get_collection("scans").find_one_and_update(
+            {"_id": ObjectId(scan_id)},
+            {"$set": update_doc},
+            projection={"repo_id": 1, "user_id": 1},
+        )
+        if scan:
+            await ScanCRUD._set_repo_summary_activity(scan["repo_id"], scan["user_id"], scan_id, status)
+
+    @staticmethod
+    async def update_index_status(scan_id: str, status: str, metrics: Optional[Dict] = None):
+        """
+        Record the state of the search indexing job that follows a scan. It has its own
+        timestamp: updated_at is when the scan completed, which orders the latest scans.
+        """
+        update_doc = {
+            "index_status": status,
+            "index_updated_at": datetime.utcnow(),
+        }
+        if metrics:
+            update_doc["index_metrics"] = metrics
 
         await db.get_collection("scans").update_one(
             {"_id": ObjectId(scan_id)},
@@ -348,34 +654,6 @@ class ScanCRUD:
             return "needs-improvement"
         return "healthy"
     
-    @staticmethod
-    async def _determine_trend(repo_id: int, user_id: str) -> str:
-        """Determine score trend by comparing the last two scans"""
-        try:
-            scores_collection = db.get_collection("compliance_scores")
-            # Get the last two scores, most recent first
-            cursor = scores_collection.find(
-                {"repo_id": repo_id, "user_id": user_id},
-                sort=[("scan_date", -1)]
-            ).limit(2)
-            
-            scores = await cursor.to_list(length=2)
-            
-            if len(scores) < 2:
-                return "stable"  # Not enough data for a trend
-            
-            latest_score = scores[0].get("overall_score", 0)
-            previous_score = scores[1].get("overall_score", 0)
-            
-            if latest_score > previous_score:
-                return "improving"
-            elif latest_score < previous_score:
-                return "declining"
-            else:
-                return "stable"
-        except Exception:
-            return "stable" # Default to stable if any error occurs
-    
     @staticmethod
     def _get_grade_from_score(score: float) -> str:
         """Converts a numerical score to a letter grade."""
@@ -449,12 +727,32 @@ class ScanCRUD:
                 update_data["resolved_by"] = resolved_by
                 update_data["resolution_notes"] = notes
             
-            result = await violations_collection.update_one(
+            previous = await violations_collection.find_one_and_update(
                 {"violation_id": violation_id},
-                {"$set": update_data}
+                {"$set": update_data},
+                projection={"repo_id": 1, "user_id": 1, "scan_id": 1, "severity": 1, "status": 1},
+                return_document=ReturnDocument.BEFORE
             )
-            
-            return result.modified_count > 0
+            if previous is None:
+                return False
+
+            # Keep the materialized counts of the repo's latest scan in step
+            was_open = previous.get("status", "open") in OPEN_VIOLATION_STATUSES
+            is_open = status in OPEN_VIOLATION_STATUSES
+            if was_open != is_open:
+                delta = 1 if is_open else -1
+                increments = {"open_violations_count": delta}
+                severity = (previous.get("severity") or "info").lower()
+                if severity in SUMMARY_SEVERITIES:
+                    increments[f"{severity}_violations_count"] = delta
+                await db.get_collection(REPO_SUMMARIES_COLLECTION).update_one(
+                    {
+                        "_id": ScanCRUD._repo_summary_id(previous["repo_id"], previous["user_id"]),
+                        "last_scan_id": previous.get("scan_id"),
+                    },
+                    {"$inc": increments}
+                )
+            return True
         except Exception as e:
             logger.error(f"Failed to update violation status: {str(e)}")
             return False
@@ -462,66 +760,65 @@ class ScanCRUD:
     @staticmethod
     async def get_analytics_summary(user_id: str) -> Dict[str, Any]:
         """Get aggregated analytics summary across all repositories for a user."""
+        empty = {
+            "average_compliance_score": 0, "active_violations": 0,
+            "compliance_trend": [], "top_violation_categories": []
+        }
         try:
             scans_collection = db.get_collection("scans")
-            
-            # 1. Get the latest completed scan for each repository
+
+            # 1. Find the latest completed scan of each repository, and read the trend
+            # from the daily rollups, without loading any scan document
             latest_scans_pipeline = [
                 {"$match": {"user_id": user_id, "status": "completed"}},
                 {"$sort": {"repo_id": 1, "updated_at": -1}},
-                {
-                    "$group": {
-                        "_id": "$repo_id",
-                        "latest_scan": {"$first": "$$ROOT"}
-                    }
-                },
-                {"$replaceRoot": {"newRoot": "$latest_scan"}}
+                {"$group": {"_id": "$repo_id", "scan_id": {"$first": "$_id"}}},
             ]
-            
-            latest_scans = await scans_collection.aggregate(latest_scans_pipeline).to_list(length=None)
-            
+            trend_start = (datetime.utcnow() - timedelta(days=ANALYTICS_TREND_DAYS)).strftime("%Y-%m-%d")
+            latest_scans, trend_data = await asyncio.gather(
+                scans_collection.aggregate(latest_scans_pipeline).to_list(length=None),
+                db.get_collection(ANALYTICS_DAILY_COLLECTION).find(
+                    {"user_id": user_id, "date": {"$gte": trend_start}}
+                ).sort("date", 1).to_list(length=None),
+            )
             if not latest_scans:
-                return {
-                    "average_compliance_score": 0, "active_violations": 0, 
-                    "compliance_trend": [], "top_violation_categories": []
-                }
+                return empty
 
-            # 2. Calculate overall summary stats
-            total_score = sum(s['results']['scores']['overall_score'] for s in latest_scans if s.get('results'))
-            total_violations = sum(s['results']['scores']['total_violations'] for s in latest_scans if s.get('results'))
-            avg_score = total_score / len(latest_scans) if latest_scans else 0
-
-            # 3. Get compliance trend for the last 30 days
-            thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-            trend_pipeline = [
-                {"$match": {"user_id": user_id, "status": "completed", "updated_at": {"$gte": thirty_days_ago}}},
-                {
-                    "$group": {
-                        "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$updated_at"}},
-                        "avg_score": {"$avg": "$results.scores.overall_score"}
-                    }
-                },
-                {"$sort": {"_id": 1}}
+            # 2. Average the scores of those scans, and count the categories of their
+            # violations, inside MongoDB
+            scan_ids = [doc["scan_id"] for doc in latest_scans]
+            scores_pipeline = [
+                {"$match": {"_id": {"$in": scan_ids}}},
+                {"$group": {
+                    "_id": None,
+                    "average_score": {"$avg": "$results.scores.overall_score"},
+                    "total_violations": {"$sum": "$results.scores.total_violations"},
+                }},
             ]
-            trend_data = await scans_collection.aggregate(trend_pipeline).to_list(length=None)
-            compliance_trend = [{"date": doc["_id"], "score": round(doc["avg_score"], 1)} for doc in trend_data]
-
-            # 4. Get top violation categories
-            all_findings = []
-            for scan in latest_scans:
-                if scan.get('results', {}).get('findings'):
-                    all_findings.extend(scan['results']['findings'])
+            categories_pipeline = [
+                {"$match": {"scan_id": {"$in": [str(scan_id) for scan_id in scan_ids]}}},
+                {"$group": {"_id": {"$ifNull": ["$category", "unknown"]}, "count": {"$sum": 1}}},
+            ]
+            scores_docs, categories = await asyncio.gather(
+                scans_collection.aggregate(scores_pipeline).to_list(length=1),
+                db.get_collection(VIOLATIONS_COLLECTION).aggregate(categories_pipeline).to_list(length=None),
+            )
+            scores = scores_docs[0] if scores_docs else {}
 
             category_counts = {}
-            for finding in all_findings:
-                cat = finding.get("category", "unknown").replace('_', ' ').title()
-                category_counts[cat] = category_counts.get(cat, 0) + 1
-            
+            for doc in categories:
+                cat = str(doc["_id"]).replace('_', ' ').title()
+                category_counts[cat] = category_counts.get(cat, 0) + doc["count"]
             top_violation_categories = [{"category": k, "count": v} for k, v in sorted(category_counts.items(), key=lambda item: item[1], reverse=True)][:10]
 
+            compliance_trend = [
+                {"date": doc["date"], "score": round(doc["score_sum"] / doc["scan_count"], 1)}
+                for doc in trend_data if doc.get("scan_count")
+            ]
+
             return {
-                "average_compliance_score": round(avg_score, 1),
-                "active_violations": total_violations,
+                "average_compliance_score": round(scores.get("average_score") or 0, 1),
+                "active_violations": scores.get("total_violations", 0),
                 "compliance_trend": compliance_trend,
                 "top_violation_categories": top_violation_categories
             }
@@ -529,7 +826,46 @@ class ScanCRUD:
         except Exception as e:
             logger.error(f"Failed to get analytics summary for user {user_id}: {e}")
             # Return a default empty state on error
-            return {
-                "average_compliance_score": 0, "active_violations": 0, 
-                "compliance_trend": [], "top_violation_categories": []
-            } 
\ No newline at end of file
+            return empty
+
+    @staticmethod
+    async def record_analytics_daily(user_id: str, overall_score: Optional[float], completed_at: Optional[datetime] = None) -> None:
+        """Add a completed scan's score to the user's rollup for the day it completed"""
+        if overall_score is None:
+            return
+        day = (completed_at or datetime.utcnow()).strftime("%Y-%m-%d")
+        try:
+            await db.get_collection(ANALYTICS_DAILY_COLLECTION).update_one(
+                {"_id": f"{user_id}:{day}"},
+                {
+                    "$inc": {"score_sum": overall_score, "scan_count": 1},
+                    "$setOnInsert": {"user_id": user_id, "date": day},
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to update daily analytics for user {user_id}: {str(e)}")
+
+    @staticmethod
+    async def rebuild_analytics_daily() -> None:
+        """Recompute every daily rollup from the completed scans, entirely inside MongoDB"""
+        pipeline = [
+            {"$match": {"status": "completed", "results.scores.overall_score": {"$type": "number"}}},
+            {"$group": {
+                "_id": {
+                    "user_id": "$user_id",
+                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$updated_at"}}
+                },
+                "score_sum": {"$sum": "$results.scores.overall_score"},
+                "scan_count": {"$sum": 1},
+            }},
+            {"$project": {
+                "_id": {"$concat": ["$_id.user_id", ":", "$_id.date"]},
+                "user_id": "$_id.user_id",
+                "date": "$_id.date",
+                "score_sum": 1,
+                "scan_count": 1,
+            }},
+            {"$merge": {"into": ANALYTICS_DAILY_COLLECTION, "whenMatched": "replace"}},
+        ]
+        await db.get_collection("scans").aggregate(pipeline).to_list(length=None)
@@ -2,7 +2,6 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from config import settings
 import certifi
-import asyncio
 
 client = AsyncIOMotorClient(
     settings.MONGODB_URI,
@@ -14,12 +13,34 @@ client = AsyncIOMotorClient(
 )
 db = client[settings.MONGODB_DB_NAME]
 
+_sync_client = None
+
+
+def get_sync_db():
+    """Blocking handle on the same database, for code that runs on worker threads."""
+    global _sync_client
+    if _sync_client is None:
+        from pymongo import MongoClient
+        _sync_client = MongoClient(
+            settings.MONGODB_URI,
+            tls=True,
+            tlsCAFile=certifi.where(),
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=10000,
+            socketTimeoutMS=20000
+        )
+    return _sync_client[settings.MONGODB_DB_NAME]
+
 async def init_collections():
-    """Initialize required collections with indexes."""
+    """Initialize required collections with indexes. Called from the app's startup event."""
     try:
-        # Initialize file_metadata collection
+        # Initialize file_metadata collection (file hashes per repository and user). Hashes
+        # from before they were per user can't be matched to a scan, so they're dropped
         file_metadata_collection = db.get_collection("file_metadata")
-        await file_metadata_collection.create_index([("repo_id", 1), ("path", 1)], unique=True)
+        if "repo_id_1_path_1" in await file_metadata_collection.index_information():
+            await file_metadata_collection.drop_index("repo_id_1_path_1")
+            await file_metadata_collection.delete_many({"user_id": {"$exists": False}})
+        await file_metadata_collection.create_index([("repo_id", 1), ("user_id", 1), ("path", 1)], unique=True)
         await file_metadata_collection.create_index([("repo_id", 1)])
         await file_metadata_collection.create_index([("last_scanned", -1)])
         
@@ -29,45 +50,67 @@ async def init_collections():
         await scan_results_collection.create_index([("user_id", 1), ("created_at", -1)])
         await scan_results_collection.create_index([("repo_id", 1), ("user_id", 1)])
         
+        # Initialize scans collection (repo summaries look up each repo's latest scans by status)
+        scans_collection = db.get_collection("scans")
+        await scans_collection.create_index([("user_id", 1), ("repo_id", 1), ("status", 1), ("updated_at", -1)])
+        
         # Initialize text_chunks collection (fallback for Pinecone)
         text_chunks_collection = db.get_collection("text_chunks")
         await text_chunks_collection.create_index([("chunk_id", 1)], unique=True)
         await text_chunks_collection.create_index([("metadata.repo_id", 1)])
         await text_chunks_collection.create_index([("created_at", -1)])
+
+        # Initialize indexed_files collection (which file versions are in the search index)
+        indexed_files_collection = db.get_collection("indexed_files")
+        await indexed_files_collection.create_index([("repo_id", 1)])
         
         # Initialize violations collection for enhanced tracking
         violations_collection = db.get_collection("violations")
         await violations_collection.create_index([("violation_id", 1)], unique=True)
+        # A scan's findings are read page by page in _id order
+        await violations_collection.create_index([("scan_id", 1), ("_id", 1)])
         await violations_collection.create_index([("repo_id", 1), ("status", 1)])
         await violations_collection.create_index([("repo_id", 1), ("severity", 1)])
         await violations_collection.create_index([("repo_id", 1), ("assigned_priority", 1)])
         await violations_collection.create_index([("discovered_date", -1)])
         await violations_collection.create_index([("category", 1)])
         
+        # Initialize keyword_chunks collection (shared keyword search index); text search
+        # must name the repo_id prefix, tokens are identifiers so nothing is stemmed, and
+        # the chunks' own language field is a programming language, not a text language
+        keyword_chunks_collection = db.get_collection("keyword_chunks")
+        await keyword_chunks_collection.create_index(
+            [("repo_id", 1), ("tokens", "text")], default_language="none", language_override="text_language"
+        )
+        
         # Initialize compliance_scores collection for historical scoring
         compliance_scores_collection = db.get_collection("compliance_scores")
         await compliance_scores_collection.create_index([("repo_id", 1), ("scan_date", -1)])
         await compliance_scores_collection.create_index([("repo_id", 1), ("user_id", 1)])
         await compliance_scores_collection.create_index([("overall_score", -1)])
         
+        # Initialize llm_findings_cache collection (content-addressed LLM results). Every new
+        # prompt version, model or file content adds keys, so entries expire after 30 days
+        llm_cache_collection = db.get_collection("llm_findings_cache")
+        if "created_at_-1" in await llm_cache_collection.index_information():
+            await llm_cache_collection.drop_index("created_at_-1")
+        await llm_cache_collection.create_index([("created_at", 1)], expireAfterSeconds=30 * 24 * 3600)
+        
+        # Initialize gitlab_projects collection (shared project metadata cache); entries
+        # are revalidated after minutes, so drop ones nobody has asked for in a week
+        gitlab_projects_collection = db.get_collection("gitlab_projects")
+        await gitlab_projects_collection.create_index([("fetched_at", 1)], expireAfterSeconds=7 * 24 * 3600)
+        
+        # Initialize analytics_daily collection (per-user daily score rollups)
+        analytics_daily_collection = db.get_collection("analytics_daily")
+        await analytics_daily_collection.create_index([("user_id", 1), ("date", 1)])
+        
         # Initialize users collection (if not exists)
         users_collection = db.get_collection("users")
         await users_collection.create_index([("gitlab_id", 1)], unique=True)
         await users_collection.create_index([("email", 1)])
         
         print("✅ Database collections initialized successfully")
-        print("📊 Collections: file_metadata, scan_results, text_chunks, violations, compliance_scores, users")
+        print("📊 Collections: file_metadata, scan_results, scans, text_chunks, indexed_files, keyword_chunks, violations, compliance_scores, llm_findings_cache, gitlab_projects, analytics_daily, users")
     except Exception as e:
         print(f"⚠️ Warning: Could not initialize collections: {e}")
-
-# Initialize collections on startup
-try:
-    loop = asyncio.get_event_loop()
-    if loop.is_running():
-        # If loop is already running, schedule the initialization
-        loop.create_task(init_collections())
-    else:
-        # If loop is not running, run the initialization
-        loop.run_until_complete(init_collections())
-except Exception as e:
-    print(f"⚠️ Warning: Could not initialize collections: {e}")
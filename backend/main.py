@@ -1,16 +1,21 @@
 # main.py
+import asyncio
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from auth.routes import router as auth_router
-from repos.routes import router as repos_router
-from worker.routes import router as worker_router
-from ws.routes import router as ws_router
-from analytics.routes import router as analytics_router
-from reports.routes import router as reports_router
+from db.init import init_collections
+from utils.gitlab_client import close_gitlab_client
 from config import settings
 
+# Which routers this process serves: "api" for the user-facing API, "worker" for the
+# scan worker behind Cloud Tasks, "all" for both (local development). Routers are only
+# imported for the selected profile, so each container loads just the SDKs it needs.
+APP_PROFILE = os.getenv("APP_PROFILE", "all")
+if APP_PROFILE not in ("api", "worker", "all"):
+    raise ValueError(f"APP_PROFILE must be 'api', 'worker' or 'all', got {APP_PROFILE!r}")
+
 app = FastAPI(title="AuditFlow API")
 
 # Allow CORS from your frontend domain(s)
@@ -32,12 +37,34 @@ app.add_middleware(
 )
 
 # Include routers
-app.include_router(auth_router, prefix="/api")
-app.include_router(repos_router, prefix="/api")
-app.include_router(worker_router, prefix="/api")
-app.include_router(ws_router, prefix="/api")
-app.include_router(analytics_router, prefix="/api")
-app.include_router(reports_router, prefix="/api")
+if APP_PROFILE in ("api", "all"):
+    from auth.routes import router as auth_router
+    from repos.routes import router as repos_router
+    from ws.routes import router as ws_router
+    from analytics.routes import router as analytics_router
+    from reports.routes import router as reports_router
+    app.include_router(auth_router, prefix="/api")
+    app.include_router(repos_router, prefix="/api")
+    app.include_router(ws_router, prefix="/api")
+    app.include_router(analytics_router, prefix="/api")
+    app.include_router(reports_router, prefix="/api")
+
+if APP_PROFILE in ("worker", "all"):
+    from worker.routes import router as worker_router
+    app.include_router(worker_router, prefix="/api")
+
+_background_tasks = set()
+
+@app.on_event("startup")
+async def startup():
+    # Index creation is idempotent and slow on a cold connection; don't block serving on it
+    task = asyncio.create_task(init_collections())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_gitlab_client()
 
 @app.get("/")
 def read_root():
@@ -1,25 +1,24 @@
 # repos/routes.py
-import requests
+import asyncio
 import json
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import StreamingResponse
 from utils.token import get_current_user
-from utils.pdf_generator import ComplianceReportGenerator
-from db.crud_scan import ScanCRUD
+from db.crud_scan import SCAN_PROJECTION, VIOLATION_FIELDS, VIOLATIONS_PAGE_SIZE, ScanCRUD
 from models.scan import RepoComplianceSummary, ScanSummary
-from typing import List
+from typing import AsyncIterator, List, Optional
 from datetime import datetime
 from db.init import db
-from google.cloud import tasks_v2
-from google.protobuf import timestamp_pb2
 import os
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-import google.auth
 import io
 from bson import ObjectId
 from config import settings
+from utils.clients import get_cloud_tasks_client
+from search.hybrid import get_search_index
+from utils.gitlab_client import GitLabError, get_gitlab_client
+from utils.project_cache import get_project_cache
 load_dotenv()
 
 # Configure logging
@@ -28,86 +27,84 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/repos", tags=["repos"])
 
-# Initialize Cloud Tasks client
-try:
-    # Log environment variables (without sensitive values)
-    logger.info(f"GCP_PROJECT_ID: {os.getenv('GCP_PROJECT_ID')}")
-    logger.info(f"GCP_LOCATION: {os.getenv('GCP_LOCATION')}")
-    logger.info(f"GCP_QUEUE_NAME: {os.getenv('GCP_QUEUE_NAME')}")
-    logger.info(f"GCP_SERVICE_ACCOUNT_EMAIL: {os.getenv('GCP_SERVICE_ACCOUNT_EMAIL')}")
-    
-    # Verify service account credentials
-    credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-    if not credentials_path:
-        raise Exception("GOOGLE_APPLICATION_CREDENTIALS environment variable is not set")
-    
-    if not os.path.exists(credentials_path):
-        raise Exception(f"Service account credentials file not found at: {credentials_path}")
-    
-    # Define required scopes
-    scopes = [
-        'https://www.googleapis.com/auth/cloud-platform',
-        'https://www.googleapis.com/auth/cloud-tasks',
-        'https://www.googleapis.com/auth/iam'
-    ]
-    
-    credentials = service_account.Credentials.from_service_account_file(
-        credentials_path,
-        scopes=scopes
-    )
-    
-    client = tasks_v2.CloudTasksClient(credentials=credentials)
-    QUEUE_PATH = client.queue_path(
-        os.getenv("GCP_PROJECT_ID"),
-        os.getenv("GCP_LOCATION"),
-        os.getenv("GCP_QUEUE_NAME")
-    )
-    logger.info(f"Queue path: {QUEUE_PATH}")
-except Exception as e:
-    logger.error(f"Failed to initialize Cloud Tasks client: {str(e)}")
-    raise
+# The Cloud Tasks client is created on first use (utils/clients.py)
+
+async def _summarized_pages(pages: AsyncIterator[List[dict]], user_id: str) -> AsyncIterator[List[dict]]:
+    """Join each page of GitLab projects with the user's scan summaries as it arrives."""
+    async for projects in pages:
+        # Summary, scan and report pages for these projects then skip their own GitLab lookup
+        await get_project_cache().prime(user_id, projects)
+        repo_summaries = await ScanCRUD.get_repo_summaries([p["id"] for p in projects], user_id)
+        summaries = []
+        for p in projects:
+            summary = repo_summaries.get(p["id"])
+            if summary:
+                summaries.append({**p, **summary})
+            else:
+                summaries.append({
+                    **p,
+                    "overall_score": 0,
+                    "grade": "N/A",
+                    "status": "not-scanned",
+                    "trend": "stable",
+                    "open_violations": 0,
+                    "last_scan_date": None
+                })
+        yield summaries
 
 @router.get("/")
-async def list_repos(current_user: dict = Depends(get_current_user)) -> List[dict]:
+async def list_repos(request: Request, current_user: dict = Depends(get_current_user)):
     """
-    Fetch the authenticated GitLab user's projects and return as a JSON list.
+    Fetch all of the authenticated GitLab user's projects with their compliance summaries.
+
+    Returns a JSON list, or with `Accept: application/x-ndjson` streams one project per
+    line as each page of projects is summarized, so the first rows render before the
+    last page arrives.
     """
     access_token = current_user.get("access_token")
     if not access_token:
         raise HTTPException(status_code=401, detail="GitLab access token missing")
 
     # GitLab API to list owned projects; you can adjust pagination & visibility
-    gitlab_url = "https://gitlab.com/api/v4/projects"
     params = {
         "membership": True,     # projects the user is a member of
         "per_page": 100,
         "order_by": "last_activity_at"
     }
-    headers = {"Authorization": f"Bearer {access_token}"}
-    resp = requests.get(gitlab_url, headers=headers, params=params)
-
-    if resp.status_code != 200:
+    pages = _summarized_pages(
+        get_gitlab_client().iter_pages("/api/v4/projects", access_token, params=params),
+        current_user["id"]
+    )
+    # Fail the request outright if GitLab won't list projects at all
+    try:
+        first_page = await pages.__anext__()
+    except GitLabError as e:
+        logger.error(f"Failed to fetch GitLab repos: {e}")
         raise HTTPException(status_code=400, detail="Failed to fetch GitLab repos")
 
-    projects = resp.json()
-    
-    summaries = []
-    for p in projects:
-        summary = await ScanCRUD.get_repo_summary(p["id"], current_user["id"])
-        if summary:
-            summaries.append({**p, **summary})
-        else:
-            summaries.append({
-                **p,
-                "overall_score": 0,
-                "grade": "N/A",
-                "status": "not-scanned",
-                "trend": "stable",
-                "open_violations": 0,
-                "last_scan_date": None
-            })
+    if "application/x-ndjson" not in request.headers.get("accept", ""):
+        summaries = list(first_page)
+        try:
+            async for page in pages:
+                summaries.extend(page)
+        except GitLabError as e:
+            logger.error(f"Failed to fetch GitLab repos: {e}")
+            raise HTTPException(status_code=400, detail="Failed to fetch GitLab repos")
+        return summaries
+
+    async def stream():
+        for summary in first_page:
+            yield json.dumps(summary, default=str) + "\n"
+        try:
+            async for page in pages:
+                for summary in page:
+                    yield json.dumps(summary, default=str) + "\n"
+        except GitLabError as e:
+            # Headers are sent; a final error line tells the client the list is incomplete
+            logger.error(f"Failed to fetch GitLab repos: {e}")
+            yield json.dumps({"error": "Failed to fetch all GitLab repos"}) + "\n"
 
-    return summaries
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 @router.get("/{repo_id}/summary", response_model=RepoComplianceSummary)
 async def get_repo_summary(repo_id: int, current_user: dict = Depends(get_current_user)):
@@ -119,17 +116,13 @@ async def get_repo_summary(repo_id: int, current_user: dict = Depends(get_curren
         if not summary:
             raise HTTPException(status_code=404, detail="No scan data found for this repository.")
         
-        # Add full repository info to the summary
-        access_token = current_user.get("access_token")
-        gitlab_url = f"https://gitlab.com/api/v4/projects/{repo_id}"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        resp = requests.get(gitlab_url, headers=headers)
-        if resp.status_code == 200:
-            repo_info = resp.json()
-            summary["repo_name"] = repo_info.get("name", "Unknown")
+        # The name is stored on the scan; only scans from before that need GitLab
+        if summary["repo_name"] == "N/A":
+            repo_info = await get_project_cache().get_project(repo_id, current_user["id"], current_user.get("access_token"))
+            if repo_info:
+                summary["repo_name"] = repo_info.get("name", "Unknown")
 
-        # Add scan history and trends
-        summary["compliance_history"] = await ScanCRUD.get_compliance_trends(repo_id, current_user["id"], days=30)
+        # Scan history and trends come with the summary
         summary["violation_history"] = [] # Placeholder for violation trend logic
         
         return summary
@@ -150,7 +143,7 @@ async def get_scan_history(repo_id: int, current_user: dict = Depends(get_curren
             "repo_id": repo_id,
             "user_id": current_user["id"],
             "status": "completed"
-        }).sort("updated_at", -1).limit(10)
+        }, SCAN_PROJECTION).sort("updated_at", -1).limit(10)
         
         scans = []
         async for scan in cursor:
@@ -195,7 +188,7 @@ async def get_latest_scan(repo_id: int, current_user: dict = Depends(get_current
             "repo_id": repo_id,
             "user_id": current_user["id"],
             "status": "completed"
-        }, sort=[("updated_at", -1)])
+        }, SCAN_PROJECTION, sort=[("updated_at", -1)])
         
         if not latest_scan:
             return {
@@ -229,15 +222,13 @@ async def request_scan(repo_id: int, current_user: dict = Depends(get_current_us
     try:
         # Step 1: Get repo details from GitLab to fetch the name
         access_token = current_user.get("access_token")
-        gitlab_url = f"https://gitlab.com/api/v4/projects/{repo_id}"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        resp = requests.get(gitlab_url, headers=headers)
-        resp.raise_for_status()
-        repo_info = resp.json()
+        repo_info = await get_project_cache().get_project(repo_id, current_user["id"], access_token)
+        if repo_info is None:
+            raise Exception(f"GitLab project {repo_id} not found or not accessible")
         repo_name = repo_info.get("name", f"Repo ID {repo_id}")
 
         # Step 2: Create a scan record in the database with the repo name
-        scan_id = await ScanCRUD.create_scan(repo_id, current_user["id"], repo_name)
+        scan_id = await ScanCRUD.create_scan(repo_id, current_user["id"], repo_name, repo_info.get("web_url"))
         logger.info(f"Created scan record {scan_id} for repo {repo_id} ('{repo_name}')")
 
         # Validate environment variables
@@ -248,6 +239,8 @@ async def request_scan(repo_id: int, current_user: dict = Depends(get_current_us
             "CLOUD_RUN_WORKER_URL",
             "GCP_SERVICE_ACCOUNT_EMAIL"
         ]
+        import google.auth
+        from google.cloud import tasks_v2
         credentials, project = google.auth.default()
         print("🔐 Effective service account:", credentials.service_account_email)
         
@@ -275,7 +268,8 @@ async def request_scan(repo_id: int, current_user: dict = Depends(get_current_us
         
         # Create the task
         logger.info(f"Creating task for repo {repo_id} with scan_id {scan_id}")
-        response = client.create_task(request={"parent": QUEUE_PATH, "task": task})
+        client, queue_path = get_cloud_tasks_client()
+        response = client.create_task(request={"parent": queue_path, "task": task})
         logger.info(f"Task created successfully: {response.name}")
         
         return {
@@ -306,43 +300,31 @@ async def semantic_code_search(
     repo_id: int, 
     query: str, 
     top_k: int = 10,
+    cursor: Optional[str] = None,
+    language: Optional[str] = None,
+    path_prefix: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Search for similar code patterns using semantic search.
+    Search code by meaning and by exact identifiers: keyword (BM25) and vector results
+    are fused. Returns `top_k` results per page; pass `next_cursor` back as `cursor` for
+    the next page. Language and file path prefix filters are applied inside both indexes;
+    with the hosted Pinecone index, `path_prefix` must be a directory ending in "/".
     """
     try:
-        from pinecone import Pinecone
-        from config import settings
-        pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-        index = pc.Index(settings.PINECONE_INDEX_NAME)  # Use 'auditflow-embeddings'
-        # Search for similar code patterns
-        results = index.search(
-            namespace="__default__",
-            query={
-                "inputs": {"text": query},
-                "top_k": top_k,
-                "filter": {"repo_id": repo_id}
-            },
-            fields=["text", "file_path", "language", "chunk_type"]
+        search_index = get_search_index()
+        search_results, next_cursor = await asyncio.to_thread(
+            search_index.search, repo_id, query, top_k, cursor, language, path_prefix
         )
-        # Format results
-        search_results = []
-        for hit in results['result']['hits']:
-            search_results.append({
-                "id": hit['_id'],
-                "score": hit['_score'],
-                "text": hit['fields']['text'],
-                "file_path": hit['fields']['file_path'],
-                "language": hit['fields']['language'],
-                "chunk_type": hit['fields']['chunk_type']
-            })
         return {
             "repo_id": repo_id,
             "query": query,
             "results": search_results,
-            "total_results": len(search_results)
+            "total_results": len(search_results),
+            "next_cursor": next_cursor
         }
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to perform semantic search: {str(e)}")
         raise HTTPException(
@@ -370,14 +352,14 @@ async def generate_compliance_report(
                 "_id": ObjectId(scan_id),
                 "repo_id": repo_id,
                 "user_id": current_user["id"]
-            })
+            }, SCAN_PROJECTION)
         else:
             # Get latest completed scan
             scan_data = await scans_collection.find_one({
                 "repo_id": repo_id,
                 "user_id": current_user["id"],
                 "status": "completed"
-            }, sort=[("updated_at", -1)])
+            }, SCAN_PROJECTION, sort=[("updated_at", -1)])
         
         if not scan_data or "results" not in scan_data:
             raise HTTPException(
@@ -387,15 +369,19 @@ async def generate_compliance_report(
         
         # Get repository info from GitLab
         access_token = current_user.get("access_token")
-        gitlab_url = f"https://gitlab.com/api/v4/projects/{repo_id}"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        resp = requests.get(gitlab_url, headers=headers)
-        if resp.status_code != 200:
+        repo_info = await get_project_cache().get_project(repo_id, current_user["id"], access_token)
+        if repo_info is None:
             raise HTTPException(status_code=400, detail="Failed to fetch repository details from GitLab")
-        repo_info = resp.json()
         
-        # Generate PDF
-        generator = ComplianceReportGenerator(scan_data=scan_data, repo_info=repo_info)
+        # The findings table only shows these fields
+        findings = []
+        report_fields = {"severity": 1, "category": 1, "description": 1, "location": 1}
+        async for page in ScanCRUD.iter_violations(str(scan_data["_id"]), report_fields):
+            findings.extend(page)
+
+        # Generate PDF; reportlab is only imported when a report is requested
+        from utils.pdf_generator import ComplianceReportGenerator
+        generator = ComplianceReportGenerator(scan_data=scan_data, repo_info=repo_info, findings=findings)
         pdf_bytes = generator.generate_report()
         
         # Return as a streaming response
@@ -414,27 +400,42 @@ async def generate_compliance_report(
 @router.get("/{repo_id}/violations")
 async def get_violations_summary(
     repo_id: int,
+    cursor: Optional[str] = None,
+    limit: int = VIOLATIONS_PAGE_SIZE,
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Get a summary of violations for a repository.
+    Get a summary of violations for a repository, with one page of the latest scan's
+    violations. Pass the returned next_cursor as `cursor` to get the next page; it is
+    None on the last one. The cursor names the scan it was issued for, so later pages
+    come from that scan even if a newer one completes in between.
     """
+    scan_id, after = cursor.split(".", 1) if cursor and "." in cursor else (None, None)
+    if cursor is not None and not (ObjectId.is_valid(scan_id) and ObjectId.is_valid(after)):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    limit = max(1, min(limit, VIOLATIONS_PAGE_SIZE))
     try:
         logger.info(f"Getting violations for repo {repo_id}, user {current_user['id']}")
         scans_collection = db.get_collection("scans")
         
-        # Get latest completed scan
-        latest_scan = await scans_collection.find_one({
+        # Get the cursor's scan, or the latest completed one for the first page
+        scan_query = {
             "repo_id": repo_id,
             "user_id": current_user["id"],
             "status": "completed"
-        }, sort=[("updated_at", -1)])
+        }
+        if scan_id:
+            scan_query["_id"] = ObjectId(scan_id)
+        latest_scan = await scans_collection.find_one(scan_query, SCAN_PROJECTION, sort=[("updated_at", -1)])
+        if scan_id and not latest_scan:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Scan for this cursor no longer exists")
         
         if not latest_scan or "results" not in latest_scan:
             logger.info(f"No completed scan with results found for repo {repo_id}")
             return {
                 "repo_id": repo_id,
                 "violations": [],
+                "next_cursor": None,
                 "summary": {
                     "total_violations": 0,
                     "critical_count": 0,
@@ -452,12 +453,18 @@ async def get_violations_summary(
         
         results = latest_scan["results"]
         scores = results.get("scores", {})
+        violations, next_after = await ScanCRUD.get_violations_page(
+            str(latest_scan["_id"]), after, limit, {field: 1 for field in VIOLATION_FIELDS}
+        )
+        for violation in violations:
+            violation.pop("_id")
         
         response_data = {
             "repo_id": repo_id,
             "scan_id": str(latest_scan["_id"]),
             "scan_date": latest_scan["updated_at"].isoformat(),
-            "violations": results.get("findings", []),
+            "violations": violations,
+            "next_cursor": f"{latest_scan['_id']}.{next_after}" if next_after else None,
             "summary": {
                 "total_violations": scores.get("total_violations", 0),
                 "critical_violations_count": scores.get("critical_violations", 0),
@@ -471,6 +478,8 @@ async def get_violations_summary(
         logger.info(f"Returning violations data: {len(response_data['violations'])} violations, scores: {response_data['scores']}")
         return response_data
         
+    except HTTPException as http_exc:
+        raise http_exc # Re-raise HTTPException
     except Exception as e:
         logger.error(f"Failed to get violations summary: {str(e)}")
         raise HTTPException(
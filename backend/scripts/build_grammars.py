@@ -0,0 +1,48 @@
+# scripts/build_grammars.py
+"""
+Build one Tree-sitter shared library per language into TREE_SITTER_GRAMMAR_DIR.
+
+Run once at image build time so workers only load prebuilt libraries on startup:
+
+    python scripts/build_grammars.py [--source-dir vendor] [--output build/grammars]
+
+Grammar sources are cloned at the tags pinned in worker/grammars.py unless a checkout
+already exists in --source-dir.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from tree_sitter import Language
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from worker.grammars import GRAMMAR_SOURCES, TREE_SITTER_GRAMMAR_DIR  # noqa: E402
+
+
+def build(source_dir: str, output_dir: str) -> None:
+    os.makedirs(output_dir, exist_ok=True)
+    for name, (url, tag, subdir) in GRAMMAR_SOURCES.items():
+        checkout = os.path.join(source_dir, url.rstrip("/").rsplit("/", 1)[-1])
+        if not os.path.exists(checkout):
+            subprocess.run(["git", "clone", "--quiet", "--depth", "1", "--branch", tag, url, checkout], check=True)
+        library = os.path.join(output_dir, f"{name}.so")
+        Language.build_library(library, [os.path.join(checkout, subdir)])
+        print(f"Built {name} grammar -> {library}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source-dir", help="Directory holding (or receiving) grammar checkouts")
+    parser.add_argument("--output", default=TREE_SITTER_GRAMMAR_DIR, help="Where to write the shared libraries")
+    args = parser.parse_args()
+
+    if args.source_dir:
+        build(args.source_dir, args.output)
+    else:
+        with tempfile.TemporaryDirectory() as source_dir:
+            build(source_dir, args.output)
+
+
+if __name__ == "__main__":
+    main()
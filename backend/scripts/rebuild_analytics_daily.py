@@ -0,0 +1,27 @@
+# scripts/rebuild_analytics_daily.py
+"""
+Rebuild the per-user daily analytics rollups from completed scans.
+
+    python scripts/rebuild_analytics_daily.py
+
+Scan completion keeps the rollups current; run this once after deploying them so the
+trend covers scans from before, or to repair them. The rollups are recomputed inside
+MongoDB and replace the existing documents.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db.crud_scan import ScanCRUD  # noqa: E402
+
+
+def main() -> None:
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    asyncio.run(ScanCRUD.rebuild_analytics_daily())
+    print("Rebuilt daily analytics rollups")
+
+
+if __name__ == "__main__":
+    main()
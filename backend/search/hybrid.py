@@ -0,0 +1,117 @@
+# search/hybrid.py
+"""
+Hybrid code search: BM25 keyword results fused with vector results.
+
+Rankings are combined with reciprocal rank fusion (RRF), which needs no score
+calibration between BM25 and cosine similarity: each result scores
+sum(1 / (RRF_K + rank)) over the rankings it appears in. Pages are addressed by an
+opaque cursor; each page re-runs both searches for the window up to its end, so paging
+needs no server-side state.
+"""
+import base64
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from search.keyword_index import get_keyword_index
+from search.vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+RRF_K = 60
+# Deepest result reachable by paging; bounds the window each page searches
+MAX_SEARCH_WINDOW = 1000
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Fuse named rankings of hits into one, best first. Each hit records which rankings found it."""
+    fused: Dict[str, Dict[str, Any]] = {}
+    for source, hits in rankings.items():
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.setdefault(hit["id"], {**hit, "score": 0.0, "matched_by": []})
+            entry["score"] += 1.0 / (RRF_K + rank)
+            entry["matched_by"].append(source)
+    return sorted(fused.values(), key=lambda hit: -hit["score"])
+
+
+class HybridSearch:
+    """
+    Keeps the vector store and keyword index fed from the same chunk records and
+    searches both. Either may be None, in which case the other is used alone.
+    """
+
+    def __init__(self, vector_store: Any, keyword_index: Any):
+        self.vector_store = vector_store
+        self.keyword_index = keyword_index
+
+    def _stores(self) -> List[Any]:
+        return [store for store in (self.vector_store, self.keyword_index) if store is not None]
+
+    def upsert_records(self, namespace: str, records: List[Dict[str, Any]]) -> None:
+        for store in self._stores():
+            store.upsert_records(namespace, records)
+
+    def delete(self, ids: List[str], namespace: str) -> None:
+        for store in self._stores():
+            store.delete(ids, namespace)
+
+    def search(
+        self,
+        repo_id: int,
+        query: str,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        language: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return one page of fused results and the cursor of the next page, if any."""
+        offset = decode_cursor(cursor)
+        # One extra result tells whether another page exists
+        window = min(offset + limit + 1, MAX_SEARCH_WINDOW)
+        rankings = {}
+        if self.keyword_index is not None:
+            rankings["keyword"] = self.keyword_index.search(repo_id, query, window, language, path_prefix)
+        if self.vector_store is not None:
+            try:
+                rankings["vector"] = self.vector_store.search(repo_id, query, window, language, path_prefix)
+            except ValueError:
+                raise
+            except Exception as e:
+                # Keyword results still answer the query if the hosted index is unreachable
+                if not rankings:
+                    raise
+                logger.warning(f"Vector search failed, returning keyword results only: {str(e)}")
+        fused = reciprocal_rank_fusion(rankings)
+        page = fused[offset:offset + limit]
+        has_more = len(fused) > offset + limit and offset + limit < MAX_SEARCH_WINDOW
+        return page, encode_cursor(offset + limit) if has_more else None
+
+
+_search_lock = threading.Lock()
+_search = None
+
+
+def get_search_index() -> HybridSearch:
+    """Return the hybrid search over the configured vector store and the keyword index."""
+    global _search
+    with _search_lock:
+        if _search is None or _search.vector_store is None:
+            _search = HybridSearch(get_vector_store(), get_keyword_index())
+    return _search
@@ -0,0 +1,211 @@
+# search/keyword_index.py
+"""
+Keyword index over the same code chunks as the vector store.
+
+The index job writes it in the worker and search reads it in the API, so by default
+it lives in MongoDB (MongoKeywordIndex), shared by every process and instance and
+ranked by MongoDB's text score. KEYWORD_INDEX_BACKEND=local selects a BM25 index in a
+local SQLite FTS5 file instead (KeywordIndex). That file is per instance and lost on
+restart, so use it only where indexing and search run in one long-lived process.
+
+Both index text as identifier-aware tokens (`execute_raw` is indexed as `execute_raw`,
+`execute` and `raw`), so exact identifiers rank first while their parts still match.
+In SQLite, repository, language and directory filters are indexed as tokens of their
+own and added to the MATCH expression. That lets FTS5 intersect their posting lists
+with the query's, instead of filtering after ranking.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReplaceOne
+
+from search.vector_store import RESULT_FIELDS, code_tokens, path_prefixes
+
+logger = logging.getLogger(__name__)
+
+# "mongo" for the shared index in MongoDB, "local" for a per-instance SQLite file
+KEYWORD_INDEX_BACKEND = os.getenv("KEYWORD_INDEX_BACKEND", "mongo")
+KEYWORD_INDEX_COLLECTION = "keyword_chunks"
+LOCAL_KEYWORD_INDEX_PATH = os.getenv("LOCAL_KEYWORD_INDEX_PATH", "/tmp/auditflow-keyword-index.db")
+# BM25 weights of the (tokens, filters) columns; filter tokens must not affect ranking
+BM25_WEIGHTS = (1.0, 0.0)
+
+
+def _rowid(record_id: str) -> int:
+    """Stable 63-bit rowid for a chunk id, so upserts and deletes are rowid lookups."""
+    return int.from_bytes(hashlib.sha1(record_id.encode()).digest()[:8], "big") >> 1
+
+
+def _filter_token(kind: str, value: Any) -> str:
+    return kind + hashlib.sha1(str(value).encode()).hexdigest()[:16]
+
+
+def _quote(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"'
+
+
+class KeywordIndex:
+    """Identifier-aware BM25 search over indexed chunks, with filters pushed into the index."""
+
+    def __init__(self, path: str = LOCAL_KEYWORD_INDEX_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+            "tokens, filters, id UNINDEXED, file_path UNINDEXED, language UNINDEXED, "
+            "chunk_type UNINDEXED, text UNINDEXED, tokenize=\"unicode61 tokenchars '_'\")"
+        )
+
+    def upsert_records(self, namespace: str, records: List[Dict[str, Any]]) -> None:
+        rows = []
+        for record in records:
+            file_path = record.get("file_path") or ""
+            filters = [_filter_token("r", record["repo_id"]), _filter_token("l", record.get("language") or "")]
+            filters.extend(_filter_token("d", prefix) for prefix in path_prefixes(file_path))
+            rows.append((
+                _rowid(record["_id"]),
+                " ".join(code_tokens(record["text"])),
+                " ".join(filters),
+                record["_id"],
+                file_path,
+                record.get("language"),
+                record.get("chunk_type"),
+                record["text"],
+            ))
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM chunks WHERE rowid = ?", [(row[0],) for row in rows])
+            self._conn.executemany(
+                "INSERT INTO chunks(rowid, tokens, filters, id, file_path, language, chunk_type, text) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def delete(self, ids: List[str], namespace: str) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM chunks WHERE rowid = ?", [(_rowid(i),) for i in ids])
+
+    def search(
+        self,
+        repo_id: int,
+        query: str,
+        top_k: int = 10,
+        language: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        terms = sorted(set(code_tokens(query)))
+        if not terms:
+            return []
+        match = [f"filters : {_quote(_filter_token('r', repo_id))}"]
+        if language:
+            match.append(f"filters : {_quote(_filter_token('l', language))}")
+        sql_filter = ""
+        params: List[Any] = []
+        if path_prefix:
+            # The longest whole directory in the prefix narrows the match via its filter
+            # token; the rest of a partial name is a range on the path within the query
+            partial = not path_prefix.endswith("/")
+            directory = os.path.dirname(path_prefix) if partial else path_prefix.rstrip("/")
+            if directory:
+                match.append(f"filters : {_quote(_filter_token('d', directory))}")
+            if partial:
+                sql_filter = " AND file_path >= ? AND file_path < ?"
+                params = [path_prefix, path_prefix + "\U0010ffff"]
+        match.append("tokens : (" + " OR ".join(_quote(t) for t in terms) + ")")
+        sql = (
+            "SELECT id, bm25(chunks, ?, ?) AS rank, file_path, language, chunk_type, text "
+            f"FROM chunks WHERE chunks MATCH ?{sql_filter} ORDER BY rank LIMIT ? OFFSET ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, [*BM25_WEIGHTS, " AND ".join(match), *params, top_k, offset]).fetchall()
+        return [
+            {"id": row[0], "score": -row[1], **dict(zip(RESULT_FIELDS, (row[5], row[2], row[3], row[4])))}
+            for row in rows
+        ]
+
+
+class MongoKeywordIndex:
+    """
+    Keyword search over indexed chunks in a MongoDB text index, shared by the index job
+    and the API. The text index is prefixed by repo_id, so a query only reads its
+    repository's entries. Calls block; callers run them on a worker thread.
+    """
+
+    def __init__(self, collection: Any):
+        self.collection = collection
+
+    def upsert_records(self, namespace: str, records: List[Dict[str, Any]]) -> None:
+        operations = []
+        for record in records:
+            file_path = record.get("file_path") or ""
+            operations.append(ReplaceOne({"_id": record["_id"]}, {
+                "repo_id": record["repo_id"],
+                "tokens": " ".join(code_tokens(record["text"])),
+                "language": record.get("language"),
+                "path_dirs": path_prefixes(file_path)[:-1],
+                "file_path": file_path,
+                "chunk_type": record.get("chunk_type"),
+                "text": record["text"],
+            }, upsert=True))
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+    def delete(self, ids: List[str], namespace: str) -> None:
+        if ids:
+            self.collection.delete_many({"_id": {"$in": ids}})
+
+    def search(
+        self,
+        repo_id: int,
+        query: str,
+        top_k: int = 10,
+        language: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        terms = sorted(set(code_tokens(query)))
+        if not terms:
+            return []
+        # Tokens are identifiers, so none carries $text's negation or phrase syntax
+        match: Dict[str, Any] = {"repo_id": repo_id, "$text": {"$search": " ".join(terms)}}
+        if language:
+            match["language"] = language
+        if path_prefix:
+            partial = not path_prefix.endswith("/")
+            directory = os.path.dirname(path_prefix) if partial else path_prefix.rstrip("/")
+            if directory:
+                match["path_dirs"] = directory
+            if partial:
+                match["file_path"] = {"$gte": path_prefix, "$lt": path_prefix + "\U0010ffff"}
+        score = {"score": {"$meta": "textScore"}}
+        cursor = self.collection.find(match, {**score, **{f: 1 for f in RESULT_FIELDS}})
+        docs = cursor.sort([("score", {"$meta": "textScore"})]).skip(offset).limit(top_k)
+        return [{"id": doc["_id"], "score": doc["score"], **{f: doc.get(f) for f in RESULT_FIELDS}} for doc in docs]
+
+
+_index_lock = threading.Lock()
+_index = None
+
+
+def get_keyword_index():
+    """Return the configured keyword index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            if KEYWORD_INDEX_BACKEND == "local":
+                logger.warning(
+                    f"Keyword index is a local file ({LOCAL_KEYWORD_INDEX_PATH}); search only sees "
+                    "chunks indexed by this instance since it started"
+                )
+                _index = KeywordIndex()
+            else:
+                from db.init import get_sync_db
+                _index = MongoKeywordIndex(get_sync_db().get_collection(KEYWORD_INDEX_COLLECTION))
+    return _index
@@ -0,0 +1,434 @@
+# search/vector_store.py
+"""
+Vector stores behind semantic code search.
+
+Both stores accept the same writes the indexing job sends to Pinecone
+(`upsert_records(namespace, records)` and `delete(ids, namespace)`) and answer
+`search(repo_id, query, top_k, language, path_prefix)` with the same hit format,
+so search and indexing don't care which one is configured:
+
+- PineconeVectorStore wraps the hosted index with integrated embedding.
+- LocalVectorStore keeps one directory per repository under LOCAL_VECTOR_STORE_DIR,
+  embeds text locally and searches memory-mapped arrays: exact brute force for small
+  segments, an int8-quantized inverted file (IVF) index with exact re-ranking for
+  segments of LOCAL_INDEX_IVF_THRESHOLD vectors or more. The directory belongs to one
+  instance, so the API only finds what the index job wrote there: use it when both
+  run in one process on persistent disk, e.g. local development.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# "pinecone" for the hosted index, "local" for the on-disk index below
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone")
+LOCAL_VECTOR_STORE_DIR = os.getenv("LOCAL_VECTOR_STORE_DIR", "/tmp/auditflow-vectors")
+LOCAL_EMBEDDING_DIM = 256
+# Segments at least this large get an IVF index; smaller ones are searched exhaustively
+LOCAL_INDEX_IVF_THRESHOLD = int(os.getenv("LOCAL_INDEX_IVF_THRESHOLD", "20000"))
+# Inverted lists probed per query
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "16"))
+# Writes go to small new segments; past this many they are merged
+LOCAL_INDEX_MAX_SEGMENTS = 8
+# Candidates scored on the quantized codes per result before exact re-ranking
+RERANK_FACTOR = 4
+KMEANS_ITERATIONS = 10
+
+RESULT_FIELDS = ("text", "file_path", "language", "chunk_type")
+
+
+# --- Local embedding ---
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def code_tokens(text: str) -> List[str]:
+    """Identifiers plus their snake_case and camelCase parts, lowercased."""
+    tokens = []
+    for word in _WORD.findall(text):
+        lower = word.lower()
+        tokens.append(lower)
+        parts = [p.lower() for piece in word.split("_") for p in _CAMEL.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def hashing_embed(texts: Iterable[str], dim: int = LOCAL_EMBEDDING_DIM) -> np.ndarray:
+    """
+    Embed texts by signed feature hashing of their code tokens with log term weights.
+    Needs no model or network; crc32 keeps vectors stable across processes.
+    """
+    texts = list(texts)
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        counts: Dict[str, int] = {}
+        for token in code_tokens(text):
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            h = zlib.crc32(token.encode())
+            vectors[row, h % dim] += (1.0 if h & 0x80000000 else -1.0) * (1.0 + np.log(count))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def path_prefixes(file_path: str) -> List[str]:
+    """Every ancestor directory of a path, then the path itself: "a/b.py" -> ["a", "a/b.py"]."""
+    parts = file_path.split("/")
+    return ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def _hit(record_id: str, score: float, fields: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": record_id, "score": float(score), **{f: fields.get(f) for f in RESULT_FIELDS}}
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+# --- Hosted store ---
+
+class PineconeVectorStore:
+    """
+    The hosted Pinecone index. Path prefixes must be directories ("src/auth/"): they are
+    filtered in the index through each record's `path_dirs` metadata, and Pinecone has no
+    operator for a partial file name.
+    """
+
+    def __init__(self, index: Any, namespace: str = "__default__"):
+        self.index = index
+        self.namespace = namespace
+
+    def upsert_records(self, namespace: str, records: List[Dict[str, Any]]) -> None:
+        self.index.upsert_records(namespace, records)
+
+    def delete(self, ids: List[str], namespace: str) -> None:
+        self.index.delete(ids=ids, namespace=namespace)
+
+    def search(
+        self,
+        repo_id: int,
+        query: str,
+        top_k: int = 10,
+        language: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        metadata_filter: Dict[str, Any] = {"repo_id": repo_id}
+        if language:
+            metadata_filter["language"] = language
+        if path_prefix:
+            if not path_prefix.endswith("/"):
+                raise ValueError("path_prefix must be a directory ending in '/'")
+            metadata_filter["path_dirs"] = {"$in": [path_prefix.rstrip("/")]}
+        results = self.index.search(
+            namespace=self.namespace,
+            query={
+                "inputs": {"text": query},
+                "top_k": top_k,
+                "filter": metadata_filter
+            },
+            fields=list(RESULT_FIELDS)
+        )
+        return [_hit(hit["_id"], hit["_score"], hit["fields"]) for hit in results["result"]["hits"]]
+
+
+# --- Local store ---
+
+class _Segment:
+    """One immutable batch of vectors on disk, memory-mapped when opened."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.ids: List[str] = meta["ids"]
+        self.fields: List[Dict[str, Any]] = meta["fields"]
+        self.languages = np.array([f.get("language") or "" for f in self.fields], dtype=object)
+        self.file_paths = np.array([f.get("file_path") or "" for f in self.fields], dtype=str)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.ivf = os.path.exists(os.path.join(path, "centroids.npy"))
+        if self.ivf:
+            self.centroids = np.load(os.path.join(path, "centroids.npy"))
+            self.list_offsets = np.load(os.path.join(path, "list_offsets.npy"))
+            self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+            self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        self.live = np.ones(len(self.ids), dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def write(path: str, ids: List[str], fields: List[Dict[str, Any]], vectors: np.ndarray) -> None:
+        """Write a segment, building an IVF index when it is large enough."""
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        if len(ids) >= LOCAL_INDEX_IVF_THRESHOLD:
+            centroids, assignment = _kmeans(vectors, max(16, int(np.sqrt(len(ids)))))
+            # Rows are stored grouped by inverted list so each list is one contiguous slice
+            order = np.argsort(assignment, kind="stable")
+            ids = [ids[i] for i in order]
+            fields = [fields[i] for i in order]
+            vectors = vectors[order]
+            counts = np.bincount(assignment, minlength=len(centroids))
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            codes = np.round(vectors / scales[:, None]).astype(np.int8)
+            np.save(os.path.join(tmp_path, "centroids.npy"), centroids)
+            np.save(os.path.join(tmp_path, "list_offsets.npy"), np.concatenate([[0], np.cumsum(counts)]))
+            np.save(os.path.join(tmp_path, "codes.npy"), codes)
+            np.save(os.path.join(tmp_path, "scales.npy"), scales.astype(np.float32))
+        np.save(os.path.join(tmp_path, "vectors.npy"), np.ascontiguousarray(vectors, dtype=np.float32))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"ids": ids, "fields": fields}, f)
+        os.replace(tmp_path, path)
+
+    def search(self, query: np.ndarray, top_k: int, mask: np.ndarray, nprobe: int) -> List[tuple]:
+        if self.ivf:
+            probes = _top_k(self.centroids @ query, nprobe)
+            rows = np.concatenate([
+                np.arange(self.list_offsets[p], self.list_offsets[p + 1]) for p in probes
+            ])
+            rows = rows[mask[rows]]
+            if len(rows) == 0:
+                return []
+            # Approximate scores on int8 codes, then exact scores for the best few
+            approx = (self.codes[rows].astype(np.float32) @ query) * self.scales[rows]
+            rows = rows[_top_k(approx, top_k * RERANK_FACTOR)]
+        else:
+            # One pass over the whole mapped matrix beats gathering the filtered rows first
+            live = np.count_nonzero(mask)
+            if live == 0:
+                return []
+            scores = np.asarray(self.vectors) @ query
+            scores[~mask] = -np.inf
+            best = _top_k(scores, min(top_k, live))
+            return [(float(scores[i]), self, int(i)) for i in best]
+        scores = np.asarray(self.vectors[rows]) @ query
+        best = _top_k(scores, top_k)
+        return [(float(scores[i]), self, int(rows[i])) for i in best]
+
+
+def _kmeans(vectors: np.ndarray, clusters: int, seed: int = 0) -> tuple:
+    """Spherical k-means on a sample; returns (centroids, assignment of every vector)."""
+    rng = np.random.default_rng(seed)
+    clusters = min(clusters, len(vectors))
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), clusters * 64), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=clusters, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = np.bincount(assignment, minlength=clusters) == 0
+        sums[empty] = centroids[empty]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    assignment = np.concatenate([
+        np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), 65536)
+    ])
+    return centroids.astype(np.float32), assignment
+
+
+class _RepoIndex:
+    """All segments of one repository plus the ids deleted since each was written."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        manifest_path = os.path.join(root, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        else:
+            manifest = {"next_segment": 0, "segments": [], "deleted": {}}
+        self.next_segment: int = manifest["next_segment"]
+        self.segment_names: List[str] = manifest["segments"]
+        # id -> number of the last segment written before it was deleted
+        self.deleted: Dict[str, int] = manifest["deleted"]
+        self.segments = [_Segment(os.path.join(root, name)) for name in self.segment_names]
+        self._refresh_live()
+
+    def _refresh_live(self) -> None:
+        """A row is live if it is the newest copy of its id and the id was not deleted after it."""
+        newest: Dict[str, tuple] = {}
+        live = [np.zeros(len(segment), dtype=bool) for segment in self.segments]
+        for number, segment in enumerate(self.segments):
+            for row, record_id in enumerate(segment.ids):
+                newest[record_id] = (number, row)
+        for record_id, (number, row) in newest.items():
+            if self._segment_number(number) > self.deleted.get(record_id, -1):
+                live[number][row] = True
+        # Swapped in whole so concurrent searches see either the old or the new masks
+        for segment, mask in zip(self.segments, live):
+            segment.live = mask
+
+    def _segment_number(self, position: int) -> int:
+        return int(self.segment_names[position].split("-")[1])
+
+    def _save_manifest(self) -> None:
+        tmp_path = os.path.join(self.root, "manifest.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "next_segment": self.next_segment,
+                "segments": self.segment_names,
+                "deleted": self.deleted,
+            }, f)
+        os.replace(tmp_path, os.path.join(self.root, "manifest.json"))
+
+    def add(self, ids: List[str], fields: List[Dict[str, Any]], vectors: np.ndarray) -> None:
+        name = f"seg-{self.next_segment:06d}"
+        self.next_segment += 1
+        _Segment.write(os.path.join(self.root, name), ids, fields, vectors)
+        self.segment_names.append(name)
+        self.segments.append(_Segment(os.path.join(self.root, name)))
+        if len(self.segments) > LOCAL_INDEX_MAX_SEGMENTS:
+            # Size-tiered: fold the small recent segments together, and into the large
+            # base segment only once they have grown as big as it
+            base, recent = len(self.segments[0]), sum(len(s) for s in self.segments[1:])
+            self.compact(full=recent >= base)
+        else:
+            self._save_manifest()
+            self._refresh_live()
+
+    def delete(self, ids: Iterable[str]) -> None:
+        for record_id in ids:
+            self.deleted[record_id] = self.next_segment - 1
+        self._save_manifest()
+        self._refresh_live()
+
+    def compact(self, full: bool = True) -> None:
+        """
+        Merge live rows into one segment, which gets an IVF index if large. A full compaction
+        merges every segment; otherwise the first (base) segment is kept as is.
+        """
+        keep = 0 if full else 1
+        ids, fields, vectors = [], [], []
+        for segment in self.segments[keep:]:
+            rows = np.flatnonzero(segment.live)
+            ids.extend(segment.ids[i] for i in rows)
+            fields.extend(segment.fields[i] for i in rows)
+            vectors.append(np.asarray(segment.vectors[rows]))
+        old_names = self.segment_names[keep:]
+        name = f"seg-{self.next_segment:06d}"
+        self.next_segment += 1
+        merged = np.concatenate(vectors) if vectors else np.zeros((0, LOCAL_EMBEDDING_DIM), dtype=np.float32)
+        _Segment.write(os.path.join(self.root, name), ids, fields, merged)
+        self.segment_names = self.segment_names[:keep] + [name]
+        self.segments = self.segments[:keep] + [_Segment(os.path.join(self.root, name))]
+        if full:
+            # Nothing older than the merged segment remains for deletions to hide
+            self.deleted = {}
+        self._save_manifest()
+        self._refresh_live()
+        for old in old_names:
+            shutil.rmtree(os.path.join(self.root, old), ignore_errors=True)
+
+    def search(self, query: np.ndarray, top_k: int, language: Optional[str], path_prefix: Optional[str], nprobe: int):
+        candidates = []
+        for segment in self.segments:
+            if not len(segment):
+                continue
+            mask = segment.live.copy()
+            if language:
+                mask &= segment.languages == language
+            if path_prefix:
+                mask &= np.char.startswith(segment.file_paths, path_prefix)
+            candidates.extend(segment.search(query, top_k, mask, nprobe))
+        candidates.sort(key=lambda c: -c[0])
+        return [_hit(segment.ids[row], score, segment.fields[row]) for score, segment, row in candidates[:top_k]]
+
+
+class LocalVectorStore:
+    """
+    On-disk vector index with one directory per repository. Records are routed to their
+    repository by `repo_id`; deletes by the "<repo_id>:" prefix of chunk ids.
+    """
+
+    def __init__(
+        self,
+        root: str = LOCAL_VECTOR_STORE_DIR,
+        embed: Callable[[List[str]], np.ndarray] = hashing_embed,
+        nprobe: int = LOCAL_INDEX_NPROBE,
+    ):
+        self.root = root
+        self.embed = embed
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._repos: Dict[int, _RepoIndex] = {}
+
+    def _repo(self, repo_id: int) -> _RepoIndex:
+        if repo_id not in self._repos:
+            self._repos[repo_id] = _RepoIndex(os.path.join(self.root, str(repo_id)))
+        return self._repos[repo_id]
+
+    def upsert_records(self, namespace: str, records: List[Dict[str, Any]]) -> None:
+        by_repo: Dict[int, List[Dict[str, Any]]] = {}
+        for record in records:
+            by_repo.setdefault(int(record["repo_id"]), []).append(record)
+        for repo_id, repo_records in by_repo.items():
+            vectors = self.embed([r["text"] for r in repo_records])
+            ids = [r["_id"] for r in repo_records]
+            fields = [{k: v for k, v in r.items() if k != "_id"} for r in repo_records]
+            with self._lock:
+                self._repo(repo_id).add(ids, fields, vectors)
+
+    def delete(self, ids: List[str], namespace: str) -> None:
+        by_repo: Dict[int, List[str]] = {}
+        for record_id in ids:
+            by_repo.setdefault(int(record_id.split(":", 1)[0]), []).append(record_id)
+        with self._lock:
+            for repo_id, repo_ids in by_repo.items():
+                self._repo(repo_id).delete(repo_ids)
+
+    def compact(self, repo_id: int) -> None:
+        with self._lock:
+            self._repo(repo_id).compact()
+
+    def search(
+        self,
+        repo_id: int,
+        query: str,
+        top_k: int = 10,
+        language: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        query_vector = self.embed([query])[0]
+        with self._lock:
+            repo = self._repo(repo_id)
+        return repo.search(query_vector, top_k, language, path_prefix, self.nprobe)
+
+
+_store_lock = threading.Lock()
+_store = None
+
+
+def get_vector_store():
+    """Return the configured vector store, or None if the hosted index is unavailable."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if VECTOR_STORE_BACKEND == "local":
+                logger.warning(
+                    f"Vector store is a local directory ({LOCAL_VECTOR_STORE_DIR}); search only sees "
+                    "chunks indexed by this instance since it started"
+                )
+                _store = LocalVectorStore()
+            else:
+                from utils.clients import get_pinecone_index
+                index = get_pinecone_index()
+                if index is None:
+                    return None
+                _store = PineconeVectorStore(index)
+    return _store
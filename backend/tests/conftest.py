@@ -0,0 +1,185 @@
+"""
+An in-memory stand-in for the Motor database the CRUD layers and workers write to, and
+a scratch database on a real mongod for tests that need aggregation pipelines to run.
+"""
+import os
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+MONGODB_TEST_URI = os.getenv("MONGODB_TEST_URI", "mongodb://localhost:27017")
+
+
+def matches(doc, query):
+    """Equality plus the handful of operators the queries under test use."""
+    for key, condition in query.items():
+        value = doc.get(key)
+        if isinstance(condition, dict) and all(k.startswith("$") for k in condition):
+            for op, arg in condition.items():
+                if op == "$in" and value not in arg:
+                    return False
+                if op in ("$gt", "$gte", "$lt") and value is None:
+                    return False
+                if (op == "$gt" and not value > arg) or (op == "$gte" and not value >= arg) \
+                        or (op == "$lt" and not value < arg):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def project(doc, projection):
+    if not projection:
+        return doc
+    if not any(v for k, v in projection.items() if k != "_id"):
+        return {k: v for k, v in doc.items() if projection.get(k, 1)}
+    return {k: v for k, v in doc.items() if projection.get(k, 1 if k == "_id" else 0)}
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def sort(self, key, direction):
+        self.docs.sort(key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs if length is None else self.docs[:length]
+
+    def __aiter__(self):
+        async def gen():
+            for doc in self.docs:
+                yield doc
+        return gen()
+
+
+class FakeCollection:
+    """
+    Documents keyed by _id. Queries, pipelines and updates are recorded for assertions;
+    aggregations answer with `aggregate_results`, a list or a function of the pipeline.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.docs = {}
+        self.aggregate_results = []
+        self.finds = []
+        self.pipelines = []
+        self.inserts = []
+        self.updates = []
+        self.bulk_writes = 0
+
+    def _match(self, query):
+        return [doc for doc in self.docs.values() if matches(doc, query)]
+
+    def _update(self, query, update, upsert):
+        existing = self._match(query)
+        if existing:
+            doc = existing[0]
+        elif upsert:
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            doc.update(update.get("$setOnInsert", {}))
+        else:
+            return None
+        before = dict(doc)
+        doc.update(update.get("$set", {}))
+        doc.setdefault("_id", ObjectId())
+        self.docs[doc["_id"]] = doc
+        return before if existing else None
+
+    def find(self, query=None, projection=None):
+        self.finds.append(query)
+        return FakeCursor(project(doc, projection) for doc in self._match(query or {}))
+
+    async def find_one(self, query, projection=None, sort=None):
+        cursor = FakeCursor(self._match(query))
+        for key, direction in reversed(sort or []):
+            cursor.sort(key, direction)
+        return project(cursor.docs[0], projection) if cursor.docs else None
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        results = self.aggregate_results
+        return FakeCursor(results(pipeline) if callable(results) else results)
+
+    async def insert_many(self, documents, ordered=True):
+        self.inserts.append((len(documents), ordered))
+        for doc in documents:
+            doc.setdefault("_id", ObjectId())
+            self.docs[doc["_id"]] = doc
+        return SimpleNamespace(inserted_ids=[doc["_id"] for doc in documents])
+
+    async def update_one(self, query, update, upsert=False):
+        self.updates.append(update)
+        self._update(query, update, upsert)
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, **kwargs):
+        self.updates.append(update)
+        before = self._update(query, update, upsert)
+        return project(before, projection) if before else None
+
+    async def delete_one(self, query):
+        for doc in self._match(query)[:1]:
+            del self.docs[doc["_id"]]
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_writes += 1
+        upserted = 0
+        for op in operations:
+            if type(op).__name__ == "DeleteOne":
+                await self.delete_one(op._filter)
+                continue
+            if type(op).__name__ == "ReplaceOne":
+                for doc in self._match(op._filter):
+                    del self.docs[doc["_id"]]
+                update = {"$set": op._doc}
+            else:
+                update = op._doc
+            existed = bool(self._match(op._filter))
+            self._update(op._filter, update, op._upsert)
+            upserted += not existed
+        return SimpleNamespace(upserted_count=upserted, modified_count=len(operations) - upserted)
+
+
+class FakeDB:
+    def __init__(self):
+        self.collections = {}
+
+    def get_collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name)
+        return self.collections[name]
+
+
+@pytest.fixture
+def fake_db():
+    return FakeDB()
+
+
+@pytest.fixture
+def mongo_db():
+    """
+    Return a function that opens a scratch Motor database; call it inside the test's event
+    loop. The database is dropped afterwards. Skipped when no mongod is reachable.
+    """
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    admin = MongoClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=500)
+    try:
+        admin.admin.command("ping")
+    except PyMongoError:
+        admin.close()
+        pytest.skip(f"No MongoDB reachable at {MONGODB_TEST_URI}")
+    name = f"test_{uuid.uuid4().hex[:12]}"
+    yield lambda: AsyncIOMotorClient(MONGODB_TEST_URI)[name]
+    admin.drop_database(name)
+    admin.close()
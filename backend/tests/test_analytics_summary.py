@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from db import crud_scan
+from db.crud_scan import ScanCRUD
+
+
+def test_analytics_are_aggregated_in_mongo_and_trend_read_from_rollups(monkeypatch, fake_db):
+    def latest_scans_or_scores(pipeline):
+        if "_id" in pipeline[0]["$match"]:
+            return [{"_id": None, "average_score": 82.46, "total_violations": 7}]
+        return [{"_id": 1, "scan_id": "a"}, {"_id": 2, "scan_id": "b"}]
+
+    yesterday = (datetime.utcnow() - timedelta(days=1)).strftime("%Y-%m-%d")
+    fake_db.get_collection("scans").aggregate_results = latest_scans_or_scores
+    fake_db.get_collection(crud_scan.VIOLATIONS_COLLECTION).aggregate_results = [
+        {"_id": "sql_injection", "count": 4}, {"_id": "unknown", "count": 1}, {"_id": "Sql Injection", "count": 2}]
+    daily = fake_db.get_collection(crud_scan.ANALYTICS_DAILY_COLLECTION)
+    daily.docs = {
+        1: {"_id": 1, "user_id": "u1", "date": yesterday, "score_sum": 170, "scan_count": 2},
+        2: {"_id": 2, "user_id": "u2", "date": yesterday, "score_sum": 10, "scan_count": 1},
+        3: {"_id": 3, "user_id": "u1", "date": "2000-01-01", "score_sum": 10, "scan_count": 1},
+    }
+    monkeypatch.setattr(crud_scan, "db", fake_db)
+    summary = asyncio.run(ScanCRUD.get_analytics_summary("u1"))
+    assert summary == {
+        "average_compliance_score": 82.5,
+        "active_violations": 7,
+        "compliance_trend": [{"date": yesterday, "score": 85.0}],
+        "top_violation_categories": [{"category": "Sql Injection", "count": 6}, {"category": "Unknown", "count": 1}],
+    }
+    assert fake_db.get_collection("scans").pipelines[-1][0]["$match"] == {"_id": {"$in": ["a", "b"]}}
+    # Categories are counted from the violations of those scans, not from the scan documents
+    violations = fake_db.get_collection(crud_scan.VIOLATIONS_COLLECTION)
+    assert violations.pipelines[0][0]["$match"] == {"scan_id": {"$in": ["a", "b"]}}
+    # The trend is read from the user's recent daily rollups only
+    assert len(daily.finds) == 1
+
+
+def test_analytics_pipelines_run_on_mongod(monkeypatch, mongo_db):
+    from bson import ObjectId
+
+    now = datetime.utcnow()
+    days = [(now - timedelta(days=n)).strftime("%Y-%m-%d") for n in (3, 1)]
+    older, latest, other = ObjectId(), ObjectId(), ObjectId()
+
+    async def run():
+        database = mongo_db()
+        monkeypatch.setattr(crud_scan, "db", database)
+
+        def scan(_id, repo_id, days_ago, score, violations, user_id="u1"):
+            return {"_id": _id, "repo_id": repo_id, "user_id": user_id, "status": "completed",
+                    "updated_at": now - timedelta(days=days_ago),
+                    "results": {"scores": {"overall_score": score, "total_violations": violations}}}
+
+        await database.scans.insert_many([
+            scan(older, 1, 3, 50, 9), scan(latest, 1, 1, 90, 3), scan(other, 2, 1, 70, 2),
+            scan(ObjectId(), 3, 1, 10, 40, user_id="u2"),
+        ])
+        await database[crud_scan.VIOLATIONS_COLLECTION].insert_many([
+            {"scan_id": str(latest), "category": "sql_injection"},
+            {"scan_id": str(latest), "category": "sql_injection"},
+            {"scan_id": str(other), "category": "Sql Injection"},
+            {"scan_id": str(other)},
+            {"scan_id": str(older), "category": "hardcoded_secret"},
+        ])
+        await ScanCRUD.rebuild_analytics_daily()
+        rebuilt = await ScanCRUD.get_analytics_summary("u1")
+        await ScanCRUD.record_analytics_daily("u1", 100, now - timedelta(days=1))
+        recorded = await ScanCRUD.get_analytics_summary("u1")
+        database.client.close()
+        return rebuilt, recorded
+
+    rebuilt, recorded = asyncio.run(run())
+    # Only each repo's latest completed scan counts
+    assert (rebuilt["average_compliance_score"], rebuilt["active_violations"]) == (80.0, 5)
+    assert rebuilt["top_violation_categories"] == [
+        {"category": "Sql Injection", "count": 3}, {"category": "Unknown", "count": 1}]
+    # The trend covers every completed scan, one point per day
+    assert rebuilt["compliance_trend"] == [{"date": days[0], "score": 50.0}, {"date": days[1], "score": 80.0}]
+    assert recorded["compliance_trend"][-1] == {"date": days[1], "score": 86.7}
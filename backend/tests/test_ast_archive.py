@@ -0,0 +1,65 @@
+import os
+
+from worker.ast_archive import ASTArchive, LocalArchiveBackend, pack_name, prune_archives, write_scan_archive
+
+
+def fake_ast(path, content):
+    return {"type": "ast", "language": "python", "tree": f"(module {content})", "file_path": path}
+
+
+def test_unchanged_files_reuse_previous_pack(tmp_path):
+    backend = LocalArchiveBackend(str(tmp_path))
+    first = write_scan_archive(
+        backend, 7, "scan-1",
+        {"a.py": "a = 1", "b.py": "b = 2", "copy_of_a.py": "a = 1"},
+        {"a.py": "h-a", "b.py": "h-b", "copy_of_a.py": "h-a"},
+        fake_ast,
+    )
+    # Identical content in two files is stored once
+    assert first["ast_entries_written"] == 2
+
+    # Second scan: b.py changed, a.py unchanged and not even read
+    second = write_scan_archive(
+        backend, 7, "scan-2",
+        {"b.py": "b = 3"},
+        {"a.py": "h-a", "b.py": "h-b2"},
+        fake_ast,
+    )
+    assert (second["ast_entries_written"], second["ast_entries_reused"]) == (1, 1)
+    assert second["ast_archive_bytes"] < first["ast_archive_bytes"]
+
+    latest = ASTArchive.open_latest(backend, 7)
+    assert latest.name == pack_name(7, "scan-2")
+    assert latest.get("a.py") == fake_ast("a.py", "a = 1")
+    assert latest.get("b.py")["tree"] == "(module b = 3)"
+    assert latest.get("copy_of_a.py") is None
+    # The unchanged file's AST is read from the first scan's pack
+    assert latest.entries["h-a"][0] == pack_name(7, "scan-1")
+
+
+def test_single_entry_is_a_range_read(tmp_path):
+    backend = LocalArchiveBackend(str(tmp_path))
+    reads = []
+    read_range = backend.read_range
+    backend.read_range = lambda name, start, length: reads.append(length) or read_range(name, start, length)
+
+    write_scan_archive(backend, 1, "s", {"a.py": "x" * 5000}, {"a.py": "h"}, fake_ast)
+    archive = ASTArchive.open(backend, pack_name(1, "s"))
+    reads.clear()
+    assert archive.get("a.py")["file_path"] == "a.py"
+    assert reads == [archive.entries["h"][2]]
+
+
+def test_pruning_keeps_packs_that_newer_packs_point_into(tmp_path):
+    backend = LocalArchiveBackend(str(tmp_path))
+    # a.py never changes, so every later pack points at its entry in the first pack
+    for i in range(5):
+        write_scan_archive(backend, 3, f"scan-{i}", {"a.py": "a = 1", "b.py": f"b = {i}"},
+                           {"a.py": "h-a", "b.py": f"h-b{i}"}, fake_ast)
+        os.utime(backend._path(pack_name(3, f"scan-{i}")), (i, i))
+
+    assert prune_archives(backend, 3, keep=2) == 2
+    remaining = {name for name, _ in backend.list("asts/3/packs/")}
+    assert remaining == {pack_name(3, "scan-0"), pack_name(3, "scan-3"), pack_name(3, "scan-4")}
+    latest = ASTArchive.open_latest(backend, 3)
+    assert latest.get("a.py") == fake_ast("a.py", "a = 1")
@@ -0,0 +1,57 @@
+import pytest
+
+from worker.ast_codec import CompactAST, encode_tree
+from worker.batching import _definition_start_lines
+from worker.grammars import grammars
+
+SOURCE = b"""import os
+
+@cached
+def load(path):
+    return open(path).read()
+
+class Store:
+    def get(self, key):
+        return key
+"""
+
+
+@pytest.fixture
+def python():
+    language = grammars.language("python")
+    if language is None:
+        pytest.skip("python grammar not built")
+    return language
+
+
+def named_preorder(node):
+    if node.is_named:
+        yield node
+    for child in node.children:
+        yield from named_preorder(child)
+
+
+def test_encoding_matches_tree_and_round_trips(python, tmp_path):
+    tree = grammars.parse(python, SOURCE)
+    ast = encode_tree(tree, "python")
+    nodes = list(named_preorder(tree.root_node))
+    assert [ast.type_name(i) for i in range(len(ast))] == [n.type for n in nodes]
+    assert ast.start_byte.tolist() == [n.start_byte for n in nodes]
+
+    path = tmp_path / "a.ast"
+    path.write_bytes(ast.to_bytes())
+    loaded = CompactAST.load(str(path))
+    for name, column in ast.columns.items():
+        assert loaded.columns[name].tolist() == column.tolist()
+
+    [function] = loaded.find(["function_definition"])[:1]
+    assert loaded.text(function, SOURCE).startswith("def load")
+    assert loaded.field_name(function) == "definition"
+    assert loaded.type_name(loaded.enclosing(function, ["decorated_definition"])) == "decorated_definition"
+    assert [loaded.type_name(c) for c in loaded.children(0)] == ["import_statement", "decorated_definition", "class_definition"]
+
+
+def test_definition_lines_from_compact_ast(python):
+    ast = encode_tree(grammars.parse(python, SOURCE), "python")
+    # The decorator line starts the decorated function; the method is a boundary too
+    assert _definition_start_lines(ast) == {0, 2, 6, 7}
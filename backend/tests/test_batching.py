@@ -0,0 +1,40 @@
+from worker.batching import BatchItem, build_batches, pack_batches, resplit_batch, split_file
+
+
+def make_item(key: str, tokens: int) -> BatchItem:
+    return BatchItem(key, key, "", 0, tokens)
+
+
+def test_pack_batches_first_fit_decreasing():
+    items = [make_item(name, tokens) for name, tokens in [("a", 60), ("b", 50), ("c", 40), ("d", 30), ("e", 20)]]
+    batches = pack_batches(items, token_budget=100)
+    assert [[i.key for i in batch] for batch in batches] == [["a", "c"], ["b", "d", "e"]]
+
+
+def test_oversized_file_is_split_not_skipped():
+    content = "\n".join(f"value_{i} = compute({i})" for i in range(2000))
+    batches = build_batches([("big.py", content), ("small.py", "x = 1\n" * 5)], lambda path: None, token_budget=2000)
+    items = [item for batch in batches for item in batch]
+    fragments = sorted((i for i in items if i.path == "big.py"), key=lambda i: i.line_offset)
+
+    assert len(fragments) > 1
+    assert all(batch_tokens <= 2000 for batch_tokens in (sum(i.tokens for i in b) for b in batches))
+    assert "\n".join(f.content for f in fragments) == content
+    assert fragments[1].key == f"big.py#L{fragments[1].line_offset + 1}-{fragments[1].line_offset + fragments[1].content.count(chr(10)) + 1}"
+
+
+def test_resplit_single_fragment_keeps_original_line_numbers():
+    content = "\n".join(f"line_{i} = {i}" for i in range(100))
+    [fragment] = split_file("mod.py", content, max_tokens=10_000)
+    shifted = fragment._replace(line_offset=500)
+
+    halves = resplit_batch([shifted], lambda path: None)
+
+    assert halves is not None and len(halves) >= 2
+    assert halves[0][0].line_offset == 500
+    assert halves[1][0].line_offset > 500
+
+
+def test_resplit_returns_none_when_unsplittable():
+    [fragment] = split_file("one.py", "x = 1", max_tokens=10_000)
+    assert resplit_batch([fragment], lambda path: None) is None
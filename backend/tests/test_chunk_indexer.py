@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import os
+from worker.chunk_indexer import PINECONE_UPSERT_BATCH_SIZE, ChunkIndexer
+
+
+class FakeIndex:
+    def __init__(self, fail_paths=()):
+        self.records = {}
+        self.batch_sizes = []
+        self.fail_paths = set(fail_paths)
+
+    def upsert_records(self, namespace, records):
+        if any(r["file_path"] in self.fail_paths for r in records):
+            raise RuntimeError("rejected")
+        self.batch_sizes.append(len(records))
+        self.records.update((r["_id"], r) for r in records)
+
+    def delete(self, ids, namespace):
+        for chunk_id in ids:
+            self.records.pop(chunk_id, None)
+
+
+def chunk_lines(path, content):
+    return [(line, {"language": "python"}) for line in content.split("\n")]
+
+
+def test_batches_skips_unchanged_and_removes_stale(fake_db):
+    index, indexed, fallback = FakeIndex(), fake_db.get_collection("indexed"), fake_db.get_collection("fallback")
+    indexer = ChunkIndexer(index, indexed, fallback, concurrency=2)
+    big = "\n".join(f"x{i} = {i}" for i in range(150))
+    first = asyncio.run(indexer.index_repo(
+        1, {"big.py": "h1", "gone.py": "h2"}, {"big.py": big, "gone.py": "y = 1"}, chunk_lines
+    ))
+    assert first["index_chunks_upserted"] == 151
+    assert max(index.batch_sizes) == PINECONE_UPSERT_BATCH_SIZE
+    assert first["index_bytes_sent"] > len(big)
+
+    # gone.py deleted, big.py unchanged and not read, new.py added
+    second = asyncio.run(indexer.index_repo(1, {"big.py": "h1", "new.py": "h3"}, {"new.py": "z = 1"}, chunk_lines))
+    assert (second["index_files_skipped"], second["index_chunks_upserted"]) == (1, 1)
+    assert second["index_stale_vectors_deleted"] == 1
+    assert {r["file_path"] for r in index.records.values()} == {"big.py", "new.py"}
+
+
+def test_failed_batch_goes_to_fallback_and_is_retried(fake_db):
+    index = FakeIndex(fail_paths={"a.py"})
+    indexed, fallback = fake_db.get_collection("indexed"), fake_db.get_collection("fallback")
+    indexer = ChunkIndexer(index, indexed, fallback)
+    metrics = asyncio.run(indexer.index_repo(1, {"a.py": "h"}, {"a.py": "a = 1"}, chunk_lines))
+    assert metrics["index_fallback_chunks"] == 1
+    assert len(fallback.docs) == 1
+    # Not recorded as indexed, so the next scan tries Pinecone again
+    assert indexed.docs == {}
+
+
+def test_index_job_runs_in_process_without_a_queue(tmp_path, monkeypatch):
+    from worker.index_jobs import CheckoutContents, enqueue_index_job
+    monkeypatch.delenv("CLOUD_RUN_INDEX_URL", raising=False)
+    monkeypatch.delenv("CLOUD_RUN_WORKER_URL", raising=False)
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text("a = 1")
+    contents = CheckoutContents(str(tmp_path))
+    assert contents.get("pkg/a.py") == "a = 1"
+    assert contents.get("missing.py") is None
+
+    ran = []
+
+    async def job(repo_id, scan_id):
+        ran.append((repo_id, scan_id))
+
+    async def scenario():
+        mode = enqueue_index_job({"repo_id": 1, "scan_id": "s"}, job)
+        await asyncio.sleep(0)
+        return mode
+
+    assert asyncio.run(scenario()) == "inline"
+    assert ran == [(1, "s")]
+
+
+def test_index_job_takes_the_tree_from_the_checkout(monkeypatch, fake_db):
+    import shutil
+
+    from db import crud_scan
+    from worker import chunk_indexer, routes
+
+    monkeypatch.setattr(chunk_indexer, "db", fake_db)
+    monkeypatch.setattr(crud_scan, "db", fake_db)
+    index = FakeIndex()
+    monkeypatch.setattr(routes, "get_search_index", lambda: index)
+
+    async def clone_url(repo_id, user_id):
+        return "https://gitlab.test/demo.git"
+
+    def checkout(repo_id, url, path):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "a.py"), "w") as f:
+            f.write("a = 2\n")
+
+    monkeypatch.setattr(routes, "get_gitlab_repo_clone_url", clone_url)
+    monkeypatch.setattr(routes, "checkout_repo", checkout)
+    monkeypatch.setattr(routes, "cleanup_checkout", lambda repo_id, path: shutil.rmtree(path))
+    # Indexed by an earlier job; gone.py has since been deleted from the repository
+    indexed = fake_db.get_collection(chunk_indexer.INDEXED_FILES_COLLECTION)
+    indexed.docs = {
+        "1:a.py": {"_id": "1:a.py", "repo_id": 1, "file_path": "a.py", "file_hash": "old", "chunk_ids": ["a0"]},
+        "1:gone.py": {"_id": "1:gone.py", "repo_id": 1, "file_path": "gone.py", "file_hash": "g", "chunk_ids": ["g0"]},
+    }
+    index.records = {"a0": {"file_path": "a.py"}, "g0": {"file_path": "gone.py"}}
+
+    metrics = asyncio.run(routes.run_index_job(1, "u1", "5f0000000000000000000000"))
+    assert metrics["index_stale_vectors_deleted"] == 2
+    assert {r["file_path"] for r in index.records.values()} == {"a.py"}
+    assert [doc["file_path"] for doc in indexed.docs.values()] == ["a.py"]
+    assert next(iter(indexed.docs.values()))["file_hash"] == hashlib.sha256(b"a = 2\n").hexdigest()
@@ -0,0 +1,27 @@
+import asyncio
+
+from worker import discovery
+from worker.discovery import DiscoveryStats, discover_files
+
+
+def test_slow_consumer_stops_the_readers(tmp_path, monkeypatch):
+    for i in range(60):
+        (tmp_path / f"f{i}.py").write_text(f"print('file number {i} with enough content')\n")
+    reads = []
+    read_and_classify = discovery.read_and_classify
+    monkeypatch.setattr(discovery, "read_and_classify", lambda root, rel: reads.append(rel) or read_and_classify(root, rel))
+
+    async def run():
+        stats = DiscoveryStats()
+        files = discover_files(str(tmp_path), lambda p: True, stats, max_workers=4, queue_size=3)
+        consumed = [await files.__anext__() for _ in range(2)]
+        # Give the readers every chance to run ahead of the stalled consumer
+        await asyncio.sleep(0.2)
+        read_while_stalled = len(reads)
+        consumed += [record async for record in files]
+        return consumed, read_while_stalled, stats
+
+    consumed, read_while_stalled, stats = asyncio.run(run())
+    # Two consumed, three queued and three read but waiting for room in the queue
+    assert read_while_stalled <= 2 + 3 + 3
+    assert len(consumed) == 60 and stats.discovered_files_count == 60
@@ -0,0 +1,19 @@
+import asyncio
+
+from db import crud_file_metadata
+from db.crud_file_metadata import FILE_ANALYSIS_VERSION, FileMetadataCRUD
+
+
+def test_hashes_are_kept_per_user(monkeypatch, fake_db):
+    monkeypatch.setattr(crud_file_metadata, "db", fake_db)
+
+    async def run():
+        await FileMetadataCRUD.bulk_upsert_hashes(1, "alice", {"a.py": "h1"})
+        await FileMetadataCRUD.bulk_upsert_hashes(1, "bob", {"a.py": "h2"})
+        return await FileMetadataCRUD.get_hash_map(1, "alice"), await FileMetadataCRUD.get_hash_map(1, "carol")
+
+    alice, carol = asyncio.run(run())
+    # Bob's scan of the same repository doesn't make Alice's files look analyzed
+    assert alice == {"a.py": "h1"} and carol == {}
+    docs = fake_db.get_collection("file_metadata").docs.values()
+    assert len(docs) == 2 and all(d["analysis_version"] == FILE_ANALYSIS_VERSION for d in docs)
@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+import httpx
+
+from utils import gitlab_client
+from utils.gitlab_client import GitLabClient
+
+
+def make_client(handler, **kwargs):
+    return GitLabClient(base_url="https://gitlab.test", transport=httpx.MockTransport(handler), **kwargs)
+
+
+def test_retries_server_errors_and_sends_token(monkeypatch):
+    monkeypatch.setattr(gitlab_client, "RETRY_BASE_DELAY_SECONDS", 0)
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers["Authorization"])
+        if len(seen) < 3:
+            return httpx.Response(502)
+        return httpx.Response(200, json={"id": 7, "name": "demo"})
+
+    async def run():
+        client = make_client(handler)
+        response = await client.get_project(7, "secret")
+        await client.aclose()
+        return client, response
+
+    client, response = asyncio.run(run())
+    assert response.status_code == 200 and response.json()["name"] == "demo"
+    assert seen == ["Bearer secret"] * 3 and client.retries == 2
+
+    # Client errors are returned as-is, and retries stop at max_retries
+    async def run_failing(status):
+        client = make_client(lambda request: httpx.Response(status), max_retries=1)
+        response = await client.get("/api/v4/user", "secret")
+        await client.aclose()
+        return response.status_code, client.retries
+
+    assert asyncio.run(run_failing(404)) == (404, 0)
+    assert asyncio.run(run_failing(503)) == (503, 1)
+
+
+def test_requests_can_opt_out_of_retries(monkeypatch):
+    # The OAuth code exchange uses this: the code is single-use, so a resend can only fail
+    monkeypatch.setattr(gitlab_client, "RETRY_BASE_DELAY_SECONDS", 0)
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            raise httpx.ConnectError("reset", request=request)
+        return httpx.Response(502)
+
+    async def run():
+        client = make_client(handler)
+        try:
+            await client.post("/oauth/token", data={"code": "c"}, max_retries=0)
+        except httpx.ConnectError:
+            pass
+        else:
+            raise AssertionError("expected the connection error to surface")
+        response = await client.post("/oauth/token", data={"code": "c"}, max_retries=0)
+        await client.aclose()
+        return client, response
+
+    client, response = asyncio.run(run())
+    assert response.status_code == 502
+    assert calls == ["/oauth/token", "/oauth/token"] and client.retries == 0
+
+
+def test_waits_out_rate_limits_per_token():
+    calls = []
+
+    def handler(request):
+        calls.append((request.headers["Authorization"], time.monotonic()))
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0.2"})
+        if request.headers["Authorization"] == "Bearer a" and len(calls) == 2:
+            # Budget exhausted: the next request with this token must wait for the reset
+            return httpx.Response(200, json={}, headers={"RateLimit-Remaining": "0", "RateLimit-Reset": str(time.time() + 0.2)})
+        return httpx.Response(200, json={})
+
+    async def run():
+        client = make_client(handler)
+        assert (await client.get("/api/v4/user", "a")).status_code == 200
+        started = time.monotonic()
+        await client.get("/api/v4/user", "b")
+        other_token = time.monotonic() - started
+        await client.get("/api/v4/user", "a")
+        await client.aclose()
+        return client, other_token
+
+    client, other_token = asyncio.run(run())
+    assert calls[1][1] - calls[0][1] >= 0.15
+    assert calls[3][1] - calls[1][1] >= 0.1
+    assert other_token < 0.1
+    assert client.rate_limit_waits == 2
+
+
+def test_iter_pages_fetches_remaining_pages_concurrently_in_order():
+    in_flight = {"now": 0, "max": 0}
+
+    async def handler(request):
+        page = int(request.url.params["page"])
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        # Later pages answer first; pages must still come out in order
+        await asyncio.sleep(0.01 * (10 - page))
+        in_flight["now"] -= 1
+        headers = {"X-Total-Pages": "9"} if request.url.path.endswith("/projects") else {}
+        if not headers and page < 3:
+            headers["X-Next-Page"] = str(page + 1)
+        return httpx.Response(200, json=[{"id": page}], headers=headers)
+
+    async def run(path):
+        client = make_client(handler)
+        pages = [page async for page in client.iter_pages(path, "secret", {"per_page": 1}, concurrency=3)]
+        await client.aclose()
+        return [p[0]["id"] for p in pages]
+
+    assert asyncio.run(run("/api/v4/projects")) == list(range(1, 10))
+    assert in_flight["max"] == 3
+    # Without X-Total-Pages, pages are followed one by one
+    assert asyncio.run(run("/api/v4/groups")) == [1, 2, 3]
@@ -0,0 +1,25 @@
+import threading
+import pytest
+from worker.grammars import GrammarRegistry, grammars
+
+
+def test_missing_grammar_is_none_and_not_retried(tmp_path):
+    registry = GrammarRegistry(str(tmp_path))
+    assert registry.available() == []
+    assert registry.language_for_path("main.go") is None
+    assert registry.language_for_path("README.md") is None
+    assert "go" in registry._languages
+
+
+@pytest.mark.skipif(not {"python", "typescript"} <= set(grammars.available()), reason="Tree-sitter grammars not built")
+def test_parsers_are_pooled_per_thread():
+    python = grammars.language_for_path("app.py")
+    assert grammars.language_for_path("app.tsx").name == "tsx"
+    assert grammars.parser(python) is grammars.parser(python)
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(grammars.parser(python)))
+    thread.start()
+    thread.join()
+    assert other[0] is not grammars.parser(python)
+    assert grammars.parse(python, b"def f():\n    pass\n").root_node.type == "module"
@@ -0,0 +1,100 @@
+from search.hybrid import HybridSearch, decode_cursor, reciprocal_rank_fusion
+from search.keyword_index import KeywordIndex, MongoKeywordIndex
+from search.vector_store import LocalVectorStore
+
+
+def record(i, path, text, language="python", repo_id=1):
+    return {"_id": f"{repo_id}:{i}", "text": text, "repo_id": repo_id, "file_path": path,
+            "language": language, "chunk_type": "code"}
+
+
+RECORDS = [
+    record(0, "db/raw.py", "def execute_raw(sql): return conn.execute(sql)"),
+    record(1, "api/users.py", "rows = execute_raw(f'SELECT * FROM users WHERE id={user_id}')"),
+    record(2, "api/orders.py", "def execute_query(q): return session.execute(q)"),
+    record(3, "web/raw.js", "function executeRaw(sql) { return db.run(sql) }", "javascript"),
+    record(4, "api/auth/login.py", "def login(user): return execute_raw(auth_sql)"),
+    record(5, "api/other.py", "def execute_raw(sql): pass", repo_id=2),
+]
+
+
+def test_keyword_index_ranks_identifiers_and_pushes_filters():
+    index = KeywordIndex(":memory:")
+    index.upsert_records("__default__", RECORDS)
+    hits = index.search(1, "execute_raw", top_k=10)
+    # Exact identifier matches outrank chunks sharing only a part ("execute")
+    assert {h["id"] for h in hits[:3]} == {"1:0", "1:1", "1:4"}
+    assert "1:5" not in {h["id"] for h in hits}
+    assert [h["id"] for h in index.search(1, "execute raw", language="javascript")] == ["1:3"]
+    assert {h["id"] for h in index.search(1, "execute_raw", path_prefix="api/")} == {"1:1", "1:4", "1:2"}
+    assert {h["id"] for h in index.search(1, "execute_raw", path_prefix="api/auth/lo")} == {"1:4"}
+    assert {h["id"] for h in index.search(1, "execute_raw", path_prefix="api/u")} == {"1:1"}
+
+    index.delete(["1:0"], "__default__")
+    index.upsert_records("__default__", [record(1, "api/users.py", "rows = fetch_all()")])
+    assert not {"1:0", "1:1"} & {h["id"] for h in index.search(1, "execute_raw")}
+
+
+def test_hybrid_search_fuses_and_pages(tmp_path):
+    search = HybridSearch(LocalVectorStore(str(tmp_path)), KeywordIndex(":memory:"))
+    search.upsert_records("__default__", RECORDS)
+
+    first, cursor = search.search(1, "execute_raw", limit=2)
+    assert first[0]["matched_by"] == ["keyword", "vector"]
+    second, _ = search.search(1, "execute_raw", limit=2, cursor=cursor)
+    assert decode_cursor(cursor) == 2
+    assert not {h["id"] for h in first} & {h["id"] for h in second}
+
+    fused = reciprocal_rank_fusion({"a": [{"id": "x"}, {"id": "y"}], "b": [{"id": "y"}]})
+    assert [h["id"] for h in fused] == ["y", "x"]
+
+
+class FakeTextCollection:
+    """Records the writes and the text query the Mongo keyword index sends."""
+
+    def __init__(self):
+        self.docs = {}
+        self.queries = []
+
+    def bulk_write(self, operations, ordered=True):
+        for op in operations:
+            self.docs[op._filter["_id"]] = op._doc
+
+    def delete_many(self, query):
+        for i in query["_id"]["$in"]:
+            self.docs.pop(i, None)
+
+    def find(self, query, projection):
+        self.queries.append((query, projection))
+        hits = [{"_id": i, "score": 1.0, **doc} for i, doc in self.docs.items() if doc["repo_id"] == query["repo_id"]]
+
+        class Cursor(list):
+            def sort(self, key):
+                return self
+
+            def skip(self, n):
+                return Cursor(self[n:])
+
+            def limit(self, n):
+                return Cursor(self[:n])
+        return Cursor(hits)
+
+
+def test_mongo_keyword_index_stores_tokens_and_filters_in_the_query():
+    collection = FakeTextCollection()
+    index = MongoKeywordIndex(collection)
+    index.upsert_records("__default__", RECORDS)
+    doc = collection.docs["1:4"]
+    assert {"execute_raw", "execute", "raw"} <= set(doc["tokens"].split())
+    assert doc["path_dirs"] == ["api", "api/auth"]
+
+    hits = index.search(1, "execute_raw", top_k=2, language="python", path_prefix="api/auth/lo", offset=1)
+    query, projection = collection.queries[-1]
+    assert query["$text"] == {"$search": "execute execute_raw raw"}
+    assert (query["repo_id"], query["language"], query["path_dirs"]) == (1, "python", "api/auth")
+    assert query["file_path"]["$gte"] == "api/auth/lo"
+    assert projection["score"] == {"$meta": "textScore"}
+    assert len(hits) == 2 and set(hits[0]) == {"id", "score", "text", "file_path", "language", "chunk_type"}
+
+    index.delete(["1:4"], "__default__")
+    assert "1:4" not in collection.docs
@@ -0,0 +1,82 @@
+import asyncio
+import httpx
+import openai
+import pytest
+from worker.llm_dispatcher import LLMDispatcher, TokenBucket, parse_reset_duration
+
+
+class FakeRawResponse:
+    def __init__(self, headers, total_tokens=100):
+        self.headers = headers
+        self._total_tokens = total_tokens
+
+    def parse(self):
+        class Usage:
+            total_tokens = self._total_tokens
+
+        class Response:
+            usage = Usage()
+
+        return Response()
+
+
+def make_error(status_code: int, headers=None) -> openai.APIStatusError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    error_class = openai.RateLimitError if status_code == 429 else openai.APIStatusError
+    return error_class("error", response=response, body=None)
+
+
+def test_parse_reset_duration():
+    assert parse_reset_duration("1s") == 1.0
+    assert parse_reset_duration("6m0s") == 360.0
+    assert parse_reset_duration("20ms") == pytest.approx(0.02)
+    assert parse_reset_duration("2") == 2.0
+    assert parse_reset_duration(None) is None
+
+
+def test_token_bucket_adopts_provider_limits():
+    async def scenario():
+        bucket = TokenBucket(100)
+        bucket.sync(limit=1000, remaining=10, reset_seconds=None)
+        assert bucket.capacity == 1000
+        assert bucket.available == pytest.approx(10, abs=1)
+
+    asyncio.run(scenario())
+
+
+def test_dispatch_retries_throttled_and_server_errors():
+    async def scenario():
+        dispatcher = LLMDispatcher(requests_per_minute=6000, tokens_per_minute=10**6, max_concurrency=2, max_retries=3)
+        outcomes = [make_error(429, {"retry-after-ms": "1"}), make_error(503), None]
+
+        def call():
+            error = outcomes.pop(0)
+            if error:
+                raise error
+            return FakeRawResponse({"x-ratelimit-limit-requests": "5000"})
+
+        dispatcher._backoff_delay = lambda attempt, retry_after: 0.0
+        response = await dispatcher.dispatch(call, estimated_tokens=50)
+        assert response.usage.total_tokens == 100
+        assert dispatcher.stats["throttled"] == 1
+        assert dispatcher.stats["server_errors"] == 1
+        assert dispatcher.requests.capacity == 5000
+
+    asyncio.run(scenario())
+
+
+def test_dispatch_does_not_retry_client_errors():
+    async def scenario():
+        dispatcher = LLMDispatcher(requests_per_minute=6000, tokens_per_minute=10**6)
+        calls = []
+
+        def call():
+            calls.append(1)
+            raise make_error(400)
+
+        with pytest.raises(openai.APIStatusError):
+            await dispatcher.dispatch(call, estimated_tokens=50)
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,37 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from worker import routes
+from worker.batching import BatchItem
+
+
+def respond_with(monkeypatch, payload):
+    class Dispatcher:
+        async def chat_completion(self, **kwargs):
+            message = SimpleNamespace(content=json.dumps(payload))
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    monkeypatch.setattr(routes, "get_llm_dispatcher", lambda: Dispatcher())
+
+
+def finding(line):
+    return {"type": "sql_injection", "category": "security", "severity": "high", "description": "d",
+            "recommendation": "r", "location": {"line": line}}
+
+
+BATCH = [BatchItem("src/a.py", "src/a.py", "x = 1", 0, 10), BatchItem("src/b.py#L11-20", "src/b.py", "y = 2", 10, 10)]
+
+
+def test_echoed_keys_are_normalised_to_the_submitted_paths(monkeypatch):
+    respond_with(monkeypatch, {"./src/a.py": [finding(3)], "/src/b.py#L11-20": [finding(2)]})
+    findings, failed = asyncio.run(routes.call_llm_for_analysis(BATCH))
+    assert [(f["location"], f["line"]) for f in findings] == [("src/a.py", 3), ("src/b.py", 12)]
+    assert failed == set()
+
+
+def test_findings_for_unknown_files_keep_the_batch_out_of_the_cache(monkeypatch):
+    respond_with(monkeypatch, {"src/a.py": [], "lib/a.py": [finding(1)]})
+    findings, failed = asyncio.run(routes.call_llm_for_analysis(BATCH))
+    # The finding is still reported, but no file of the batch counts as analyzed
+    assert len(findings) == 1
+    assert failed == {"src/a.py", "src/b.py"}
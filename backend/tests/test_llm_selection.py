@@ -0,0 +1,33 @@
+from worker.routes import should_send_to_llm
+
+C_OVERFLOW = '''#include <string.h>
+void copy(char *src) {
+    char buf[8];
+    strcpy(buf, src);
+}
+'''
+
+KOTLIN_SQL = '''fun find(db: Connection, name: String) =
+    db.createStatement().executeQuery("SELECT * FROM users WHERE name = '" + name + "'")
+'''
+
+PY_SCRIPT = '''import os
+os.system("rm " + input())
+'''
+
+
+def test_files_with_code_go_to_the_llm_whatever_their_style():
+    assert should_send_to_llm("copy.c", C_OVERFLOW)
+    assert should_send_to_llm("Users.kt", KOTLIN_SQL)
+    assert should_send_to_llm("clean.py", PY_SCRIPT)
+    assert should_send_to_llm("Main.hs", "main = putStrLn \"hi\"\n")
+    assert should_send_to_llm("core.clj", "(eval (read-string s))\n")
+    # A block comment may share its line with code
+    assert should_send_to_llm("a.c", "/* init */ system(cmd);\n")
+
+
+def test_only_files_without_code_are_skipped():
+    assert not should_send_to_llm("empty.py", "")
+    assert not should_send_to_llm("notes.py", "# just a note\n\n   # another\n")
+    assert not should_send_to_llm("index.ts", "// generated\n")
+    assert not should_send_to_llm("Util.hs", "-- nothing yet\n")
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import httpx
+
+from utils import project_cache
+from utils.gitlab_client import GitLabClient
+from utils.project_cache import ProjectCache
+
+
+def test_caches_per_user_and_revalidates_with_etag(monkeypatch, fake_db):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.headers["Authorization"] == "Bearer revoked":
+            return httpx.Response(404)
+        if request.headers.get("If-None-Match") == 'W/"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"id": 7, "name": "demo", "star_count": 3}, headers={"ETag": 'W/"v1"'})
+
+    monkeypatch.setattr(project_cache, "db", fake_db)
+    docs = fake_db.get_collection(project_cache.PROJECT_CACHE_COLLECTION).docs
+    gitlab = GitLabClient(base_url="https://gitlab.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(project_cache, "get_gitlab_client", lambda: gitlab)
+
+    async def run():
+        cache = ProjectCache(ttl=60)
+        assert await cache.get_project(7, "u1", "t1") == {"id": 7, "name": "demo"}
+        assert await cache.get_project(7, "u1", "t1") == {"id": 7, "name": "demo"}
+        assert len(requests) == 1 and cache.stats["memory_hits"] == 1
+
+        # Another process finds the entry in the shared tier
+        other = ProjectCache(ttl=60)
+        assert (await other.get_project(7, "u1", "t1"))["name"] == "demo"
+        assert len(requests) == 1 and other.stats["shared_hits"] == 1
+
+        # Once expired, the entry is revalidated rather than refetched
+        docs["u1:7"]["fetched_at"] = project_cache.datetime.utcfromtimestamp(time.time() - 120)
+        third = ProjectCache(ttl=60)
+        assert (await third.get_project(7, "u1", "t1"))["name"] == "demo"
+        assert requests[-1].headers["If-None-Match"] == 'W/"v1"' and third.stats["not_modified"] == 1
+
+        # Entries are per user: another user's lookup goes to GitLab with their own token
+        assert await cache.get_project(7, "u2", "revoked") is None
+        assert "u2:7" not in docs
+        await gitlab.aclose()
+
+    asyncio.run(run())
+
+
+def test_primed_listing_reaches_the_shared_tier(monkeypatch, fake_db):
+    requests = []
+    monkeypatch.setattr(project_cache, "db", fake_db)
+    collection = fake_db.get_collection(project_cache.PROJECT_CACHE_COLLECTION)
+    gitlab = GitLabClient(base_url="https://gitlab.test",
+                          transport=httpx.MockTransport(lambda r: requests.append(r) or httpx.Response(500)))
+    monkeypatch.setattr(project_cache, "get_gitlab_client", lambda: gitlab)
+    collection.docs["u1:7"] = {"_id": "u1:7", "etag": 'W/"v1"'}
+
+    async def run():
+        await ProjectCache(ttl=60).prime("u1", [{"id": 7, "name": "demo", "star_count": 3}, {"id": 8, "name": "other"}])
+        # A different process (the worker) gets the listed metadata without asking GitLab
+        worker = ProjectCache(ttl=60)
+        assert await worker.get_project(8, "u1", "t1") == {"id": 8, "name": "other"}
+        assert await worker.get_project(7, "u1", "t1") == {"id": 7, "name": "demo"}
+        assert worker.stats["shared_hits"] == 2 and requests == []
+        await gitlab.aclose()
+
+    asyncio.run(run())
+    # One bulk write for the page; an ETag already stored is kept
+    assert collection.bulk_writes == 1
+    assert collection.docs["u1:7"]["etag"] == 'W/"v1"' and collection.docs["u1:8"]["etag"] is None
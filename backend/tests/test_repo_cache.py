@@ -0,0 +1,94 @@
+import os
+import subprocess
+
+from worker.repo_cache import RepoMirrorCache
+
+
+def git(*args, cwd=None):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def commit(repo, name, content):
+    (repo / name).write_text(content)
+    git("add", ".", cwd=repo)
+    git("-c", "user.email=a@b", "-c", "user.name=a", "commit", "-qm", name, cwd=repo)
+
+
+def make_upstream(tmp_path):
+    upstream = tmp_path / "upstream"
+    git("init", "-q", "-b", "master", str(upstream))
+    commit(upstream, "a.py", "a = 1\n")
+    return upstream
+
+
+def test_mirror_is_created_then_fetched_and_worktrees_released(tmp_path):
+    upstream = make_upstream(tmp_path)
+    cache = RepoMirrorCache(str(tmp_path / "cache"), budget_bytes=1 << 30)
+    url = f"file://{upstream}"
+
+    first = cache.checkout(7, url, str(tmp_path / "scan1"))
+    assert (tmp_path / "scan1" / "a.py").read_text() == "a = 1\n"
+    cache.release(7, first)
+    assert not os.path.exists(first)
+
+    # The second checkout fetches new commits into the existing mirror
+    commit(upstream, "b.py", "b = 2\n")
+    second = cache.checkout(7, url, str(tmp_path / "scan2"))
+    assert sorted(os.listdir(second)) == [".git", "a.py", "b.py"]
+    assert git("rev-parse", "HEAD", cwd=second) == git("rev-parse", "HEAD", cwd=upstream)
+    # Still a worktree of the cached mirror, not a separate clone
+    assert os.path.isfile(os.path.join(second, ".git"))
+
+
+def test_mirror_follows_a_renamed_default_branch(tmp_path):
+    upstream = make_upstream(tmp_path)
+    cache = RepoMirrorCache(str(tmp_path / "cache"), budget_bytes=1 << 30)
+    url = f"file://{upstream}"
+    cache.release(7, cache.checkout(7, url, str(tmp_path / "scan1")))
+
+    # Renamed default branch, and a stale branch left under the old name
+    git("branch", "-m", "master", "main", cwd=upstream)
+    commit(upstream, "c.py", "c = 3\n")
+    git("branch", "old", "HEAD~1", cwd=upstream)
+    path = cache.checkout(7, url, str(tmp_path / "scan2"))
+    assert git("rev-parse", "HEAD", cwd=path) == git("rev-parse", "main", cwd=upstream)
+    cache.release(7, path)
+
+    # The default moves to a new branch while the previous one still exists
+    git("checkout", "-q", "-b", "develop", cwd=upstream)
+    commit(upstream, "d.py", "d = 4\n")
+    path = cache.checkout(7, url, str(tmp_path / "scan3"))
+    assert (tmp_path / "scan3" / "d.py").exists()
+
+
+def test_falls_back_to_a_clone_when_the_mirror_cannot_check_out(tmp_path, monkeypatch):
+    upstream = make_upstream(tmp_path)
+    cache = RepoMirrorCache(str(tmp_path / "cache"), budget_bytes=1 << 30)
+    url = f"file://{upstream}"
+    cache.release(7, cache.checkout(7, url, str(tmp_path / "scan1")))
+    # A mirror whose HEAD points nowhere, e.g. the default branch couldn't be resolved
+    monkeypatch.setattr(RepoMirrorCache, "_update_head", lambda self, *args: None)
+    git("symbolic-ref", "HEAD", "refs/heads/missing", cwd=tmp_path / "cache" / "7.git")
+
+    path = cache.checkout(7, url, str(tmp_path / "scan2"))
+    assert (tmp_path / "scan2" / "a.py").exists() and os.path.isdir(os.path.join(path, ".git"))
+    cache.release(7, path)
+    assert not os.path.exists(path)
+
+
+def test_eviction_skips_locked_and_checked_out_mirrors(tmp_path):
+    upstream = make_upstream(tmp_path)
+    cache = RepoMirrorCache(str(tmp_path / "cache"), budget_bytes=1 << 30)
+    url = f"file://{upstream}"
+    for repo_id in (1, 2, 3):
+        cache.release(repo_id, cache.checkout(repo_id, url, str(tmp_path / f"scan{repo_id}")))
+    in_use = cache.checkout(2, url, str(tmp_path / "busy"))
+
+    cache.budget_bytes = 0
+    with cache._lock(3):
+        with cache._lock(3, blocking=False) as acquired:
+            assert not acquired
+        assert cache.evict() > 0
+    # Only the idle mirror went; the locked and checked-out ones stay
+    assert sorted(os.listdir(cache.cache_dir)) == ["1.lock", "2.git", "2.lock", "3.git", "3.lock"]
+    cache.release(2, in_use)
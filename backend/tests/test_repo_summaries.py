@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from db import crud_scan
+from db.crud_scan import ScanCRUD
+
+
+def test_summaries_are_materialized_once_then_read_by_id(monkeypatch, fake_db):
+    day = datetime(2024, 5, 1)
+    results = {
+        "scans": [
+            {"_id": {"repo_id": 1, "active": False}, "scan": {
+                "_id": "s1", "repo_name": "api", "status": "completed", "updated_at": day, "overall_score": 85}},
+            {"_id": {"repo_id": 2, "active": True}, "scan": {"_id": "s2", "repo_name": "web", "status": "in_progress"}},
+        ],
+        "violations": [
+            {"_id": {"scan_id": "s1", "severity": "critical"}, "count": 1},
+            {"_id": {"scan_id": "s1", "severity": "high"}, "count": 2},
+            {"_id": {"scan_id": "s1", "severity": "low"}, "count": 1},
+            {"_id": {"scan_id": "s1", "severity": "info"}, "count": 3},
+        ],
+        "compliance_scores": [
+            {"_id": 1, "history": [
+                {"date": day, "overall_score": 85}, {"date": datetime(2024, 4, 20), "overall_score": 70}]},
+        ],
+    }
+    for name, docs in results.items():
+        fake_db.get_collection(name).aggregate_results = docs
+    monkeypatch.setattr(crud_scan, "db", fake_db)
+    summaries_collection = fake_db.get_collection(crud_scan.REPO_SUMMARIES_COLLECTION)
+
+    summaries = asyncio.run(ScanCRUD.get_repo_summaries([1, 2, 3], "u1"))
+    assert set(summaries) == {1, 2}
+    api = summaries[1]
+    assert (api["repo_name"], api["grade"], api["status"], api["trend"]) == ("api", "B", "completed", "improving")
+    assert (api["open_violations_count"], api["critical_violations_count"], api["high_violations_count"]) == (7, 1, 2)
+    assert [h["overall_score"] for h in api["compliance_history"]] == [70, 85]
+    web = summaries[2]
+    assert (web["status"], web["active_scan_id"], web["grade"], web["trend"]) == ("in_progress", "s2", "N/A", "stable")
+
+    # Severities are counted from the violations of the latest completed scans only
+    assert fake_db.get_collection("violations").pipelines[0][0]["$match"]["scan_id"] == {"$in": ["s1"]}
+    project = next(stage["$project"] for stage in fake_db.get_collection("scans").pipelines[0] if "$project" in stage)
+    assert "results" not in project and "results.findings" not in project
+
+    # Every repo now has a document, scanned or not, so the next read is a lookup only
+    assert set(summaries_collection.docs) == {"u1:1", "u1:2", "u1:3"}
+    assert asyncio.run(ScanCRUD.get_repo_summaries([1, 2, 3], "u1")) == summaries
+    assert len(fake_db.get_collection("scans").pipelines) == 1
+
+
+def test_summary_pipelines_run_on_mongod(monkeypatch, mongo_db):
+    start = datetime(2024, 1, 1)
+    older, latest, running = ObjectId(), ObjectId(), ObjectId()
+
+    async def run():
+        database = mongo_db()
+        monkeypatch.setattr(crud_scan, "db", database)
+        scan = {"repo_id": 1, "user_id": "u1", "repo_name": "api"}
+        await database.scans.insert_many([
+            {**scan, "_id": older, "status": "completed", "created_at": start, "updated_at": start,
+             "results": {"scores": {"overall_score": 60}}},
+            {**scan, "_id": latest, "status": "completed", "created_at": start, "updated_at": start + timedelta(days=1),
+             "results": {"scores": {"overall_score": 85}}},
+            {**scan, "_id": running, "status": "in_progress", "created_at": start + timedelta(days=2),
+             "updated_at": start + timedelta(days=2)},
+            {**scan, "user_id": "u2", "status": "completed", "created_at": start, "updated_at": start + timedelta(days=3),
+             "results": {"scores": {"overall_score": 10}}},
+            {"repo_id": 2, "user_id": "u1", "repo_name": "web", "status": "failed", "created_at": start, "updated_at": start},
+        ])
+        await database.compliance_scores.insert_many([
+            {"repo_id": 1, "user_id": "u1", "scan_date": start + timedelta(hours=i), "overall_score": i} for i in range(40)
+        ])
+        await database[crud_scan.VIOLATIONS_COLLECTION].insert_many([
+            {"scan_id": str(latest), "severity": "critical", "status": "open"},
+            {"scan_id": str(latest), "severity": "High", "status": "in_progress"},
+            {"scan_id": str(latest), "severity": "low", "status": "resolved"},
+            {"scan_id": str(latest), "status": "open"},
+            {"scan_id": str(older), "severity": "critical", "status": "open"},
+        ])
+        summaries = await ScanCRUD.get_repo_summaries([1, 2], "u1")
+        stored = await database[crud_scan.REPO_SUMMARIES_COLLECTION].count_documents({})
+        database.client.close()
+        return summaries, stored
+
+    summaries, stored = asyncio.run(run())
+    api = summaries[1]
+    assert (api["overall_score"], api["status"], api["active_scan_id"]) == (85, "in_progress", str(running))
+    # Open findings of the latest completed scan only, severities matched case-insensitively
+    counts = [api[f"{field}_count"] for field in ("open_violations", "critical_violations", "high_violations", "low_violations")]
+    assert counts == [3, 1, 1, 0]
+    # The last 30 score points, oldest first
+    assert [p["overall_score"] for p in api["compliance_history"]] == list(range(10, 40))
+    assert api["trend"] == "improving"
+    # A repo without completed or active scans is stored but not reported
+    assert 2 not in summaries and stored == 2
+
+
+def test_summary_updates_run_on_mongod(monkeypatch, mongo_db):
+    start = datetime(2024, 1, 1)
+
+    async def run():
+        database = mongo_db()
+        monkeypatch.setattr(crud_scan, "db", database)
+        summaries = database[crud_scan.REPO_SUMMARIES_COLLECTION]
+        await summaries.insert_one({
+            "_id": "u1:1", "repo_id": 1, "user_id": "u1", "last_scan_id": "s0", "overall_score": 29,
+            "compliance_history": [{"date": start + timedelta(hours=i), "overall_score": i} for i in range(30)],
+            "active_scan_id": "s1", "active_status": "in_progress",
+        })
+        await ScanCRUD.record_repo_summary(1, "u1", "s1", {"scores": {"overall_score": 80}, "findings": [
+            {"severity": "High"}, {"severity": "low", "status": "resolved"}, {"severity": "critical", "status": "in_progress"},
+        ]})
+        recorded = await summaries.find_one({"_id": "u1:1"})
+
+        await database[crud_scan.VIOLATIONS_COLLECTION].insert_many([
+            {"violation_id": "v1", "repo_id": 1, "user_id": "u1", "scan_id": "s1", "severity": "high", "status": "open"},
+            {"violation_id": "v0", "repo_id": 1, "user_id": "u1", "scan_id": "s0", "severity": "critical", "status": "open"},
+        ])
+        assert await ScanCRUD.update_violation_status("v1", "resolved", "u1")
+        # Findings of an older scan don't touch the latest scan's counts
+        assert await ScanCRUD.update_violation_status("v0", "resolved", "u1")
+        resolved = await summaries.find_one({"_id": "u1:1"})
+        database.client.close()
+        return recorded, resolved
+
+    recorded, resolved = asyncio.run(run())
+    assert (recorded["last_scan_id"], recorded["overall_score"], recorded["trend"]) == ("s1", 80, "improving")
+    assert (recorded["open_violations_count"], recorded["high_violations_count"],
+            recorded["critical_violations_count"], recorded["low_violations_count"]) == (2, 1, 1, 0)
+    # Capped at the last 30 points, with the new one last
+    assert [p["overall_score"] for p in recorded["compliance_history"]] == [*range(1, 30), 80]
+    # The completed scan is no longer the active one
+    assert "active_scan_id" not in recorded and "active_status" not in recorded
+    assert (resolved["open_violations_count"], resolved["high_violations_count"], resolved["critical_violations_count"]) == (1, 0, 1)
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import pytest
+from worker.grammars import grammars
+from worker.rules_engine import NodeMatch, RulesEngine, load_rules
+
+SAMPLE = '''
+def load(items):
+    for item in items:
+        save(item)
+
+def test_load():
+    assert load([]) is None
+'''
+
+
+def test_rules_map_tags_to_constructs():
+    engine = RulesEngine(load_rules())
+    assert engine.rule_constructs["maintainability-2"] == {"if", "loop", "switch", "ternary"}
+    assert engine.rule_constructs["testing-1"] == {"test"}
+    # File-scoped rules are not evaluated per node
+    assert "maintainability-5" not in engine.rule_constructs
+
+
+def test_prompt_bundles_every_applicable_rule():
+    engine = RulesEngine(load_rules())
+    match = NodeMatch("app.py", "function", 2, 4, "def f():\n    pass", ("performance-1", "readability-1"))
+    prompt = engine.make_rules_prompt(match)
+    assert "performance-1" in prompt and "readability-1" in prompt
+    assert "testing-1" not in prompt
+
+
+@pytest.mark.skipif("python" not in grammars.available(), reason="Tree-sitter grammars not built")
+def test_match_nodes_selects_functions_by_query():
+    engine = RulesEngine(load_rules())
+    python = grammars.language("python")
+    matches = engine.match_nodes("app.py", SAMPLE, python)
+    by_line = {m.start_line: set(m.rule_ids) for m in matches}
+    assert "performance-1" in by_line[2] and "testing-1" not in by_line[2]
+    assert "testing-1" in by_line[6] and "performance-1" not in by_line[6]
+    # Queries are compiled once per language
+    assert engine.compile(python) is engine._queries["python"]
+
+
+def test_files_are_matched_off_the_event_loop(monkeypatch):
+    engine = RulesEngine(load_rules())
+    threads = []
+
+    def match_nodes(path, content, language):
+        threads.append(threading.get_ident())
+        if path == "bad.py":
+            raise ValueError("unparseable")
+        return []
+
+    monkeypatch.setattr(engine, "match_nodes", match_nodes)
+
+    async def run():
+        findings, failed, _ = await engine.evaluate_files(
+            [("bad.py", "x"), ("app.py", "y"), ("README", "z")],
+            lambda path: object() if path.endswith(".py") else None, "model", 0,
+        )
+        return threading.get_ident(), findings, failed
+
+    loop_thread, findings, failed = asyncio.run(run())
+    assert len(threads) == 2 and loop_thread not in threads
+    assert findings == [] and failed == set()
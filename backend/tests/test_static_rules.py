@@ -0,0 +1,70 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+from worker import static_rules
+from worker.static_rules import run_static_rules, scan_content
+
+SAMPLE = '''import random
+API_KEY = "sk-live-1234567890"
+
+def handler(request):
+    # TODO: validate
+    name = request.args["name"]
+    cursor.execute("SELECT * FROM users WHERE name = '%s'" % name)
+    print(eval(name))
+    return random.randint(0, 10)
+'''
+
+
+def test_scan_content_reports_each_rule_on_its_line():
+    findings = scan_content("app.py", SAMPLE)
+    lines = {f["rule_id"]: f["line"] for f in findings}
+    assert lines == {"SEC001": 2, "QUAL002": 5, "COMP002": 6, "SEC003": 7, "QUAL003": 8, "SEC002": 8, "COMP003": 9}
+    assert all(f["location"] == "app.py" for f in findings)
+    assert {"type", "category", "severity", "description", "recommendation"} <= set(findings[0])
+
+
+def test_extension_scoped_rules():
+    assert scan_content("app.js", "print(1)\nconst x = Math.random();\n")[0]["rule_id"] == "COMP003"
+    assert len(scan_content("app.js", "print(1)\n")) == 0
+
+
+def test_process_pool_matches_inline_scan(monkeypatch):
+    monkeypatch.setattr(static_rules, "STATIC_RULES_INLINE_BYTES", 0)
+    monkeypatch.setattr(static_rules, "STATIC_RULES_WORKERS", 2)
+    files = [(f"mod_{i}.py", SAMPLE) for i in range(20)]
+    results = asyncio.run(run_static_rules(files))
+    assert results == {path: scan_content(path, content) for path, content in files}
+
+
+class BrokenPool:
+    """Stands in for a pool whose worker process has died."""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        raise BrokenProcessPool("a child process terminated abruptly")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_broken_pool_is_replaced_then_falls_back_to_a_thread(monkeypatch):
+    monkeypatch.setattr(static_rules, "STATIC_RULES_INLINE_BYTES", 0)
+    monkeypatch.setattr(static_rules, "STATIC_RULES_WORKERS", 2)
+    files = [(f"mod_{i}.py", SAMPLE) for i in range(4)]
+    expected = {path: scan_content(path, content) for path, content in files}
+
+    # A crashed worker doesn't fail later scans: the next one gets a fresh pool
+    broken = BrokenPool()
+    monkeypatch.setattr(static_rules, "_pool", broken)
+    assert asyncio.run(run_static_rules(files)) == expected
+    assert broken.shut_down and static_rules._pool is not broken
+    static_rules._pool.shutdown()
+
+    # If the new pool breaks too, the scan still completes in a thread
+    pools = []
+    monkeypatch.setattr(static_rules, "get_static_rules_pool", lambda: pools.append(BrokenPool()) or pools[-1])
+    assert asyncio.run(run_static_rules(files)) == expected
+    assert len(pools) == 2
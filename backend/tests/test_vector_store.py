@@ -0,0 +1,113 @@
+import sys
+import numpy as np
+import pytest
+from search import vector_store
+from search.vector_store import LocalVectorStore, code_tokens
+
+
+def record(repo_id, path, i, text, language="python"):
+    return {"_id": f"{repo_id}:{path}:{i}", "text": text, "repo_id": repo_id, "file_path": path,
+            "language": language, "chunk_type": "code"}
+
+
+def test_code_tokens_split_identifiers():
+    assert code_tokens("getUserToken(user_id)") == ["getusertoken", "get", "user", "token", "user_id", "user", "id"]
+
+
+def test_local_store_filters_deletes_and_persists(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    store.upsert_records("__default__", [
+        record(1, "auth/token.py", 0, "def verify_jwt_token(token): return jwt.decode(token)"),
+        record(1, "web/app.js", 0, "function verifyJwtToken(token) { return jwt.verify(token) }", "javascript"),
+        record(1, "db/models.py", 0, "class UserModel: name = Column(String)"),
+        record(2, "other.py", 0, "def verify_jwt_token(token): pass"),
+    ])
+    hits = store.search(1, "verify jwt token", top_k=2)
+    assert {h["file_path"] for h in hits} == {"auth/token.py", "web/app.js"}
+    assert [h["file_path"] for h in store.search(1, "verify jwt token", language="javascript")] == ["web/app.js"]
+    assert store.search(1, "verify jwt token", top_k=1, path_prefix="db/")[0]["file_path"] == "db/models.py"
+
+    store.delete(["1:auth/token.py:0"], "__default__")
+    # A fresh store reads the same directory back
+    reopened = LocalVectorStore(str(tmp_path))
+    assert "auth/token.py" not in {h["file_path"] for h in reopened.search(1, "verify jwt token")}
+    reopened.upsert_records("__default__", [record(1, "auth/token.py", 0, "def verify_jwt_token(): ...")])
+    # Re-adding a deleted id makes it live again
+    assert "auth/token.py" in {h["file_path"] for h in reopened.search(1, "verify jwt token")}
+
+
+def test_ivf_segment_matches_brute_force(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "LOCAL_INDEX_IVF_THRESHOLD", 500)
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(20, 16))
+    vectors = (centers[rng.integers(0, 20, 2000)] + rng.normal(scale=0.3, size=(2000, 16))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    lookup = {f"t{i}": v for i, v in enumerate(vectors)}
+    embed = lambda texts: np.stack([lookup[t] for t in texts])
+
+    store = LocalVectorStore(str(tmp_path), embed=embed, nprobe=8)
+    store.upsert_records("__default__", [record(1, f"f{i}.py", 0, f"t{i}") for i in range(2000)])
+    store.compact(1)
+    assert store._repo(1).segments[0].ivf
+
+    query = f"t{7}"
+    exact = np.argsort(-(vectors @ lookup[query]))[:10]
+    hits = store.search(1, query, top_k=10)
+    assert hits[0]["file_path"] == "f7.py"
+    recall = len({h["file_path"] for h in hits} & {f"f{i}.py" for i in exact}) / 10
+    assert recall >= 0.8
+
+
+def test_pinecone_initialization_failure_is_retried(monkeypatch):
+    import types
+
+    from utils import clients
+
+    attempts = []
+
+    class Pinecone:
+        def __init__(self, api_key):
+            attempts.append(api_key)
+            if len(attempts) == 1:
+                raise ConnectionError("pinecone unreachable")
+
+        def Index(self, name):
+            return ("index", name)
+
+    monkeypatch.setitem(sys.modules, "pinecone", types.SimpleNamespace(Pinecone=Pinecone))
+    monkeypatch.setattr(clients, "_clients", {})
+    assert clients.get_pinecone_index() is None
+    # The failure isn't remembered: the next call initializes the index
+    assert clients.get_pinecone_index() == ("index", clients.settings.PINECONE_INDEX_NAME)
+    assert clients.get_pinecone_index() is clients.get_pinecone_index() and len(attempts) == 2
+
+
+def test_pinecone_filters_directory_prefixes_in_the_index():
+    from search.vector_store import PineconeVectorStore
+
+    class FakeIndex:
+        def __init__(self):
+            self.queries = []
+
+        def search(self, namespace, query, fields):
+            self.queries.append(query)
+            hits = [{"_id": f"c{i}", "_score": 1 - i / 10, "fields": {"file_path": f"src/auth/f{i}.py"}}
+                    for i in range(query["top_k"])]
+            return {"result": {"hits": hits}}
+
+    index = FakeIndex()
+    store = PineconeVectorStore(index)
+    hits = store.search(1, "login", top_k=5, path_prefix="src/auth/")
+    assert len(hits) == 5
+    assert index.queries == [{
+        "inputs": {"text": "login"}, "top_k": 5, "filter": {"repo_id": 1, "path_dirs": {"$in": ["src/auth"]}}
+    }]
+    # A partial file name can't be filtered inside Pinecone, so it is rejected
+    with pytest.raises(ValueError):
+        store.search(1, "login", top_k=5, path_prefix="src/auth/lo")
+    assert len(index.queries) == 1
+    # ...and hybrid search reports it rather than falling back to keyword results
+    from search.hybrid import HybridSearch
+    from search.keyword_index import KeywordIndex
+    with pytest.raises(ValueError):
+        HybridSearch(store, KeywordIndex(":memory:")).search(1, "login", path_prefix="src/auth/lo")
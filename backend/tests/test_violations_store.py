@@ -0,0 +1,86 @@
+import asyncio
+
+from db import crud_scan
+from db.crud_scan import ScanCRUD
+
+
+def test_findings_are_bulk_inserted_once_and_read_back_in_pages(monkeypatch, fake_db):
+    monkeypatch.setattr(crud_scan, "db", fake_db)
+    violations = fake_db.get_collection(crud_scan.VIOLATIONS_COLLECTION)
+    monkeypatch.setattr(crud_scan, "VIOLATION_INSERT_BATCH_SIZE", 4)
+    findings = [
+        {"violation_id": f"v{i}", "severity": "high", "location": f"src/f{i}.py", "line": i, "rule_id": "SEC001"}
+        for i in range(10)
+    ]
+
+    async def run():
+        assert await ScanCRUD.save_violations(1, "u1", "s1", iter(findings)) == 10
+        await ScanCRUD.save_violations(1, "u1", "s2", [{"violation_id": "other"}])
+
+        pages = [page async for page in ScanCRUD.iter_violations("s1", {"violation_id": 1}, page_size=4)]
+        first, cursor = await ScanCRUD.get_violations_page("s1", limit=4)
+        rest, last = await ScanCRUD.get_violations_page("s1", after=cursor, limit=8)
+        carried = await ScanCRUD.get_scan_findings("s1")
+        await ScanCRUD.update_scan_status("5f0000000000000000000000", "completed", 100, "done",
+                                          results={"scores": {"overall_score": 90}, "findings": findings})
+        return pages, first, cursor, rest, last, carried
+
+    pages, first, cursor, rest, last, carried = asyncio.run(run())
+    # Batched, unordered inserts; fields the scan used to hold are kept
+    assert violations.inserts == [(4, False), (4, False), (2, False), (1, False)]
+    first_saved = next(iter(violations.docs.values()))
+    assert first_saved["status"] == "open" and first_saved["rule_id"] == "SEC001"
+
+    assert [[v["violation_id"] for v in page] for page in pages] == [
+        ["v0", "v1", "v2", "v3"], ["v4", "v5", "v6", "v7"], ["v8", "v9"]]
+    assert set(pages[0][0]) == {"_id", "violation_id"}
+    assert [v["violation_id"] for v in first + rest] == [f"v{i}" for i in range(10)] and last is None
+    assert cursor == str(first[-1]["_id"])
+
+    # Carried findings have the shape the worker produced, without storage fields
+    assert carried[3]["line"] == 3 and "_id" not in carried[3] and "scan_id" not in carried[3]
+
+    # The scan document keeps only the summary and scores
+    assert fake_db.get_collection("scans").updates[-1]["$set"]["results"] == {"scores": {"overall_score": 90}}
+
+
+def test_violation_pages_stay_on_the_scan_the_cursor_came_from(monkeypatch, fake_db):
+    from datetime import datetime
+
+    from bson import ObjectId
+    from repos import routes
+
+    monkeypatch.setattr(crud_scan, "db", fake_db)
+    monkeypatch.setattr(routes, "db", fake_db)
+    scans = fake_db.get_collection("scans")
+    user = {"id": "u1"}
+
+    def add_scan(day, count):
+        scan_id = ObjectId()
+        scans.docs[scan_id] = {"_id": scan_id, "repo_id": 1, "user_id": "u1", "status": "completed",
+                               "updated_at": datetime(2024, 5, day), "results": {"scores": {}}}
+        return scan_id, [{"violation_id": f"{day}-{i}"} for i in range(count)]
+
+    async def run():
+        old_id, old_findings = add_scan(1, 3)
+        await ScanCRUD.save_violations(1, "u1", str(old_id), old_findings)
+        first = await routes.get_violations_summary(1, None, 2, user)
+        # A newer scan completes while the client is still paging
+        new_id, new_findings = add_scan(2, 2)
+        await ScanCRUD.save_violations(1, "u1", str(new_id), new_findings)
+        second = await routes.get_violations_summary(1, first["next_cursor"], 2, user)
+        fresh = await routes.get_violations_summary(1, None, 2, user)
+        return first, second, fresh
+
+    first, second, fresh = asyncio.run(run())
+    assert [v["violation_id"] for v in first["violations"] + second["violations"]] == ["1-0", "1-1", "1-2"]
+    assert second["scan_id"] == first["scan_id"] and second["next_cursor"] is None
+    assert [v["violation_id"] for v in fresh["violations"]] == ["2-0", "2-1"]
+
+    for bad in ("not-a-cursor", str(ObjectId())):
+        try:
+            asyncio.run(routes.get_violations_summary(1, bad, 2, user))
+        except routes.HTTPException as e:
+            assert e.status_code == 400
+        else:
+            raise AssertionError("expected an invalid cursor to be rejected")
@@ -0,0 +1,103 @@
+# utils/clients.py
+"""
+Lazily constructed, memoized clients for external services.
+
+Nothing here is imported or connected until first use, so a process only pays for
+the SDKs it actually needs: the API never loads the GCS or OpenAI SDKs and the scan
+worker never loads Cloud Tasks.
+"""
+import logging
+import os
+import threading
+from typing import Any, Optional, Tuple
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+AST_BUCKET_NAME = "ast-storage-auditflow-ai"
+
+CLOUD_TASKS_SCOPES = [
+    'https://www.googleapis.com/auth/cloud-platform',
+    'https://www.googleapis.com/auth/cloud-tasks',
+    'https://www.googleapis.com/auth/iam'
+]
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def _memoize(name: str, factory) -> Any:
+    """Build a client once per process, even when first requested from several threads."""
+    if name in _clients:
+        return _clients[name]
+    with _lock:
+        if name not in _clients:
+            _clients[name] = factory()
+    return _clients[name]
+
+
+def get_storage_bucket() -> Any:
+    """Return the GCS bucket holding ASTs."""
+    def build():
+        from google.cloud import storage
+        return storage.Client().bucket(AST_BUCKET_NAME)
+    return _memoize("storage_bucket", build)
+
+
+def get_pinecone_index() -> Optional[Any]:
+    """
+    Return the Pinecone index for semantic code search, or None if it cannot be initialized.
+    Failures are not memoized, so a later call tries again.
+    """
+    def build():
+        from pinecone import Pinecone
+        index = Pinecone(api_key=settings.PINECONE_API_KEY).Index(settings.PINECONE_INDEX_NAME)
+        logger.info(f"Pinecone initialized with index: {settings.PINECONE_INDEX_NAME}")
+        return index
+    try:
+        return _memoize("pinecone_index", build)
+    except Exception as e:
+        logger.error(f"Failed to initialize Pinecone: {str(e)}")
+        return None
+
+
+def get_cloud_tasks_client() -> Tuple[Any, str]:
+    """Return the Cloud Tasks client and the scan queue path."""
+    def build():
+        from google.cloud import tasks_v2
+        from google.oauth2 import service_account
+
+        # Log environment variables (without sensitive values)
+        logger.info(f"GCP_PROJECT_ID: {os.getenv('GCP_PROJECT_ID')}")
+        logger.info(f"GCP_LOCATION: {os.getenv('GCP_LOCATION')}")
+        logger.info(f"GCP_QUEUE_NAME: {os.getenv('GCP_QUEUE_NAME')}")
+        logger.info(f"GCP_SERVICE_ACCOUNT_EMAIL: {os.getenv('GCP_SERVICE_ACCOUNT_EMAIL')}")
+
+        # Verify service account credentials
+        credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+        if not credentials_path:
+            raise Exception("GOOGLE_APPLICATION_CREDENTIALS environment variable is not set")
+        if not os.path.exists(credentials_path):
+            raise Exception(f"Service account credentials file not found at: {credentials_path}")
+
+        credentials = service_account.Credentials.from_service_account_file(
+            credentials_path,
+            scopes=CLOUD_TASKS_SCOPES
+        )
+        client = tasks_v2.CloudTasksClient(credentials=credentials)
+        queue_path = client.queue_path(
+            os.getenv("GCP_PROJECT_ID"),
+            os.getenv("GCP_LOCATION"),
+            os.getenv("GCP_QUEUE_NAME")
+        )
+        logger.info(f"Queue path: {queue_path}")
+        return client, queue_path
+    return _memoize("cloud_tasks", build)
+
+
+def get_openai_client() -> Any:
+    """Return the shared OpenAI client. Its own retries are disabled; the LLM dispatcher retries."""
+    def build():
+        from openai import OpenAI
+        return OpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+    return _memoize("openai", build)
@@ -0,0 +1,221 @@
+# utils/gitlab_client.py
+"""
+Shared async client for the GitLab API.
+
+One httpx.AsyncClient per event loop keeps a pool of keep-alive connections, so
+handlers never block the loop on GitLab and repeated calls skip the TLS handshake.
+Requests are retried on 5xx responses and connection errors with exponential
+backoff. GitLab's RateLimit-* headers are tracked per access token: once a token's
+remaining budget hits zero, its next request waits for the reset instead of being
+rejected, and 429 responses are retried after Retry-After. Paginated lists are read
+with the page count from the first page, fetching the remaining pages concurrently.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import time
+from collections import deque
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+GITLAB_URL = os.getenv("GITLAB_URL", "https://gitlab.com")
+GITLAB_MAX_CONNECTIONS = int(os.getenv("GITLAB_MAX_CONNECTIONS", "20"))
+GITLAB_TIMEOUT_SECONDS = float(os.getenv("GITLAB_TIMEOUT_SECONDS", "15"))
+GITLAB_MAX_RETRIES = 3
+RETRY_BASE_DELAY_SECONDS = 0.5
+# Never wait longer than this for a rate limit to reset; the request fails instead
+MAX_RATE_LIMIT_WAIT_SECONDS = 60.0
+# Pages of one list fetched at the same time
+GITLAB_PAGE_CONCURRENCY = int(os.getenv("GITLAB_PAGE_CONCURRENCY", "4"))
+
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout, httpx.RemoteProtocolError)
+
+
+class GitLabError(Exception):
+    """A GitLab request that didn't succeed, with the status GitLab answered."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class GitLabClient:
+    """Async GitLab API client with connection pooling, retries and rate-limit handling."""
+
+    def __init__(
+        self,
+        base_url: str = GITLAB_URL,
+        max_connections: int = GITLAB_MAX_CONNECTIONS,
+        timeout: float = GITLAB_TIMEOUT_SECONDS,
+        max_retries: int = GITLAB_MAX_RETRIES,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.max_retries = max_retries
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        # Token digest -> monotonic time before which the token has no requests left
+        self._blocked_until: Dict[str, float] = {}
+        self.retries = 0
+        self.rate_limit_waits = 0
+
+    @staticmethod
+    def _token_key(token: Optional[str]) -> str:
+        return hashlib.sha256((token or "").encode()).hexdigest()[:16]
+
+    def _record_rate_limit(self, key: str, response: httpx.Response) -> Optional[float]:
+        """Remember when an exhausted token may be used again; returns seconds to wait, if any."""
+        remaining = response.headers.get("RateLimit-Remaining")
+        reset = response.headers.get("RateLimit-Reset")
+        retry_after = response.headers.get("Retry-After")
+        wait = None
+        if retry_after is not None:
+            try:
+                wait = float(retry_after)
+            except ValueError:
+                wait = None
+        if wait is None and reset is not None and (response.status_code == 429 or remaining == "0"):
+            try:
+                # RateLimit-Reset is a Unix timestamp
+                wait = max(0.0, float(reset) - time.time())
+            except ValueError:
+                wait = None
+        if wait is not None and (response.status_code == 429 or remaining == "0"):
+            self._blocked_until[key] = time.monotonic() + min(wait, MAX_RATE_LIMIT_WAIT_SECONDS)
+            return wait
+        return None
+
+    async def _wait_for_rate_limit(self, key: str) -> None:
+        blocked_until = self._blocked_until.get(key)
+        if blocked_until is None:
+            return
+        delay = blocked_until - time.monotonic()
+        if delay > 0:
+            self.rate_limit_waits += 1
+            logger.warning(f"GitLab rate limit exhausted, waiting {delay:.1f}s")
+            await asyncio.sleep(delay)
+        self._blocked_until.pop(key, None)
+
+    async def request(
+        self, method: str, path: str, token: Optional[str] = None, max_retries: Optional[int] = None, **kwargs: Any
+    ) -> httpx.Response:
+        """
+        Send a request and return the final response, whatever its status. Raises only when
+        the connection keeps failing after every retry. Pass max_retries=0 for requests that
+        must not be sent twice, such as one-time code exchanges.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        headers = dict(kwargs.pop("headers", None) or {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        key = self._token_key(token)
+        attempt = 0
+        while True:
+            await self._wait_for_rate_limit(key)
+            try:
+                response = await self._client.request(method, path, headers=headers, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= max_retries:
+                    raise
+                logger.warning(f"GitLab {method} {path} failed ({type(e).__name__}), retrying")
+            else:
+                wait = self._record_rate_limit(key, response)
+                if response.status_code == 429:
+                    # The rate-limit wait happens at the top of the next attempt
+                    if attempt >= max_retries or wait is None or wait > MAX_RATE_LIMIT_WAIT_SECONDS:
+                        return response
+                    attempt += 1
+                    self.retries += 1
+                    continue
+                if response.status_code < 500 or attempt >= max_retries:
+                    return response
+                logger.warning(f"GitLab {method} {path} returned {response.status_code}, retrying")
+            await asyncio.sleep(RETRY_BASE_DELAY_SECONDS * (2 ** attempt) * (0.5 + random.random()))
+            attempt += 1
+            self.retries += 1
+
+    async def get(self, path: str, token: Optional[str] = None, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", path, token, **kwargs)
+
+    async def post(self, path: str, token: Optional[str] = None, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", path, token, **kwargs)
+
+    async def get_project(self, repo_id: int, token: str) -> httpx.Response:
+        return await self.get(f"/api/v4/projects/{repo_id}", token)
+
+    async def _get_page(self, path: str, token: Optional[str], params: Dict[str, Any], page: int) -> httpx.Response:
+        response = await self.get(path, token, params={**params, "page": page})
+        if response.status_code != 200:
+            raise GitLabError(response.status_code, f"GitLab {path} page {page} returned {response.status_code}")
+        return response
+
+    async def iter_pages(
+        self,
+        path: str,
+        token: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+        concurrency: int = GITLAB_PAGE_CONCURRENCY,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield every page of a paginated list, in order. The first page's X-Total-Pages lets
+        the rest be fetched concurrently, at most `concurrency` at a time. GitLab omits it
+        for very large lists, which are then followed page by page via X-Next-Page.
+        Raises GitLabError for a page that fails.
+        """
+        params = dict(params or {})
+        response = await self._get_page(path, token, params, 1)
+        yield response.json()
+
+        total_pages = response.headers.get("X-Total-Pages")
+        if not total_pages:
+            while response.headers.get("X-Next-Page"):
+                response = await self._get_page(path, token, params, int(response.headers["X-Next-Page"]))
+                yield response.json()
+            return
+
+        pages = iter(range(2, int(total_pages) + 1))
+        in_flight = deque(
+            asyncio.create_task(self._get_page(path, token, params, page))
+            for page in islice(pages, concurrency)
+        )
+        try:
+            while in_flight:
+                response = await in_flight.popleft()
+                page = next(pages, None)
+                if page is not None:
+                    in_flight.append(asyncio.create_task(self._get_page(path, token, params, page)))
+                yield response.json()
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+_clients: Dict[int, GitLabClient] = {}
+
+
+def get_gitlab_client() -> GitLabClient:
+    """Return the GitLab client of the running event loop; its pool can't be shared across loops."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(id(loop))
+    if client is None:
+        client = _clients[id(loop)] = GitLabClient()
+    return client
+
+
+async def close_gitlab_client() -> None:
+    client = _clients.pop(id(asyncio.get_running_loop()), None)
+    if client is not None:
+        await client.aclose()
@@ -1,7 +1,7 @@
 # utils/pdf_generator.py
 import io
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -15,12 +15,13 @@ from reportlab.graphics.charts.legends import Legend
 import json
 
 class ComplianceReportGenerator:
-    def __init__(self, scan_data: Dict[str, Any], repo_info: Dict[str, Any]):
+    def __init__(self, scan_data: Dict[str, Any], repo_info: Dict[str, Any], findings: Optional[List[Dict[str, Any]]] = None):
         self.scan_data = scan_data
         self.repo_info = repo_info
         self.results = self.scan_data.get("results", {})
         self.scores = self.results.get("scores", {})
-        self.findings = self.results.get("findings", [])
+        # Findings are stored in the violations collection, apart from the scan document
+        self.findings = findings if findings is not None else self.results.get("findings", [])
         
         self.styles = getSampleStyleSheet()
         self._setup_custom_styles()
@@ -0,0 +1,167 @@
+# utils/project_cache.py
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+from pymongo import UpdateOne
+from db.init import db
+from utils.gitlab_client import get_gitlab_client
+
+logger = logging.getLogger(__name__)
+
+PROJECT_CACHE_TTL_SECONDS = float(os.getenv("PROJECT_CACHE_TTL_SECONDS", "300"))
+PROJECT_CACHE_MAX_ENTRIES = int(os.getenv("PROJECT_CACHE_MAX_ENTRIES", "10000"))
+PROJECT_CACHE_COLLECTION = "gitlab_projects"
+
+# The project fields the app uses; the rest of GitLab's payload isn't worth storing
+PROJECT_FIELDS = (
+    "id", "name", "name_with_namespace", "path_with_namespace", "description",
+    "web_url", "http_url_to_repo", "default_branch", "visibility", "last_activity_at",
+)
+# GitLab answers these for projects the token can no longer see
+ACCESS_DENIED_STATUSES = (401, 403, 404)
+
+
+def _project_fields(project: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: project[k] for k in PROJECT_FIELDS if k in project}
+
+
+class ProjectCache:
+    """
+    Per-user cache of GitLab project metadata.
+
+    Entries are keyed by user as well as project, so access revoked in GitLab takes
+    effect once an entry expires. An in-process LRU sits in front of a MongoDB
+    collection shared by the API and worker instances. Expired entries are revalidated
+    with If-None-Match, so an unchanged project costs a 304 rather than a full payload.
+    If GitLab is unreachable, the expired copy is served instead.
+    """
+
+    def __init__(self, ttl: float = PROJECT_CACHE_TTL_SECONDS, max_entries: int = PROJECT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lru: "OrderedDict[Tuple[str, int], Dict[str, Any]]" = OrderedDict()
+        self.stats = {"memory_hits": 0, "shared_hits": 0, "not_modified": 0, "fetched": 0}
+
+    def _remember(self, key: Tuple[str, int], entry: Dict[str, Any]) -> None:
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _fresh(self, entry: Optional[Dict[str, Any]]) -> bool:
+        return entry is not None and time.time() - entry["fetched_at"] < self.ttl
+
+    async def prime(self, user_id: str, projects: Iterable[Dict[str, Any]]) -> None:
+        """
+        Cache projects from a listing the user just fetched, in both tiers, so the worker
+        finds them too. Without an ETag of their own they're refetched once expired; a
+        stored ETag is kept, since a 304 then still confirms the listed metadata.
+        """
+        now = time.time()
+        fetched_at = datetime.utcfromtimestamp(now)
+        operations = []
+        for project in projects:
+            fields = _project_fields(project)
+            self._remember((user_id, project["id"]), {"project": fields, "etag": None, "fetched_at": now})
+            operations.append(UpdateOne(
+                {"_id": f"{user_id}:{project['id']}"},
+                {
+                    "$set": {"user_id": user_id, "repo_id": project["id"], "project": fields, "fetched_at": fetched_at},
+                    "$setOnInsert": {"etag": None},
+                },
+                upsert=True
+            ))
+        if not operations:
+            return
+        try:
+            await db.get_collection(PROJECT_CACHE_COLLECTION).bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to write project cache: {str(e)}")
+
+    async def _load_shared(self, key: Tuple[str, int]) -> Optional[Dict[str, Any]]:
+        try:
+            doc = await db.get_collection(PROJECT_CACHE_COLLECTION).find_one({"_id": f"{key[0]}:{key[1]}"})
+        except Exception as e:
+            logger.error(f"Failed to read project cache: {str(e)}")
+            return None
+        if not doc:
+            return None
+        return {"project": doc["project"], "etag": doc.get("etag"), "fetched_at": doc["fetched_at"].replace(tzinfo=timezone.utc).timestamp()}
+
+    async def _store_shared(self, key: Tuple[str, int], entry: Dict[str, Any]) -> None:
+        try:
+            await db.get_collection(PROJECT_CACHE_COLLECTION).update_one(
+                {"_id": f"{key[0]}:{key[1]}"},
+                {"$set": {
+                    "user_id": key[0],
+                    "repo_id": key[1],
+                    "project": entry["project"],
+                    "etag": entry["etag"],
+                    "fetched_at": datetime.utcfromtimestamp(entry["fetched_at"]),
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to write project cache: {str(e)}")
+
+    async def _forget(self, key: Tuple[str, int]) -> None:
+        self._lru.pop(key, None)
+        try:
+            await db.get_collection(PROJECT_CACHE_COLLECTION).delete_one({"_id": f"{key[0]}:{key[1]}"})
+        except Exception as e:
+            logger.error(f"Failed to delete from project cache: {str(e)}")
+
+    async def get_project(self, repo_id: int, user_id: str, access_token: str) -> Optional[Dict[str, Any]]:
+        """Return the project's metadata as the user sees it, or None if GitLab won't show it to them."""
+        key = (user_id, repo_id)
+        entry = self._lru.get(key)
+        if self._fresh(entry):
+            self._lru.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return entry["project"]
+
+        shared = await self._load_shared(key)
+        if shared is not None and (entry is None or shared["fetched_at"] > entry["fetched_at"]):
+            entry = shared
+        if self._fresh(entry):
+            self._remember(key, entry)
+            self.stats["shared_hits"] += 1
+            return entry["project"]
+
+        headers = {"If-None-Match": entry["etag"]} if entry and entry.get("etag") else None
+        try:
+            resp = await get_gitlab_client().get(f"/api/v4/projects/{repo_id}", access_token, headers=headers)
+        except Exception as e:
+            logger.error(f"Failed to fetch GitLab project {repo_id}: {str(e)}")
+            return entry["project"] if entry else None
+
+        if resp.status_code == 304 and entry:
+            self.stats["not_modified"] += 1
+            entry = {**entry, "fetched_at": time.time()}
+        elif resp.status_code == 200:
+            self.stats["fetched"] += 1
+            entry = {"project": _project_fields(resp.json()), "etag": resp.headers.get("ETag"), "fetched_at": time.time()}
+        elif resp.status_code in ACCESS_DENIED_STATUSES:
+            await self._forget(key)
+            return None
+        else:
+            logger.error(f"GitLab returned {resp.status_code} for project {repo_id}")
+            return entry["project"] if entry else None
+
+        self._remember(key, entry)
+        await self._store_shared(key, entry)
+        return entry["project"]
+
+
+_project_cache: Optional[ProjectCache] = None
+
+
+def get_project_cache() -> ProjectCache:
+    """Return the project metadata cache shared by all requests in this process."""
+    global _project_cache
+    if _project_cache is None:
+        _project_cache = ProjectCache()
+    return _project_cache
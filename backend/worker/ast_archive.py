@@ -0,0 +1,342 @@
+# worker/ast_archive.py
+import gzip
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+from worker.ast_codec import CompactAST
+
+logger = logging.getLogger(__name__)
+
+# Set to write archives to a local directory instead of GCS
+AST_ARCHIVE_LOCAL_DIR = os.getenv("AST_ARCHIVE_LOCAL_DIR")
+# Off by default: archiving parses and uploads every parsable file during the scan
+AST_ARCHIVE_ENABLED = os.getenv("AST_ARCHIVE_ENABLED", "false").lower() == "true"
+# Packs kept per repository; older ones go once no kept pack references their entries
+AST_ARCHIVE_RETAIN_PACKS = int(os.getenv("AST_ARCHIVE_RETAIN_PACKS", "5"))
+# Packs are built in memory up to this size, then spill to a temporary file
+AST_ARCHIVE_SPOOL_BYTES = 64 * 1024 * 1024
+
+# Pack layout: [entry]* [gzipped JSON index] [footer]. Entries are gzipped individually
+# so any one of them can be fetched with a range read and decompressed on its own.
+# The footer is a magic string followed by the big-endian offset of the index.
+PACK_MAGIC = b"AFASTPK1"
+FOOTER_SIZE = len(PACK_MAGIC) + 8
+INDEX_VERSION = 1
+
+ENCODING_JSON = "json"
+# worker/ast_codec.py columnar format; earlier packs hold JSON with a sexp string
+ENCODING_COMPACT = "compact"
+
+
+class LocalArchiveBackend:
+    """Stores archive objects as files under a directory. Used for tests and local runs."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def upload_file(self, name: str, fileobj: BinaryIO) -> None:
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fileobj.seek(0)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+
+    def write_bytes(self, name: str, data: bytes) -> None:
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def read_bytes(self, name: str) -> Optional[bytes]:
+        try:
+            with open(self._path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def read_range(self, name: str, start: int, length: int) -> bytes:
+        with open(self._path(name), "rb") as f:
+            f.seek(start)
+            return f.read(length)
+
+    def size(self, name: str) -> int:
+        return os.path.getsize(self._path(name))
+
+    def list(self, prefix: str) -> List[Tuple[str, float]]:
+        """(name, creation time) of every object under a prefix."""
+        directory = self._path(prefix)
+        if not os.path.isdir(directory):
+            return []
+        return [
+            (f"{prefix.rstrip('/')}/{entry.name}", entry.stat().st_mtime)
+            for entry in os.scandir(directory) if entry.is_file()
+        ]
+
+    def delete(self, name: str) -> None:
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+class GCSArchiveBackend:
+    """Stores archive objects in a GCS bucket; reads of single entries use ranged downloads."""
+
+    def __init__(self, bucket: Any):
+        self.bucket = bucket
+
+    def upload_file(self, name: str, fileobj: BinaryIO) -> None:
+        self.bucket.blob(name).upload_from_file(fileobj, rewind=True, content_type="application/octet-stream")
+
+    def write_bytes(self, name: str, data: bytes) -> None:
+        self.bucket.blob(name).upload_from_string(data, content_type="application/octet-stream")
+
+    def read_bytes(self, name: str) -> Optional[bytes]:
+        from google.api_core.exceptions import NotFound
+        try:
+            return self.bucket.blob(name).download_as_bytes()
+        except NotFound:
+            return None
+
+    def read_range(self, name: str, start: int, length: int) -> bytes:
+        # GCS ranges are inclusive of the end byte
+        return self.bucket.blob(name).download_as_bytes(start=start, end=start + length - 1)
+
+    def size(self, name: str) -> int:
+        blob = self.bucket.get_blob(name)
+        if blob is None:
+            raise FileNotFoundError(name)
+        return blob.size
+
+    def list(self, prefix: str) -> List[Tuple[str, float]]:
+        """(name, creation time) of every object under a prefix."""
+        return [(blob.name, blob.time_created.timestamp()) for blob in self.bucket.list_blobs(prefix=prefix)]
+
+    def delete(self, name: str) -> None:
+        from google.api_core.exceptions import NotFound
+        try:
+            self.bucket.blob(name).delete()
+        except NotFound:
+            pass
+
+
+def get_ast_archive_backend():
+    """Return the local backend if AST_ARCHIVE_LOCAL_DIR is set, otherwise the GCS AST bucket."""
+    if AST_ARCHIVE_LOCAL_DIR:
+        return LocalArchiveBackend(AST_ARCHIVE_LOCAL_DIR)
+    from utils.clients import get_storage_bucket
+    return GCSArchiveBackend(get_storage_bucket())
+
+
+def latest_pointer_name(repo_id: int) -> str:
+    return f"asts/{repo_id}/LATEST"
+
+
+def packs_prefix(repo_id: int) -> str:
+    return f"asts/{repo_id}/packs/"
+
+
+def pack_name(repo_id: int, scan_id: str) -> str:
+    return f"{packs_prefix(repo_id)}{scan_id}.pack"
+
+
+class ASTArchive:
+    """
+    Read access to one scan's pack. Only the footer and index are fetched up front;
+    each AST is then a single range read, from whichever pack first stored its content.
+    """
+
+    def __init__(self, backend: Any, name: str, index: Dict[str, Any]):
+        self.backend = backend
+        self.name = name
+        self.paths: Dict[str, str] = index["paths"]
+        self.entries: Dict[str, List] = index["entries"]
+
+    @classmethod
+    def open(cls, backend: Any, name: str) -> "ASTArchive":
+        size = backend.size(name)
+        footer = backend.read_range(name, size - FOOTER_SIZE, FOOTER_SIZE)
+        if footer[:len(PACK_MAGIC)] != PACK_MAGIC:
+            raise ValueError(f"{name} is not an AST pack")
+        (index_offset,) = struct.unpack(">Q", footer[len(PACK_MAGIC):])
+        raw_index = backend.read_range(name, index_offset, size - FOOTER_SIZE - index_offset)
+        return cls(backend, name, json.loads(gzip.decompress(raw_index)))
+
+    @classmethod
+    def open_latest(cls, backend: Any, repo_id: int) -> Optional["ASTArchive"]:
+        """Open the most recent pack written for a repository, if any."""
+        pointer = backend.read_bytes(latest_pointer_name(repo_id))
+        if not pointer:
+            return None
+        return cls.open(backend, pointer.decode())
+
+    def read_entry(self, file_hash: str) -> Optional[Tuple[str, bytes]]:
+        """Return (encoding, payload) for a content hash, or None if it is not archived."""
+        entry = self.entries.get(file_hash)
+        if entry is None:
+            return None
+        pack, offset, length, encoding = entry
+        return encoding, gzip.decompress(self.backend.read_range(pack, offset, length))
+
+    def get(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """Return the AST stored for a file in this scan, or None."""
+        file_hash = self.paths.get(file_path)
+        entry = self.read_entry(file_hash) if file_hash else None
+        if entry is None:
+            return None
+        encoding, payload = entry
+        return decode_ast(encoding, payload, file_path)
+
+
+class ASTArchiveWriter:
+    """
+    Builds one scan's pack. Content already stored by the previous pack is referenced
+    rather than rewritten, so unchanged files cost an index entry and nothing else.
+    """
+
+    def __init__(self, backend: Any, repo_id: int, scan_id: str, previous: Optional[ASTArchive] = None):
+        self.backend = backend
+        self.repo_id = repo_id
+        self.scan_id = scan_id
+        self.name = pack_name(repo_id, scan_id)
+        self.previous = previous
+        self.paths: Dict[str, str] = {}
+        self.entries: Dict[str, List] = {}
+        self.written_count = 0
+        self.reused_count = 0
+        self._buffer = tempfile.SpooledTemporaryFile(max_size=AST_ARCHIVE_SPOOL_BYTES)
+        self._offset = 0
+
+    def add_existing(self, file_path: str, file_hash: str) -> bool:
+        """Point a file at an already stored AST. Returns False if its content is not stored yet."""
+        if file_hash not in self.entries:
+            entry = self.previous.entries.get(file_hash) if self.previous else None
+            if entry is None:
+                return False
+            self.entries[file_hash] = entry
+            self.reused_count += 1
+        self.paths[file_path] = file_hash
+        return True
+
+    def add(self, file_path: str, file_hash: str, payload: bytes, encoding: str = ENCODING_JSON) -> None:
+        """Append a new AST to the pack, unless identical content is already stored."""
+        if self.add_existing(file_path, file_hash):
+            return
+        data = gzip.compress(payload)
+        self._buffer.write(data)
+        self.entries[file_hash] = [self.name, self._offset, len(data), encoding]
+        self.paths[file_path] = file_hash
+        self._offset += len(data)
+        self.written_count += 1
+
+    def close(self) -> Dict[str, Any]:
+        """Write the index and footer, upload the pack as a single object and mark it latest."""
+        index = {
+            "version": INDEX_VERSION,
+            "repo_id": self.repo_id,
+            "scan_id": self.scan_id,
+            "created_at": datetime.utcnow().isoformat(),
+            "paths": self.paths,
+            "entries": self.entries,
+        }
+        index_offset = self._offset
+        self._buffer.write(gzip.compress(json.dumps(index, separators=(",", ":")).encode()))
+        self._buffer.write(PACK_MAGIC + struct.pack(">Q", index_offset))
+        pack_bytes = self._buffer.tell()
+        self.backend.upload_file(self.name, self._buffer)
+        self._buffer.close()
+        self.backend.write_bytes(latest_pointer_name(self.repo_id), self.name.encode())
+        return {
+            "ast_archive": self.name,
+            "ast_archive_bytes": pack_bytes,
+            "ast_entries_written": self.written_count,
+            "ast_entries_reused": self.reused_count,
+        }
+
+
+def encode_ast(ast: Dict[str, Any]) -> Tuple[str, bytes]:
+    """Serialize an AST for storage. The file path is left out so identical content dedupes."""
+    if isinstance(ast.get("tree"), CompactAST):
+        return ENCODING_COMPACT, ast["tree"].to_bytes()
+    return ENCODING_JSON, json.dumps({k: v for k, v in ast.items() if k != "file_path"}).encode()
+
+
+def decode_ast(encoding: str, payload: bytes, file_path: str) -> Dict[str, Any]:
+    if encoding == ENCODING_COMPACT:
+        tree = CompactAST.from_buffer(payload)
+        return {"type": "ast", "language": tree.language, "tree": tree, "file_path": file_path}
+    if encoding != ENCODING_JSON:
+        raise ValueError(f"Unknown AST encoding: {encoding}")
+    return {**json.loads(payload), "file_path": file_path}
+
+
+def write_scan_archive(
+    backend: Any,
+    repo_id: int,
+    scan_id: str,
+    contents: Dict[str, str],
+    file_hashes: Dict[str, str],
+    build_ast: Callable[[str, str], Optional[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """
+    Archive the ASTs of every file in `file_hashes` for one scan and return archive metrics.
+    Files whose content was not read this scan are archived only if a previous pack has them.
+    """
+    started = time.perf_counter()
+    try:
+        previous = ASTArchive.open_latest(backend, repo_id)
+    except Exception as e:
+        logger.warning(f"Could not open previous AST archive for repo {repo_id}, writing a full pack: {str(e)}")
+        previous = None
+
+    writer = ASTArchiveWriter(backend, repo_id, scan_id, previous)
+    missing = 0
+    for file_path, file_hash in file_hashes.items():
+        if writer.add_existing(file_path, file_hash):
+            continue
+        content = contents.get(file_path)
+        ast = build_ast(file_path, content) if content is not None else None
+        if ast is None:
+            missing += 1
+            continue
+        encoding, payload = encode_ast(ast)
+        writer.add(file_path, file_hash, payload, encoding)
+    metrics = writer.close()
+    try:
+        metrics["ast_packs_pruned"] = prune_archives(backend, repo_id)
+    except Exception as e:
+        # Pruning is retried after the next scan
+        logger.warning(f"Could not prune AST archives for repo {repo_id}: {str(e)}")
+    metrics["ast_archive_seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Wrote AST archive for repo {repo_id}: {metrics}, {missing} files without an AST")
+    return metrics
+
+
+def prune_archives(backend: Any, repo_id: int, keep: int = AST_ARCHIVE_RETAIN_PACKS) -> int:
+    """
+    Delete a repository's packs beyond the newest `keep`. Newer packs reference entries
+    stored in older ones, so a pack that a kept pack still points into is kept as well.
+    Returns the number of packs deleted.
+    """
+    packs = sorted(backend.list(packs_prefix(repo_id)), key=lambda pack: pack[1], reverse=True)
+    if len(packs) <= keep:
+        return 0
+    needed = set()
+    for name, _ in packs[:keep]:
+        needed.add(name)
+        needed.update(entry[0] for entry in ASTArchive.open(backend, name).entries.values())
+    deleted = 0
+    for name, _ in packs[keep:]:
+        if name not in needed:
+            backend.delete(name)
+            deleted += 1
+    return deleted
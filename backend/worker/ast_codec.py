@@ -0,0 +1,178 @@
+# worker/ast_codec.py
+import json
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+import numpy as np
+from tree_sitter import Tree
+
+# Layout: MAGIC, u32 header length, JSON header, padding to 8 bytes, then one
+# little-endian array per column, each starting on an 8-byte boundary. Arrays are
+# read with np.frombuffer, so loading from bytes or a memory map copies nothing.
+MAGIC = b"AFCAST01"
+ALIGNMENT = 8
+
+# Nodes are stored in pre-order. Children of node i are found by starting at i + 1 and
+# jumping to each child's subtree_end until reaching subtree_end[i]. Each column is
+# stored in the narrowest integer type that holds its values.
+COLUMNS = [
+    "type_id",
+    "field_id",     # 0 when the node is not a named field of its parent
+    "parent",       # -1 for the root
+    "subtree_end",  # index one past the node's last descendant
+    "start_byte",
+    "end_byte",
+    "start_row",
+    "end_row",
+    "flags",
+]
+
+FLAG_ERROR = 1
+
+
+def _pad(length: int) -> int:
+    return -length % ALIGNMENT
+
+
+def _narrowest(values: List[int]) -> np.ndarray:
+    array = np.array(values, dtype=np.int64)
+    low, high = (int(array.min()), int(array.max())) if len(array) else (0, 0)
+    for dtype in ((np.int8, np.int16, np.int32) if low < 0 else (np.uint8, np.uint16, np.uint32)):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return array.astype(np.dtype(dtype).newbyteorder("<"))
+    return array.astype("<i8")
+
+
+class CompactAST:
+    """
+    A Tree-sitter syntax tree flattened into columnar arrays of named nodes. Can be walked
+    and searched without the source, the grammar or a parser.
+    """
+
+    def __init__(self, language: str, types: List[str], fields: List[str], columns: Dict[str, np.ndarray]):
+        self.language = language
+        self.types = types
+        self.fields = fields
+        self.columns = columns
+        for name in COLUMNS:
+            setattr(self, name, columns[name])
+
+    def __len__(self) -> int:
+        return len(self.type_id)
+
+    def type_name(self, index: int) -> str:
+        return self.types[self.type_id[index]]
+
+    def field_name(self, index: int) -> Optional[str]:
+        return self.fields[self.field_id[index]] or None
+
+    def children(self, index: int) -> Iterator[int]:
+        child = index + 1
+        end = self.subtree_end[index]
+        while child < end:
+            yield child
+            child = int(self.subtree_end[child])
+
+    def type_ids(self, names: Iterable[str]) -> np.ndarray:
+        names = set(names)
+        return np.array([i for i, name in enumerate(self.types) if name in names], dtype=np.int64)
+
+    def find(self, names: Iterable[str]) -> np.ndarray:
+        """Indices of every node whose type is in `names`, in source order."""
+        return np.flatnonzero(np.isin(self.type_id, self.type_ids(names)))
+
+    def enclosing(self, index: int, names: Iterable[str]) -> Optional[int]:
+        """The nearest node at or above `index` whose type is in `names`."""
+        wanted = set(self.type_ids(names).tolist())
+        while index >= 0:
+            if self.type_id[index] in wanted:
+                return index
+            index = int(self.parent[index])
+        return None
+
+    def text(self, index: int, source: bytes) -> str:
+        return source[self.start_byte[index]:self.end_byte[index]].decode("utf-8", errors="replace")
+
+    def to_bytes(self) -> bytes:
+        column_bytes = []
+        layout = []
+        offset = 0
+        for name in COLUMNS:
+            column = self.columns[name]
+            dtype = column.dtype.newbyteorder("<") if column.dtype.byteorder == ">" else column.dtype
+            data = np.ascontiguousarray(column, dtype=dtype).tobytes()
+            layout.append([name, dtype.str, offset])
+            column_bytes.append(data + b"\0" * _pad(len(data)))
+            offset += len(column_bytes[-1])
+        header = json.dumps({
+            "language": self.language,
+            "node_count": len(self),
+            "types": self.types,
+            "fields": self.fields,
+            "columns": layout,
+        }, separators=(",", ":")).encode()
+        prefix = MAGIC + struct.pack("<I", len(header)) + header
+        return prefix + b"\0" * _pad(len(prefix)) + b"".join(column_bytes)
+
+    @classmethod
+    def from_buffer(cls, buffer: Union[bytes, memoryview, np.ndarray]) -> "CompactAST":
+        """Decode without copying; arrays are views into `buffer`."""
+        view = memoryview(buffer).cast("B")
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a compact AST")
+        (header_length,) = struct.unpack_from("<I", view, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        header = json.loads(bytes(view[header_start:header_start + header_length]))
+        data_start = header_start + header_length
+        data_start += _pad(data_start)
+        count = header["node_count"]
+        columns = {
+            name: np.frombuffer(view, dtype=dtype, count=count, offset=data_start + offset)
+            for name, dtype, offset in header["columns"]
+        }
+        return cls(header["language"], header["types"], header["fields"], columns)
+
+    @classmethod
+    def load(cls, path: str) -> "CompactAST":
+        """Memory-map an encoded AST from disk."""
+        return cls.from_buffer(np.memmap(path, dtype=np.uint8, mode="r"))
+
+
+def encode_tree(tree: Tree, language: str) -> CompactAST:
+    """Flatten the named nodes of a Tree-sitter tree in one cursor walk."""
+    types: Dict[str, int] = {}
+    fields: Dict[str, int] = {"": 0}
+    rows: Dict[str, List[Any]] = {name: [] for name in COLUMNS}
+    type_ids, field_ids, parents, subtree_end = rows["type_id"], rows["field_id"], rows["parent"], rows["subtree_end"]
+    start_bytes, end_bytes, start_rows, end_rows, flags = (
+        rows["start_byte"], rows["end_byte"], rows["start_row"], rows["end_row"], rows["flags"]
+    )
+
+    cursor = tree.walk()
+    ancestors: List[int] = []
+    while True:
+        node = cursor.node
+        descended = False
+        # Anonymous nodes (punctuation, keywords) never have named descendants
+        if node.is_named:
+            index = len(type_ids)
+            type_ids.append(types.setdefault(node.type, len(types)))
+            field_ids.append(fields.setdefault(cursor.field_name or "", len(fields)))
+            parents.append(ancestors[-1] if ancestors else -1)
+            subtree_end.append(index + 1)
+            start_bytes.append(node.start_byte)
+            end_bytes.append(node.end_byte)
+            start_rows.append(node.start_point[0])
+            end_rows.append(node.end_point[0])
+            flags.append(FLAG_ERROR if node.is_error or node.is_missing else 0)
+            if cursor.goto_first_child():
+                ancestors.append(index)
+                descended = True
+        if descended:
+            continue
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                columns = {name: _narrowest(rows[name]) for name in COLUMNS}
+                return CompactAST(language, list(types), list(fields), columns)
+            # Back at a named ancestor (only named nodes are descended into): its subtree ends here
+            subtree_end[ancestors.pop()] = len(type_ids)
@@ -0,0 +1,199 @@
+# worker/batching.py
+import logging
+import os
+from typing import Callable, Iterable, List, NamedTuple, Optional, Set, Tuple
+import numpy as np
+from tree_sitter import Language
+from worker.ast_codec import CompactAST, encode_tree
+from worker.grammars import grammars
+
+logger = logging.getLogger(__name__)
+
+# Prompt tokens allowed per LLM batch; leaves headroom in gpt-4o's 128k window for the response
+LLM_BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "24000"))
+# Tokens added per file for the "--- FILE: ... ---" header and code fence
+PER_FILE_OVERHEAD_TOKENS = 20
+
+# Approximate characters per token by extension. Symbol-heavy languages tokenize
+# denser than prose, so a flat bytes limit over- or under-fills batches.
+CHARS_PER_TOKEN = {
+    '.py': 3.6, '.rb': 3.6,
+    '.js': 3.2, '.jsx': 3.0, '.ts': 3.2, '.tsx': 3.0,
+    '.java': 3.9, '.kt': 3.7, '.scala': 3.6, '.cs': 3.8,
+    '.go': 3.4, '.rs': 3.3, '.swift': 3.5,
+    '.c': 3.2, '.h': 3.2, '.cpp': 3.1, '.hpp': 3.1,
+    '.php': 3.3,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+# Tree-sitter node types that start a function, method or class in the supported grammars
+DEFINITION_NODE_TYPES = {
+    'function_definition', 'class_definition', 'decorated_definition',
+    'function_declaration', 'generator_function_declaration', 'class_declaration',
+    'method_definition', 'lexical_declaration', 'export_statement',
+    'method_declaration', 'constructor_declaration', 'interface_declaration', 'enum_declaration',
+    'type_declaration', 'abstract_class_declaration', 'type_alias_declaration',
+}
+
+
+class BatchItem(NamedTuple):
+    """A whole file, or a fragment of an oversized file, sent to the LLM."""
+    key: str           # identifier the LLM keys its findings by
+    path: str          # path of the source file
+    content: str
+    line_offset: int   # number of lines preceding this fragment in the source file
+    tokens: int
+
+
+def chars_per_token(path: str) -> float:
+    return CHARS_PER_TOKEN.get(os.path.splitext(path)[1].lower(), DEFAULT_CHARS_PER_TOKEN)
+
+
+def estimate_tokens(path: str, content: str) -> int:
+    """Estimate prompt tokens for a file from its length and language."""
+    return int(len(content) / chars_per_token(path)) + PER_FILE_OVERHEAD_TOKENS
+
+
+def _definition_start_lines(ast: CompactAST) -> Set[int]:
+    """Zero-based line numbers where a function, method or class begins, at any depth."""
+    definitions = ast.find(DEFINITION_NODE_TYPES)
+    # Decorators belong to the definition they decorate; don't cut between them
+    decorated = ast.find(['decorated_definition'])
+    definitions = definitions[~np.isin(ast.parent[definitions], decorated)]
+    lines = set(ast.start_row[definitions].tolist())
+    # Every top-level statement is a valid boundary too
+    lines.update(int(ast.start_row[child]) for child in ast.children(0))
+    return lines
+
+
+def _lookup_ast(get_ast, path: str, content: str) -> Optional[CompactAST]:
+    if get_ast is None:
+        return None
+    try:
+        return get_ast(path, content)
+    except Exception as e:
+        logger.warning(f"Could not get AST for {path}: {str(e)}")
+        return None
+
+
+def _fragment(path: str, content: str, line_offset: int) -> BatchItem:
+    end_line = line_offset + content.count('\n') + 1
+    return BatchItem(f"{path}#L{line_offset + 1}-{end_line}", path, content, line_offset, estimate_tokens(path, content))
+
+
+def split_file(
+    path: str,
+    content: str,
+    max_tokens: int,
+    language: Optional[Language] = None,
+    ast: Optional[CompactAST] = None,
+) -> List[BatchItem]:
+    """
+    Split a file into fragments of at most `max_tokens`, cutting at function and class
+    boundaries when an AST or a grammar is available and falling back to plain line ranges.
+    """
+    lines = content.split('\n')
+    boundaries: Set[int] = set()
+    if ast is not None or language is not None:
+        try:
+            if ast is None:
+                ast = encode_tree(grammars.parse(language, content.encode('utf-8')), language.name)
+            boundaries = _definition_start_lines(ast)
+        except Exception as e:
+            logger.warning(f"Could not parse {path} for splitting, using line ranges: {str(e)}")
+
+    # Segments are the line ranges between consecutive boundaries
+    cuts = sorted(b for b in boundaries if 0 < b < len(lines))
+    segments = list(zip([0] + cuts, cuts + [len(lines)]))
+
+    # Any segment that is still too large is broken into single lines, which the
+    # merge below packs back into ranges under the budget
+    max_chars = max(1, int((max_tokens - PER_FILE_OVERHEAD_TOKENS) * chars_per_token(path)))
+    line_sizes = [len(line) + 1 for line in lines]
+    fine_segments: List[Tuple[int, int, int]] = []
+    for start, end in segments:
+        size = sum(line_sizes[start:end])
+        if size <= max_chars:
+            fine_segments.append((start, end, size))
+        else:
+            fine_segments.extend((line, line + 1, line_sizes[line]) for line in range(start, end))
+
+    # Greedily merge consecutive segments back together up to the budget
+    pieces: List[List[int]] = []
+    for start, end, size in fine_segments:
+        if pieces and pieces[-1][2] + size <= max_chars:
+            pieces[-1][1] = end
+            pieces[-1][2] += size
+        else:
+            pieces.append([start, end, size])
+
+    return [_fragment(path, '\n'.join(lines[start:end]), start) for start, end, _ in pieces]
+
+
+def pack_batches(items: Iterable[BatchItem], token_budget: int) -> List[List[BatchItem]]:
+    """Pack items into as few batches as possible with first-fit-decreasing bin packing."""
+    batches: List[List[BatchItem]] = []
+    remaining: List[int] = []
+    for item in sorted(items, key=lambda i: i.tokens, reverse=True):
+        for index, capacity in enumerate(remaining):
+            if item.tokens <= capacity:
+                batches[index].append(item)
+                remaining[index] -= item.tokens
+                break
+        else:
+            batches.append([item])
+            remaining.append(token_budget - item.tokens)
+    return batches
+
+
+def build_batches(
+    files: Iterable[Tuple[str, str]],
+    get_language: Callable[[str], Optional[Language]],
+    token_budget: int = LLM_BATCH_TOKEN_BUDGET,
+    get_ast: Optional[Callable[[str, str], Optional[CompactAST]]] = None,
+) -> List[List[BatchItem]]:
+    """
+    Turn (path, content) pairs into token-bounded batches, splitting oversized files.
+    `get_ast` lets the caller supply an already parsed AST for a file.
+    """
+    items = []
+    split_count = 0
+    for path, content in files:
+        tokens = estimate_tokens(path, content)
+        if tokens <= token_budget:
+            items.append(BatchItem(path, path, content, 0, tokens))
+        else:
+            fragments = split_file(path, content, token_budget, get_language(path), _lookup_ast(get_ast, path, content))
+            split_count += 1
+            logger.info(f"Split oversized file {path} (~{tokens} tokens) into {len(fragments)} fragments")
+            items.extend(fragments)
+    batches = pack_batches(items, token_budget)
+    logger.info(f"Packed {len(items)} items ({split_count} files split) into {len(batches)} batches")
+    return batches
+
+
+def resplit_batch(
+    batch: List[BatchItem],
+    get_language: Callable[[str], Optional[Language]],
+    get_ast: Optional[Callable[[str, str], Optional[CompactAST]]] = None,
+) -> Optional[List[List[BatchItem]]]:
+    """
+    Split a batch the provider rejected for context length into smaller batches.
+    Returns None when the batch is a single fragment that cannot be split further.
+    """
+    if len(batch) > 1:
+        half = sum(item.tokens for item in batch) // 2
+        return pack_batches(batch, max(half, max(item.tokens for item in batch)))
+
+    item = batch[0]
+    fragments = split_file(
+        item.path, item.content, max(1, item.tokens // 2), get_language(item.path),
+        _lookup_ast(get_ast, item.path, item.content),
+    )
+    if len(fragments) <= 1:
+        return None
+    # Fragment keys and offsets are relative to the original file, not the parent fragment
+    return [
+        [_fragment(item.path, f.content, item.line_offset + f.line_offset)]
+        for f in fragments
+    ]
@@ -0,0 +1,227 @@
+# worker/chunk_indexer.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Set, Tuple
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from db.init import db
+
+logger = logging.getLogger(__name__)
+
+CHUNK_INDEXING_ENABLED = os.getenv("CHUNK_INDEXING_ENABLED", "true").lower() == "true"
+# upsert_records with integrated embedding accepts at most 96 records per request
+PINECONE_UPSERT_BATCH_SIZE = 96
+PINECONE_UPSERT_CONCURRENCY = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", "4"))
+# Pinecone deletes by id accept at most 1000 ids per request
+PINECONE_DELETE_BATCH_SIZE = 1000
+PINECONE_NAMESPACE = "__default__"
+
+INDEXED_FILES_COLLECTION = "indexed_files"
+FALLBACK_CHUNKS_COLLECTION = "text_chunks"
+
+
+def make_chunk_id(repo_id: int, file_path: str, file_hash: str, chunk_index: int) -> str:
+    """Chunk ids change with the file content, so a changed file never overwrites in place."""
+    path_digest = hashlib.sha1(file_path.encode()).hexdigest()[:16]
+    return f"{repo_id}:{path_digest}:{file_hash[:16]}:{chunk_index}"
+
+
+class ChunkIndexer:
+    """
+    Keeps a repository's code chunks in the vector store (Pinecone, or the local index in
+    search/vector_store.py) in step with its files.
+
+    The `indexed_files` collection records which content hash of each path is indexed
+    and under which chunk ids, so unchanged files are skipped and the vectors of deleted
+    or changed files can be removed by id. Records are upserted in batches of the
+    provider's maximum size with a bounded number of requests in flight; batches that
+    fail are written to `text_chunks` instead.
+    """
+
+    def __init__(
+        self,
+        index: Any,
+        indexed_files: Any = None,
+        fallback_chunks: Any = None,
+        concurrency: int = PINECONE_UPSERT_CONCURRENCY,
+    ):
+        self.index = index
+        self.indexed_files = indexed_files if indexed_files is not None else db.get_collection(INDEXED_FILES_COLLECTION)
+        self.fallback_chunks = fallback_chunks if fallback_chunks is not None else db.get_collection(FALLBACK_CHUNKS_COLLECTION)
+        self.concurrency = concurrency
+
+    async def _load_state(self, repo_id: int) -> Dict[str, Dict[str, Any]]:
+        cursor = self.indexed_files.find(
+            {"repo_id": repo_id},
+            projection={"_id": 1, "file_path": 1, "file_hash": 1, "chunk_ids": 1}
+        )
+        return {doc["file_path"]: doc async for doc in cursor}
+
+    async def _delete_vectors(self, ids: List[str]) -> int:
+        deleted = 0
+        for start in range(0, len(ids), PINECONE_DELETE_BATCH_SIZE):
+            batch = ids[start:start + PINECONE_DELETE_BATCH_SIZE]
+            await asyncio.to_thread(self.index.delete, ids=batch, namespace=PINECONE_NAMESPACE)
+            deleted += len(batch)
+        return deleted
+
+    async def _store_fallback(self, records: List[Dict[str, Any]]) -> int:
+        """Keep chunks Pinecone rejected in MongoDB. Already stored chunk ids are not an error."""
+        now = datetime.utcnow()
+        documents = [
+            {
+                "chunk_id": record["_id"],
+                "text": record["text"],
+                "metadata": {k: v for k, v in record.items() if k not in ("_id", "text")},
+                "created_at": now,
+            }
+            for record in records
+        ]
+        try:
+            result = await self.fallback_chunks.insert_many(documents, ordered=False)
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            return e.details.get("nInserted", 0)
+
+    @staticmethod
+    def _build_records(
+        repo_id: int,
+        file_hashes: Dict[str, str],
+        contents: Mapping[str, str],
+        make_chunks: Callable[[str, str], Iterable[Tuple[str, Dict[str, Any]]]],
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, List[str]], int]:
+        """Chunk files into Pinecone records. Files whose content is unavailable are counted, not chunked."""
+        records: List[Dict[str, Any]] = []
+        chunk_ids_by_path: Dict[str, List[str]] = {}
+        missing_content = 0
+        timestamp = datetime.utcnow().isoformat()
+        for file_path, file_hash in file_hashes.items():
+            content = contents.get(file_path)
+            if content is None:
+                # Unreadable or not read this scan; picked up by a later run
+                missing_content += 1
+                continue
+            ids = []
+            for chunk_index, (text, metadata) in enumerate(make_chunks(file_path, content)):
+                chunk_id = make_chunk_id(repo_id, file_path, file_hash, chunk_index)
+                records.append({
+                    "_id": chunk_id,
+                    "text": text,  # Field must be 'text' to match the index's default field_map
+                    "repo_id": repo_id,
+                    "file_path": file_path,
+                    "chunk_index": chunk_index,
+                    "timestamp": timestamp,
+                    "file_hash": file_hash,
+                    "chunk_type": "code",
+                    **metadata,
+                })
+                ids.append(chunk_id)
+            chunk_ids_by_path[file_path] = ids
+        return records, chunk_ids_by_path, missing_content
+
+    async def index_repo(
+        self,
+        repo_id: int,
+        tree_hashes: Dict[str, str],
+        contents: Mapping[str, str],
+        make_chunks: Callable[[str, str], Iterable[Tuple[str, Dict[str, Any]]]],
+    ) -> Dict[str, Any]:
+        """
+        Bring the index for a repository in line with `tree_hashes`, the path -> content
+        hash map of its current tree. New or changed files are looked up in `contents` and
+        chunked with `make_chunks`, which yields (text, extra metadata) pairs.
+        Returns per-scan indexing metrics.
+        """
+        started = time.perf_counter()
+        state = await self._load_state(repo_id)
+
+        # --- Stale vectors: files deleted or changed since they were indexed ---
+        stale_paths = {
+            p for p, doc in state.items()
+            if tree_hashes.get(p) != doc.get("file_hash")
+        }
+        stale_ids = [chunk_id for p in stale_paths for chunk_id in state[p].get("chunk_ids", [])]
+        deleted_vectors = await self._delete_vectors(stale_ids) if stale_ids else 0
+        if stale_paths:
+            await self.indexed_files.bulk_write(
+                [DeleteOne({"_id": state[p]["_id"]}) for p in stale_paths], ordered=False
+            )
+
+        # --- Chunk new and changed files, off the event loop ---
+        pending = {p: h for p, h in tree_hashes.items() if p not in state or p in stale_paths}
+        records, chunk_ids_by_path, missing_content = await asyncio.to_thread(
+            self._build_records, repo_id, pending, contents, make_chunks
+        )
+        skipped_files = len(tree_hashes) - len(pending)
+
+        # --- Batched upserts with bounded concurrency ---
+        semaphore = asyncio.Semaphore(self.concurrency)
+        failed_paths: Set[str] = set()
+        upserted = 0
+        bytes_sent = 0
+        fallback_count = 0
+
+        async def upsert(batch: List[Dict[str, Any]]) -> None:
+            nonlocal upserted, bytes_sent, fallback_count
+            payload_bytes = len(json.dumps(batch, separators=(",", ":")).encode())
+            async with semaphore:
+                try:
+                    await asyncio.to_thread(self.index.upsert_records, PINECONE_NAMESPACE, batch)
+                    upserted += len(batch)
+                    bytes_sent += payload_bytes
+                    return
+                except Exception as e:
+                    logger.error(f"Failed to upsert {len(batch)} chunks to Pinecone for repo {repo_id}: {str(e)}")
+            failed_paths.update(record["file_path"] for record in batch)
+            try:
+                fallback_count += await self._store_fallback(batch)
+            except Exception as e:
+                logger.error(f"Failed to store {len(batch)} chunks in MongoDB fallback: {str(e)}")
+
+        batches = [
+            records[start:start + PINECONE_UPSERT_BATCH_SIZE]
+            for start in range(0, len(records), PINECONE_UPSERT_BATCH_SIZE)
+        ]
+        upsert_started = time.perf_counter()
+        await asyncio.gather(*(upsert(batch) for batch in batches))
+        upsert_seconds = time.perf_counter() - upsert_started
+
+        # --- Record what is now indexed; files with a failed batch are retried next scan ---
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"_id": f"{repo_id}:{file_path}"},
+                {"$set": {
+                    "repo_id": repo_id,
+                    "file_path": file_path,
+                    "file_hash": tree_hashes[file_path],
+                    "chunk_ids": ids,
+                    "indexed_at": now,
+                }},
+                upsert=True
+            )
+            for file_path, ids in chunk_ids_by_path.items()
+            if file_path not in failed_paths
+        ]
+        if operations:
+            await self.indexed_files.bulk_write(operations, ordered=False)
+
+        metrics = {
+            "index_files_indexed": len(operations),
+            "index_files_skipped": skipped_files,
+            "index_files_without_content": missing_content,
+            "index_chunks_upserted": upserted,
+            "index_upsert_batches": len(batches),
+            "index_upserts_per_second": round(upserted / upsert_seconds, 1) if upserted and upsert_seconds else 0.0,
+            "index_bytes_sent": bytes_sent,
+            "index_stale_vectors_deleted": deleted_vectors,
+            "index_fallback_chunks": fallback_count,
+            "index_seconds": round(time.perf_counter() - started, 3),
+        }
+        logger.info(f"Indexed code chunks for repo {repo_id}: {metrics}")
+        return metrics
@@ -0,0 +1,161 @@
+# worker/discovery.py
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterator, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Number of reader threads and the maximum number of records buffered between
+# the readers and the consumer. Reads release the GIL, so threads scale well here.
+DISCOVERY_WORKERS = int(os.getenv("SCAN_DISCOVERY_WORKERS", "16"))
+DISCOVERY_QUEUE_SIZE = int(os.getenv("SCAN_DISCOVERY_QUEUE_SIZE", "256"))
+
+# Files smaller than this (after stripping whitespace) are not worth analyzing
+MIN_CONTENT_LENGTH = 20
+
+
+class DiscoveredFile(NamedTuple):
+    """A file that passed classification, read exactly once from disk."""
+    path: str      # path relative to the repository root
+    content: bytes
+    hash: str      # sha256 of content
+
+
+class DiscoveryStats:
+    """Counters collected while walking and reading the repository."""
+
+    def __init__(self):
+        self.discovered_files_count = 0
+        self.skipped_files_count = 0
+        self.error_files_count = 0
+        self.bytes_read = 0
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def elapsed_seconds(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    @property
+    def files_per_second(self) -> float:
+        elapsed = self.elapsed_seconds
+        total = self.discovered_files_count + self.skipped_files_count + self.error_files_count
+        return round(total / elapsed, 1) if elapsed > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "discovery_seconds": round(self.elapsed_seconds, 3),
+            "discovery_files_per_second": self.files_per_second,
+            "discovery_bytes_read": self.bytes_read,
+        }
+
+
+def walk_repository(path: str) -> Iterator[str]:
+    """Yield the relative path of every file in the checkout, skipping .git."""
+    for root, dirs, files in os.walk(path):
+        if '.git' in dirs:
+            dirs.remove('.git')
+        for file in files:
+            yield os.path.relpath(os.path.join(root, file), path)
+
+
+def read_and_classify(root: str, relative_path: str) -> Optional[DiscoveredFile]:
+    """
+    Open the file once, verify it decodes as UTF-8 and is non-trivial, and hash it.
+    Returns None if the file should be skipped. Raises OSError on read failures.
+    """
+    with open(os.path.join(root, relative_path), 'rb') as f:
+        content = f.read()
+
+    try:
+        text = content.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+    if len(text.strip()) < MIN_CONTENT_LENGTH:
+        return None
+
+    return DiscoveredFile(relative_path, content, hashlib.sha256(content).hexdigest())
+
+
+async def discover_files(
+    path: str,
+    is_candidate: Callable[[str], bool],
+    stats: DiscoveryStats,
+    max_workers: int = DISCOVERY_WORKERS,
+    queue_size: int = DISCOVERY_QUEUE_SIZE,
+) -> AsyncIterator[DiscoveredFile]:
+    """
+    Walk the checkout and read candidate files on a thread pool.
+
+    Records are yielded through a bounded queue so that memory stays flat on very
+    large repositories: at most `queue_size` files are queued and `queue_size` more
+    read or waiting to be queued, whatever the size of the repository.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    done = object()
+    # Limit the files read but not yet queued
+    in_flight = asyncio.Semaphore(queue_size)
+
+    async def read_one(executor: ThreadPoolExecutor, relative_path: str) -> None:
+        # The slot is held until the record is in the queue, so a slow consumer stops
+        # the reads instead of piling up tasks that each hold a file's content
+        try:
+            try:
+                record = await loop.run_in_executor(executor, read_and_classify, path, relative_path)
+            except OSError as e:
+                logger.error(f"Error reading file {relative_path}: {str(e)}")
+                stats.error_files_count += 1
+                return
+
+            if record is None:
+                stats.skipped_files_count += 1
+                return
+            stats.discovered_files_count += 1
+            stats.bytes_read += len(record.content)
+            await queue.put(record)
+        finally:
+            in_flight.release()
+
+    async def produce() -> None:
+        tasks = set()
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scan-discovery") as executor:
+                relative_paths = await loop.run_in_executor(executor, lambda: list(walk_repository(path)))
+                for relative_path in relative_paths:
+                    if not is_candidate(relative_path):
+                        stats.skipped_files_count += 1
+                        continue
+                    await in_flight.acquire()
+                    task = asyncio.create_task(read_one(executor, relative_path))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                if tasks:
+                    await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            stats.finished_at = time.perf_counter()
+            # Always wake the consumer; a failure is re-raised when it awaits the producer
+            if not asyncio.current_task().cancelling():
+                await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield item
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
@@ -0,0 +1,94 @@
+# worker/grammars.py
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+from tree_sitter import Language, Parser, Tree
+
+logger = logging.getLogger(__name__)
+
+# Prebuilt shared libraries, one per language, produced by scripts/build_grammars.py
+TREE_SITTER_GRAMMAR_DIR = os.getenv(
+    "TREE_SITTER_GRAMMAR_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "build", "grammars"),
+)
+
+# Grammar repositories pinned to releases compatible with tree-sitter 0.20.x: (url, tag, subdirectory)
+GRAMMAR_SOURCES = {
+    "python": ("https://github.com/tree-sitter/tree-sitter-python", "v0.20.4", ""),
+    "javascript": ("https://github.com/tree-sitter/tree-sitter-javascript", "v0.20.1", ""),
+    "typescript": ("https://github.com/tree-sitter/tree-sitter-typescript", "v0.20.3", "typescript"),
+    "tsx": ("https://github.com/tree-sitter/tree-sitter-typescript", "v0.20.3", "tsx"),
+    "java": ("https://github.com/tree-sitter/tree-sitter-java", "v0.20.2", ""),
+    "go": ("https://github.com/tree-sitter/tree-sitter-go", "v0.20.0", ""),
+}
+
+EXTENSION_LANGUAGES = {
+    '.py': 'python',
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.ts': 'typescript', '.tsx': 'tsx',
+    '.java': 'java',
+    '.go': 'go',
+}
+
+
+class GrammarRegistry:
+    """
+    Loads prebuilt Tree-sitter grammars on first use and hands out parsers from a
+    per-thread pool, so neither compiling grammars nor creating parsers happens per file.
+    """
+
+    def __init__(self, grammar_dir: str = TREE_SITTER_GRAMMAR_DIR):
+        self.grammar_dir = grammar_dir
+        self._languages: Dict[str, Optional[Language]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def library_path(self, name: str) -> str:
+        return os.path.join(self.grammar_dir, f"{name}.so")
+
+    def available(self) -> List[str]:
+        """Languages whose shared library has been built."""
+        return [name for name in GRAMMAR_SOURCES if os.path.exists(self.library_path(name))]
+
+    def language(self, name: str) -> Optional[Language]:
+        """Return the grammar for a language, loading it on first use. None if it is not built."""
+        if name in self._languages:
+            return self._languages[name]
+        with self._lock:
+            if name not in self._languages:
+                path = self.library_path(name)
+                language = None
+                if not os.path.exists(path):
+                    logger.warning(f"Tree-sitter grammar for {name} not found at {path}; run scripts/build_grammars.py")
+                else:
+                    try:
+                        language = Language(path, name)
+                        logger.info(f"Loaded Tree-sitter grammar: {name}")
+                    except Exception as e:
+                        logger.error(f"Failed to load Tree-sitter grammar {name}: {str(e)}")
+                self._languages[name] = language
+        return self._languages[name]
+
+    def language_for_path(self, file_path: str) -> Optional[Language]:
+        """Return the grammar for a file based on its extension."""
+        name = EXTENSION_LANGUAGES.get(os.path.splitext(file_path)[1].lower())
+        return self.language(name) if name else None
+
+    def parser(self, language: Language) -> Parser:
+        """Return this thread's parser for a language. Parsers are not thread-safe, so they are never shared."""
+        parsers = getattr(self._local, "parsers", None)
+        if parsers is None:
+            parsers = self._local.parsers = {}
+        parser = parsers.get(language.name)
+        if parser is None:
+            parser = Parser()
+            parser.set_language(language)
+            parsers[language.name] = parser
+        return parser
+
+    def parse(self, language: Language, content: bytes) -> Tree:
+        return self.parser(language).parse(content)
+
+
+grammars = GrammarRegistry()
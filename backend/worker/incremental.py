@@ -0,0 +1,89 @@
+# worker/incremental.py
+import logging
+import os
+import uuid
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set
+from git import Repo
+from git.exc import GitCommandError
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeSet(NamedTuple):
+    """Paths that changed between the previously scanned commit and HEAD."""
+    base_sha: str
+    head_sha: str
+    changed: Set[str]   # added or modified, the only files that need analysis
+    deleted: Set[str]   # removed since the base commit; their findings are dropped
+
+
+def get_head_commit(path: str) -> Optional[str]:
+    """Return the commit SHA checked out at `path`, or None if it cannot be resolved."""
+    try:
+        return Repo(path).head.commit.hexsha
+    except Exception as e:
+        logger.warning(f"Could not resolve HEAD commit for {path}: {str(e)}")
+        return None
+
+
+def _has_commit(repo: Repo, sha: str) -> bool:
+    try:
+        repo.git.cat_file("-e", f"{sha}^{{commit}}")
+        return True
+    except GitCommandError:
+        return False
+
+
+def compute_change_set(path: str, base_sha: str, fetch_url: Optional[str] = None) -> Optional[ChangeSet]:
+    """
+    Diff the checkout against a previously scanned commit with `git diff --name-status`.
+    Returns None when the base commit is unknown (e.g. after a force push), in which
+    case the caller should fall back to a full scan. A shallow checkout fetches the
+    base commit from `fetch_url` when given, since origin is stored without credentials.
+    """
+    repo = Repo(path)
+    head_sha = repo.head.commit.hexsha
+    if not _has_commit(repo, base_sha):
+        # Shallow partial clones lack history; fetch just the base commit's trees
+        if os.path.exists(os.path.join(repo.git_dir, "shallow")):
+            stored_url = repo.git.remote("get-url", "origin")
+            try:
+                # Fetched through origin, as git records any other filtered remote in the config
+                repo.git.remote("set-url", "origin", fetch_url or stored_url)
+                repo.git.fetch("--depth", "1", "--filter=blob:none", "origin", base_sha)
+            except GitCommandError as e:
+                # The command line carries the clone token, so only the exit status is logged
+                logger.info(f"Could not fetch base commit {base_sha}: git exited with {e.status}")
+            finally:
+                repo.git.remote("set-url", "origin", stored_url)
+        if not _has_commit(repo, base_sha):
+            logger.info(f"Base commit {base_sha} not present in checkout; falling back to full scan")
+            return None
+
+    # Renames are reported as a delete plus an add so both paths are handled correctly
+    output = repo.git.diff("--name-status", "--no-renames", base_sha, head_sha)
+    changed, deleted = set(), set()
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        status, file_path = line.split("\t", 1)
+        if status.startswith("D"):
+            deleted.add(file_path)
+        else:
+            changed.add(file_path)
+
+    logger.info(f"Incremental diff {base_sha[:8]}..{head_sha[:8]}: {len(changed)} changed, {len(deleted)} deleted")
+    return ChangeSet(base_sha, head_sha, changed, deleted)
+
+
+def carry_forward_findings(previous_findings: Iterable[Dict[str, Any]], paths: Set[str]) -> List[Dict[str, Any]]:
+    """
+    Copy findings for files that were not re-analyzed from the previous scan.
+    Each copy gets a fresh violation_id but keeps its discovery date and status.
+    """
+    carried = []
+    for finding in previous_findings:
+        if finding.get("location") not in paths or finding.get("type") == "llm_error":
+            continue
+        carried.append({**finding, "violation_id": str(uuid.uuid4())})
+    return carried
@@ -0,0 +1,107 @@
+# worker/index_jobs.py
+"""
+Queueing for the code indexing job that runs after a scan completes.
+
+Indexing is kept off the scan's critical path: the scan worker enqueues a Cloud Task
+for /worker/index once results are saved and returns. Where Cloud Tasks is not
+configured (local development), the job runs as a background task in the same process.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Mapping
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# "queue" sends the job through Cloud Tasks, "inline" always runs it in-process
+INDEX_JOB_MODE = os.getenv("INDEX_JOB_MODE", "queue")
+
+
+def index_job_url() -> Optional[str]:
+    """URL of the worker's /worker/index endpoint, derived from the scan endpoint if not set."""
+    url = os.getenv("CLOUD_RUN_INDEX_URL")
+    if url:
+        return url
+    scan_url = os.getenv("CLOUD_RUN_WORKER_URL")
+    if scan_url and scan_url.rstrip("/").endswith("/scan"):
+        return scan_url.rstrip("/")[:-len("/scan")] + "/index"
+    return None
+
+
+_background_jobs = set()
+
+
+def _run_in_background(job: Awaitable) -> None:
+    task = asyncio.create_task(job)
+    _background_jobs.add(task)
+    task.add_done_callback(_background_jobs.discard)
+
+
+def enqueue_index_job(payload: Dict[str, Any], run_job: Callable[..., Awaitable]) -> str:
+    """
+    Queue an indexing job for a completed scan. Returns "queued" or "inline". Falls back
+    to running `run_job(**payload)` in the background if the task cannot be created.
+    """
+    url = index_job_url()
+    if INDEX_JOB_MODE == "queue" and url:
+        try:
+            from google.cloud import tasks_v2
+            from utils.clients import get_cloud_tasks_client
+            client, queue_path = get_cloud_tasks_client()
+            task = {
+                "http_request": {
+                    "http_method": tasks_v2.HttpMethod.POST,
+                    "url": url,
+                    "headers": {"Content-type": "application/json"},
+                    "body": json.dumps(payload).encode(),
+                    "oidc_token": {
+                        "service_account_email": os.getenv("GCP_SERVICE_ACCOUNT_EMAIL"),
+                    },
+                }
+            }
+            response = client.create_task(request={"parent": queue_path, "task": task})
+            logger.info(f"Queued index job {response.name} for scan {payload.get('scan_id')}")
+            return "queued"
+        except Exception as e:
+            logger.warning(f"Could not queue index job, running it in-process: {str(e)}")
+    _run_in_background(run_job(**payload))
+    return "inline"
+
+
+class CheckoutContents(Mapping):
+    """Read-only path -> text view of a checkout. Files are read only when looked up."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def __getitem__(self, relative_path: str) -> str:
+        try:
+            with open(os.path.join(self.root, relative_path), "rb") as f:
+                return f.read().decode("utf-8")
+        except (OSError, UnicodeDecodeError):
+            raise KeyError(relative_path)
+
+    def __iter__(self) -> Iterator[str]:
+        for root, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if d != ".git"]
+            for name in files:
+                yield os.path.relpath(os.path.join(root, name), self.root)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def hashes(self, include: Callable[[str], bool]) -> Dict[str, str]:
+        """Content hash of every file in the checkout for which `include(path)` is true."""
+        hashes = {}
+        for relative_path in self:
+            if not include(relative_path):
+                continue
+            try:
+                with open(os.path.join(self.root, relative_path), "rb") as f:
+                    hashes[relative_path] = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                continue
+        return hashes
@@ -0,0 +1,101 @@
+# worker/llm_cache.py
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+from pymongo import UpdateOne
+from db.init import db
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_COLLECTION = "llm_findings_cache"
+
+# Findings are stored without their file path so any copy of the content can reuse them
+PATH_FIELDS = ("location",)
+
+
+def make_cache_key(content_hash: str, prompt_version: str, model: str, temperature: float) -> str:
+    """Key parsed findings by everything that determines the LLM's answer."""
+    raw = f"{content_hash}:{prompt_version}:{model}:{temperature}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class FindingsCache:
+    """
+    Content-addressed cache of parsed LLM findings, shared across scans, repos and forks.
+
+    An in-process LRU sits in front of a MongoDB collection so repeated content within
+    a worker never leaves the process and content seen by any worker is reused.
+    """
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lru: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    def _remember(self, key: str, findings: List[Dict[str, Any]]) -> None:
+        self._lru[key] = findings
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Return cached findings for every key found in memory or MongoDB."""
+        found = {}
+        missing = []
+        for key in set(keys):
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                found[key] = self._lru[key]
+            else:
+                missing.append(key)
+
+        if missing:
+            try:
+                cursor = db.get_collection(LLM_CACHE_COLLECTION).find(
+                    {"_id": {"$in": missing}},
+                    projection={"findings": 1}
+                )
+                async for doc in cursor:
+                    found[doc["_id"]] = doc["findings"]
+                    self._remember(doc["_id"], doc["findings"])
+            except Exception as e:
+                logger.error(f"Failed to read LLM findings cache: {str(e)}")
+        return found
+
+    async def put_many(self, entries: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Store findings for newly analyzed content. Failures only cost a future cache miss."""
+        if not entries:
+            return
+        now = datetime.utcnow()
+        operations = []
+        for key, findings in entries.items():
+            stored = [{k: v for k, v in f.items() if k not in PATH_FIELDS} for f in findings]
+            self._remember(key, stored)
+            operations.append(UpdateOne(
+                {"_id": key},
+                {"$set": {"findings": stored, "created_at": now}},
+                upsert=True
+            ))
+        try:
+            await db.get_collection(LLM_CACHE_COLLECTION).bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to write LLM findings cache: {str(e)}")
+
+
+def restore_findings(findings: List[Dict[str, Any]], file_path: str) -> List[Dict[str, Any]]:
+    """Re-attach the file path to cached findings."""
+    return [{**f, "location": file_path} for f in findings]
+
+
+_findings_cache: Optional[FindingsCache] = None
+
+
+def get_findings_cache() -> FindingsCache:
+    """Return the findings cache shared by all scans in this process."""
+    global _findings_cache
+    if _findings_cache is None:
+        _findings_cache = FindingsCache()
+    return _findings_cache
@@ -0,0 +1,211 @@
+# worker/llm_dispatcher.py
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from typing import Any, Callable, Mapping, Optional
+from utils.clients import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+# Initial budgets; replaced by the provider's limits once rate-limit headers are seen
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "6"))
+
+# Exponential backoff bounds in seconds; the actual delay is drawn with full jitter
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# Rough allowance for completion tokens, which are unknown before the call
+ESTIMATED_COMPLETION_TOKENS = 1000
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as '1s', '6m0s' or '20ms' into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_prompt_tokens(text: str) -> int:
+    """Approximate token count; about four characters per token for code and English."""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    A continuously refilling budget of `capacity` units per minute.
+    Waiters are served in order so large requests are not starved by small ones.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = float(capacity)
+        self.available = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.capacity / 60.0)
+        self.updated_at = now
+
+    async def acquire(self, amount: float) -> None:
+        # A single request larger than the whole budget can never fit; cap it
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                deficit = amount - self.available
+                await asyncio.sleep(deficit * 60.0 / self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """Refund (positive) or charge (negative) units once the real usage is known."""
+        self._refill()
+        self.available = min(self.capacity, self.available + delta)
+
+    def sync(self, limit: Optional[int], remaining: Optional[int], reset_seconds: Optional[float]) -> None:
+        """Adopt the provider's view of the limit and remaining budget."""
+        self._refill()
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None and remaining < self.available:
+            self.available = float(remaining)
+            if remaining == 0 and reset_seconds:
+                # Nothing left until the window resets; back-date the refill accordingly
+                self.available = -reset_seconds * self.capacity / 60.0
+
+
+def _retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds the provider asked us to wait, from retry-after-ms or retry-after."""
+    if headers.get("retry-after-ms"):
+        return parse_reset_duration(f"{headers['retry-after-ms']}ms")
+    return parse_reset_duration(headers.get("retry-after"))
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class LLMDispatcher:
+    """
+    Process-wide gate for LLM calls shared by every scan running in the worker.
+
+    Enforces requests/min and tokens/min budgets, caps concurrent requests,
+    learns the real limits from the provider's x-ratelimit-* headers and retries
+    429 and 5xx responses with exponential backoff and full jitter.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "server_errors": 0, "tokens": 0}
+
+    def update_limits(self, headers: Mapping[str, str]) -> None:
+        """Learn limits and remaining budget from OpenAI rate-limit response headers."""
+        self.requests.sync(
+            _header_int(headers, "x-ratelimit-limit-requests"),
+            _header_int(headers, "x-ratelimit-remaining-requests"),
+            parse_reset_duration(headers.get("x-ratelimit-reset-requests")),
+        )
+        self.tokens.sync(
+            _header_int(headers, "x-ratelimit-limit-tokens"),
+            _header_int(headers, "x-ratelimit-remaining-tokens"),
+            parse_reset_duration(headers.get("x-ratelimit-reset-tokens")),
+        )
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        ceiling = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        return max(delay, retry_after or 0.0)
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        import openai
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+    async def dispatch(self, call: Callable[[], Any], estimated_tokens: int) -> Any:
+        """
+        Run a blocking raw-response call under the shared budgets.
+        `call` must return an object exposing `.headers` and `.parse()`.
+        """
+        attempt = 0
+        while True:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated_tokens)
+            try:
+                async with self._semaphore:
+                    self.stats["requests"] += 1
+                    raw = await asyncio.to_thread(call)
+            except Exception as e:
+                # The failed request still consumed its slot, but not its tokens
+                self.tokens.adjust(estimated_tokens)
+                headers = getattr(getattr(e, "response", None), "headers", None) or {}
+                if headers:
+                    self.update_limits(headers)
+                if not self._is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                if getattr(e, "status_code", None) == 429:
+                    self.stats["throttled"] += 1
+                else:
+                    self.stats["server_errors"] += 1
+                delay = self._backoff_delay(attempt, _retry_after(headers))
+                attempt += 1
+                self.stats["retries"] += 1
+                logger.warning(f"LLM call failed ({type(e).__name__}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self.update_limits(raw.headers)
+            response = raw.parse()
+            usage = getattr(response, "usage", None)
+            if usage and getattr(usage, "total_tokens", None):
+                self.stats["tokens"] += usage.total_tokens
+                self.tokens.adjust(estimated_tokens - usage.total_tokens)
+            return response
+
+    async def chat_completion(self, **kwargs: Any) -> Any:
+        """Create a chat completion through the dispatcher using the shared OpenAI client."""
+        prompt = "".join(str(m.get("content", "")) for m in kwargs.get("messages", []))
+        estimated = estimate_prompt_tokens(prompt) + ESTIMATED_COMPLETION_TOKENS
+        client = get_openai_client()
+        return await self.dispatch(lambda: client.chat.completions.with_raw_response.create(**kwargs), estimated)
+
+
+_dispatcher: Optional[LLMDispatcher] = None
+
+
+def get_llm_dispatcher() -> LLMDispatcher:
+    """Return the dispatcher shared by all scans in this worker process."""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = LLMDispatcher()
+    return _dispatcher
@@ -0,0 +1,196 @@
+# worker/repo_cache.py
+import fcntl
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+from urllib.parse import urlparse, urlunparse
+from git import GitCommandError, Repo
+
+logger = logging.getLogger(__name__)
+
+MIRROR_CACHE_DIR = os.getenv("REPO_MIRROR_CACHE_DIR", "/tmp/repo-mirrors")
+MIRROR_CACHE_BUDGET_BYTES = int(os.getenv("REPO_MIRROR_CACHE_BUDGET_MB", "4096")) * 1024 * 1024
+
+# Only branches and tags are mirrored; GitLab's merge-request refs are never scanned
+FETCH_REFSPECS = ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+LAST_USED_MARKER = "auditflow-last-used"
+
+
+def strip_credentials(url: str) -> str:
+    """Remove any user:token@ prefix so credentials are never persisted in the mirror config."""
+    parsed = urlparse(url)
+    netloc = parsed.hostname or ""
+    if parsed.port:
+        netloc += f":{parsed.port}"
+    return urlunparse(parsed._replace(netloc=netloc))
+
+
+def directory_size(path: str) -> int:
+    """Total size in bytes of all files below `path`."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class RepoMirrorCache:
+    """
+    Local cache of bare repository mirrors keyed by GitLab project id.
+
+    Each scan fetches into the cached mirror and checks out a detached worktree,
+    so only new objects cross the network. Mirrors are evicted least-recently-used
+    first once the cache exceeds its disk budget. A file lock per project serializes
+    fetches and worktree changes across threads and worker processes.
+    """
+
+    def __init__(self, cache_dir: str = MIRROR_CACHE_DIR, budget_bytes: int = MIRROR_CACHE_BUDGET_BYTES):
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _mirror_path(self, repo_id: int) -> str:
+        return os.path.join(self.cache_dir, f"{repo_id}.git")
+
+    @contextmanager
+    def _lock(self, repo_id: int, blocking: bool = True) -> Iterator[bool]:
+        """Hold an exclusive lock for a project's mirror. Yields False if non-blocking and busy."""
+        lock_path = os.path.join(self.cache_dir, f"{repo_id}.lock")
+        with open(lock_path, "a") as lock_file:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_file, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _touch(self, mirror_path: str) -> None:
+        marker = os.path.join(mirror_path, LAST_USED_MARKER)
+        with open(marker, "a"):
+            os.utime(marker, None)
+
+    def _sync_mirror(self, repo_id: int, clone_url: str) -> Repo:
+        """Create the mirror on first use, otherwise fetch new objects into it."""
+        mirror_path = self._mirror_path(repo_id)
+        if os.path.exists(os.path.join(mirror_path, "HEAD")):
+            mirror = Repo(mirror_path)
+            started = time.perf_counter()
+            # The token rotates, so the authenticated URL is passed per fetch rather than stored
+            mirror.git.fetch("--prune", clone_url, *FETCH_REFSPECS)
+            logger.info(f"Fetched repo {repo_id} into mirror in {time.perf_counter() - started:.2f}s")
+        else:
+            if os.path.exists(mirror_path):
+                shutil.rmtree(mirror_path)
+            started = time.perf_counter()
+            mirror = Repo.clone_from(clone_url, mirror_path, bare=True)
+            logger.info(f"Created mirror for repo {repo_id} in {time.perf_counter() - started:.2f}s")
+        mirror.git.remote("set-url", "origin", strip_credentials(clone_url))
+        self._update_head(repo_id, mirror, clone_url)
+        return mirror
+
+    def _update_head(self, repo_id: int, mirror: Repo, clone_url: str) -> None:
+        """
+        Point the mirror's HEAD at the project's current default branch. Fetches only
+        update the mirrored refs, so a renamed default branch would otherwise leave HEAD
+        dangling, or still on the old branch while it exists.
+        """
+        try:
+            output = mirror.git.ls_remote("--symref", clone_url, "HEAD")
+        except GitCommandError as e:
+            # The command line carries the clone token, so only the exit status is logged
+            logger.warning(f"Could not resolve the default branch of repo {repo_id}: git exited with {e.status}")
+            return
+        for line in output.splitlines():
+            if line.startswith("ref: ") and line.endswith("\tHEAD"):
+                mirror.git.symbolic_ref("HEAD", line[len("ref: "):-len("\tHEAD")])
+                return
+
+    def checkout(self, repo_id: int, clone_url: str, worktree_path: str) -> str:
+        """
+        Fetch the project into its mirror and create a detached worktree at `worktree_path`.
+        If the mirror can't provide one, the project is cloned to `worktree_path` instead.
+        """
+        with self._lock(repo_id):
+            if os.path.exists(worktree_path):
+                shutil.rmtree(worktree_path)
+            try:
+                mirror = self._sync_mirror(repo_id, clone_url)
+                mirror.git.worktree("prune")
+                mirror.git.worktree("add", "--detach", worktree_path, "HEAD")
+                self._touch(mirror.git_dir)
+            except GitCommandError as e:
+                logger.warning(f"Mirror checkout of repo {repo_id} failed (git exited with {e.status}), cloning instead")
+                if os.path.exists(worktree_path):
+                    shutil.rmtree(worktree_path)
+                Repo.clone_from(clone_url, worktree_path).git.remote("set-url", "origin", strip_credentials(clone_url))
+                return worktree_path
+        logger.info(f"Checked out repo {repo_id} worktree at {worktree_path}")
+
+        try:
+            self.evict()
+        except Exception as e:
+            logger.warning(f"Mirror cache eviction failed: {str(e)}")
+        return worktree_path
+
+    def release(self, repo_id: int, worktree_path: str) -> None:
+        """Remove a worktree created by `checkout`. The mirror itself stays cached."""
+        mirror_path = self._mirror_path(repo_id)
+        with self._lock(repo_id):
+            try:
+                Repo(mirror_path).git.worktree("remove", "--force", worktree_path)
+            except Exception as e:
+                logger.warning(f"Failed to remove worktree {worktree_path}: {str(e)}")
+                if os.path.exists(worktree_path):
+                    shutil.rmtree(worktree_path)
+                if os.path.exists(mirror_path):
+                    Repo(mirror_path).git.worktree("prune")
+
+    def _list_mirrors(self) -> List[Tuple[float, int, str]]:
+        """Return (last_used, size_bytes, repo_id) for every cached mirror, oldest first."""
+        mirrors = []
+        for entry in os.listdir(self.cache_dir):
+            if not entry.endswith(".git"):
+                continue
+            mirror_path = os.path.join(self.cache_dir, entry)
+            marker = os.path.join(mirror_path, LAST_USED_MARKER)
+            last_used = os.path.getmtime(marker) if os.path.exists(marker) else 0.0
+            mirrors.append((last_used, directory_size(mirror_path), entry[:-len(".git")]))
+        mirrors.sort()
+        return mirrors
+
+    def evict(self) -> int:
+        """
+        Delete least-recently-used mirrors until the cache fits its disk budget.
+        Mirrors that are locked or still have worktrees checked out are skipped.
+        Returns the number of bytes freed.
+        """
+        mirrors = self._list_mirrors()
+        total = sum(size for _, size, _ in mirrors)
+        freed = 0
+        for _, size, repo_id in mirrors:
+            if total - freed <= self.budget_bytes:
+                break
+            with self._lock(repo_id, blocking=False) as acquired:
+                if not acquired:
+                    continue
+                mirror_path = self._mirror_path(repo_id)
+                worktrees_dir = os.path.join(mirror_path, "worktrees")
+                if os.path.isdir(worktrees_dir) and os.listdir(worktrees_dir):
+                    continue
+                shutil.rmtree(mirror_path, ignore_errors=True)
+                freed += size
+                logger.info(f"Evicted mirror for repo {repo_id} ({size / (1024 * 1024):.1f} MB)")
+        return freed
+
+
+mirror_cache = RepoMirrorCache()
@@ -1,30 +1,45 @@
 # worker/routes.py
 import logging
 from fastapi import APIRouter, Request, HTTPException
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set, Tuple
 import os
 import shutil
+import subprocess
+import tempfile
+import time
+import resource
 from git import Repo
-import requests
 from db.init import db
 from datetime import datetime
 from bson.objectid import ObjectId, InvalidId
 from urllib.parse import urlparse, urlunparse
 import hashlib
 import json
-import gzip
-from google.cloud import storage
-import tree_sitter
-from tree_sitter import Language, Parser
-from pinecone import Pinecone
+from tree_sitter import Language
 from config import settings
+from utils.project_cache import get_project_cache
 import mimetypes
-import re
-from openai import OpenAI
 import asyncio
 import uuid
-from db.crud_scan import ScanCRUD
+from db.crud_scan import ScanCRUD, without_findings
+from db.crud_file_metadata import FileMetadataCRUD
 from ws.connection_manager import manager
+from worker.discovery import DiscoveryStats, discover_files
+from worker.batching import LLM_BATCH_TOKEN_BUDGET, BatchItem, build_batches, resplit_batch, split_file
+from worker.llm_cache import get_findings_cache, make_cache_key, restore_findings
+from worker.llm_dispatcher import estimate_prompt_tokens, get_llm_dispatcher
+from worker.static_rules import STATIC_RULE_SUMMARY, run_static_rules
+from worker.rules_engine import RULES_ENGINE_ENABLED, get_rules_engine
+from worker.grammars import grammars
+from worker.ast_codec import CompactAST, encode_tree
+from functools import lru_cache
+from search.hybrid import get_search_index
+from search.vector_store import path_prefixes
+from worker.ast_archive import AST_ARCHIVE_ENABLED, get_ast_archive_backend, write_scan_archive
+from worker.chunk_indexer import CHUNK_INDEXING_ENABLED, ChunkIndexer
+from worker.index_jobs import CheckoutContents, enqueue_index_job
+from worker.repo_cache import directory_size, mirror_cache, strip_credentials
+from worker.incremental import carry_forward_findings, compute_change_set, get_head_commit
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,39 +47,33 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/worker", tags=["worker"])
 
-# Initialize Google Cloud Storage client
-storage_client = storage.Client()
-bucket = storage_client.bucket("ast-storage-auditflow-ai")
-
-# Initialize Pinecone client for semantic code search
-try:
-    pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-    index = pc.Index(settings.PINECONE_INDEX_NAME)  # Use 'auditflow-embeddings' from config
-    logger.info(f"Pinecone initialized with index: {settings.PINECONE_INDEX_NAME}")
-except Exception as e:
-    logger.error(f"Failed to initialize Pinecone: {str(e)}")
-    pc = None
-    index = None
-
-# Initialize Tree-sitter
-Language.build_library(
-    'build/my-languages.so',
-    [
-        'vendor/tree-sitter-python',
-        'vendor/tree-sitter-javascript',
-        'vendor/tree-sitter-java'
-    ]
-)
+# GCS and Pinecone clients are created on first use (utils/clients.py)
+
+# Tree-sitter grammars are prebuilt at image build time (scripts/build_grammars.py)
+# and loaded on first use, so startup never compiles them.
 
-PY_LANGUAGE = Language('build/my-languages.so', 'python')
-JS_LANGUAGE = Language('build/my-languages.so', 'javascript')
-JAVA_LANGUAGE = Language('build/my-languages.so', 'java')
+# The code quality rules engine is built by the first scan that needs it, and compiles
+# each language's rule query the first time it meets a file in that language
 
 CODE_FILE_EXTENSIONS = {
     '.py', '.js', '.jsx', '.ts', '.tsx', '.java', '.c', '.cpp', '.h', '.hpp',
     '.go', '.rb', '.php', '.rs', '.swift', '.kt', '.scala', '.clj', '.hs', '.ml', '.fs', '.vb', '.cs'
 }
 
+# How scans obtain a checkout: "mirror" reuses a cached bare mirror and worktree,
+# "partial" performs a shallow, blob-filtered sparse clone of analyzable files only,
+# "full" performs a fresh full clone every time.
+SCAN_CLONE_MODE = os.getenv("SCAN_CLONE_MODE", "mirror")
+SCAN_BLOB_SIZE_LIMIT = os.getenv("SCAN_BLOB_SIZE_LIMIT", "1m")
+
+# Target size of a search index chunk; stays inside the embedding model's input limit
+INDEX_CHUNK_TOKENS = int(os.getenv("INDEX_CHUNK_TOKENS", "400"))
+
+LLM_MODEL = "gpt-4o"
+LLM_TEMPERATURE = 0.1
+# Bump whenever make_llm_analysis_prompt changes so cached findings are not reused
+LLM_PROMPT_VERSION = "3"
+
 PACKAGE_CONFIG_FILES = {
     'package.json', 'requirements.txt', 'Pipfile', 'pyproject.toml', 'setup.py',
     'package-lock.json', 'pnpm-lock.yaml', 'yarn.lock', 'tsconfig.json', 'tailwind.config.ts',
@@ -74,117 +83,67 @@ PACKAGE_CONFIG_FILES = {
 
 def get_language_parser(file_path: str) -> Optional[Language]:
     """Get the appropriate Tree-sitter language parser based on file extension."""
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext == '.py':
-        return PY_LANGUAGE
-    elif ext in ['.js', '.jsx', '.ts', '.tsx']:
-        return JS_LANGUAGE
-    elif ext in ['.java']:
-        return JAVA_LANGUAGE
-    return None
+    return grammars.language_for_path(file_path)
 
 def compute_file_hash(content: str) -> str:
     """Compute SHA256 hash of file content."""
     return hashlib.sha256(content.encode()).hexdigest()
 
-def chunk_file(content: str, max_lines: int = 500) -> List[str]:
-    """Split file content into chunks based on functions/classes or line count."""
-    chunks = []
-    current_chunk = []
-    current_lines = 0
-    
-    for line in content.split('\n'):
-        current_chunk.append(line)
-        current_lines += 1
-        
-        # Check if we've hit a function/class boundary or max lines
-        if (line.strip().startswith(('def ', 'class ')) or current_lines >= max_lines) and current_chunk:
-            chunks.append('\n'.join(current_chunk))
-            current_chunk = []
-            current_lines = 0
-    
-    # Add any remaining lines
-    if current_chunk:
-        chunks.append('\n'.join(current_chunk))
-    
-    return chunks
+# Recently parsed ASTs, so chunking and archiving in one scan parse each file once
+AST_CACHE_SIZE = int(os.getenv("AST_CACHE_SIZE", "256"))
 
-def generate_ast(file_path: str, content: str) -> Dict[str, Any]:
-    """Generate AST for a file using Tree-sitter."""
+@lru_cache(maxsize=AST_CACHE_SIZE)
+def _parse_compact(language_name: str, content: str) -> CompactAST:
+    language = grammars.language(language_name)
+    return encode_tree(grammars.parse(language, bytes(content, 'utf8')), language_name)
+
+def get_file_ast(file_path: str, content: str) -> Optional[CompactAST]:
+    """Parse a file into a compact AST (worker/ast_codec.py), or None if it has no grammar."""
     language = get_language_parser(file_path)
     if not language:
         return None
-    
-    parser = Parser()
-    parser.set_language(language)
-    tree = parser.parse(bytes(content, 'utf8'))
+    return _parse_compact(language.name, content)
+
+def generate_ast(file_path: str, content: str) -> Dict[str, Any]:
+    """Generate AST for a file using Tree-sitter."""
+    tree = get_file_ast(file_path, content)
+    if tree is None:
+        return None
     
     return {
         'type': 'ast',
-        'language': language.name,
-        'tree': tree.root_node.sexp(),
+        'language': tree.language,
+        'tree': tree,
         'file_path': file_path
     }
 
-def store_ast(ast: Dict[str, Any], repo_id: int) -> str:
-    """Store AST in GCS bucket."""
-    file_path = f"asts/{repo_id}/{ast['file_path']}.json.gz"
-    blob = bucket.blob(file_path)
-    
-    # Compress and store
-    compressed = gzip.compress(json.dumps(ast).encode())
-    blob.upload_from_string(compressed, content_type='application/json')
-    
-    return file_path
+def archive_scan_asts(repo_id: int, scan_id: str, contents: Dict[str, str], file_hashes: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Store the ASTs of a scan as a single packed, content-addressed archive object.
+    ASTs of files unchanged since the previous archive are referenced, not re-uploaded.
+    """
+    parsable = {path: file_hash for path, file_hash in file_hashes.items() if get_language_parser(path)}
+    return write_scan_archive(get_ast_archive_backend(), repo_id, scan_id, contents, parsable, generate_ast)
 
-def store_code_chunk_in_pinecone(chunk_id: str, code_chunk: str, metadata: Dict[str, Any]) -> None:
-    """Store code chunk in Pinecone for semantic search."""
-    if not index:
-        logger.warning("Pinecone not available, skipping code chunk storage")
-        return
-    try:
-        # Create record for Pinecone with integrated embedding
-        record = {
-            "_id": chunk_id,
-            "text": code_chunk,  # Field must be 'text' to match the index's default field_map
-            "repo_id": metadata['repo_id'],
-            "file_path": metadata['file_path'],
-            "chunk_index": metadata['chunk_index'],
-            "language": metadata.get('language', 'unknown'),
-            "ast_path": metadata.get('ast_path'),
-            "timestamp": datetime.utcnow().isoformat(),
-            "file_hash": metadata.get('file_hash'),
-            "chunk_type": metadata.get('chunk_type', 'code')
-        }
-        # Upsert to Pinecone with integrated embedding, using '__default__' namespace
-        index.upsert_records("__default__", [record])
-        logger.info(f"Stored code chunk in Pinecone: {chunk_id}")
-    except Exception as e:
-        logger.error(f"Failed to store code chunk in Pinecone: {str(e)}")
-        # Fallback to MongoDB for critical data
-        try:
-            import asyncio
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                loop.create_task(store_chunk_in_mongodb(chunk_id, code_chunk, metadata))
-            else:
-                loop.run_until_complete(store_chunk_in_mongodb(chunk_id, code_chunk, metadata))
-            logger.info(f"Stored code chunk in MongoDB fallback: {chunk_id}")
-        except Exception as mongo_error:
-            logger.error(f"Failed to store code chunk in MongoDB fallback: {str(mongo_error)}")
-
-async def store_chunk_in_mongodb(chunk_id: str, code_chunk: str, metadata: Dict[str, Any]) -> None:
-    """Fallback storage for code chunks in MongoDB."""
-    try:
-        chunks_collection = db.get_collection("text_chunks")
-        await chunks_collection.insert_one({
-            "chunk_id": chunk_id,
-            "text": code_chunk,
-            "metadata": metadata,
-            "created_at": datetime.utcnow()
+def make_index_chunks(file_path: str, content: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Split a file into the chunks indexed for semantic search, with their metadata.
+    Chunks are cut at function and class boundaries where the file has a grammar.
+    """
+    ast = get_file_ast(file_path, content)
+    language = ast.language if ast is not None else "unknown"
+    # Lets the vector store filter by directory inside the index
+    path_dirs = path_prefixes(file_path)[:-1]
+    return [
+        (fragment.content, {
+            "language": language,
+            **({"path_dirs": path_dirs} if path_dirs else {}),
+            "start_line": fragment.line_offset + 1,
+            "end_line": fragment.line_offset + fragment.content.count('\n') + 1,
         })
-    except Exception as e:
-        logger.error(f"Failed to store chunk in MongoDB: {str(e)}")
+        for fragment in split_file(file_path, content, INDEX_CHUNK_TOKENS, ast=ast)
+        if fragment.content.strip()
+    ]
 
 async def get_gitlab_repo_clone_url(repo_id: int, user_id: str) -> str:
     """Get the clone URL for a GitLab repository."""
@@ -201,14 +160,10 @@ async def get_gitlab_repo_clone_url(repo_id: int, user_id: str) -> str:
         gitlab_token = user["access_token"]
 
         # Call GitLab API to get repository details
-        headers = {"Authorization": f"Bearer {gitlab_token}"}
-        response = requests.get(
-            f"https://gitlab.com/api/v4/projects/{repo_id}",
-            headers=headers
-        )
-        response.raise_for_status()
-        
-        repo_data = response.json()
+        # Usually cached when the API created the scan
+        repo_data = await get_project_cache().get_project(repo_id, user_id, gitlab_token)
+        if repo_data is None:
+            raise Exception(f"GitLab project {repo_id} not found or not accessible")
         repo_url = repo_data["http_url_to_repo"]
 
         # Embed the access token in the clone URL
@@ -222,20 +177,89 @@ async def get_gitlab_repo_clone_url(repo_id: int, user_id: str) -> str:
         logger.error(f"Failed to get GitLab repo URL: {str(e)}")
         raise
 
-def clone_repo(clone_url: str, path: str) -> None:
-    """Clone a Git repository to the specified path."""
+def clone_repo(clone_url: str, path: str, partial: bool = False) -> int:
+    """
+    Clone a Git repository to the specified path.
+
+    With `partial=True` the clone is shallow, omits blobs larger than
+    SCAN_BLOB_SIZE_LIMIT and sparsely checks out only files with an analyzable
+    extension, so images, lockfiles and vendored binaries never reach disk.
+    Returns the peak RSS in KB of the git processes involved (0 if not measured).
+    """
     try:
         # Remove directory if it exists
         if os.path.exists(path):
             shutil.rmtree(path)
         
-        # Clone the repository
-        Repo.clone_from(clone_url, path)
+        peak_rss_kb = 0
+        if partial:
+            peak_rss_kb = max(
+                run_git(["clone", f"--filter=blob:limit={SCAN_BLOB_SIZE_LIMIT}", "--depth", "1", "--no-checkout", clone_url, path]),
+                run_git(["config", "core.sparseCheckout", "true"], cwd=path),
+            )
+            # Written directly rather than via `git sparse-checkout set`, whose default mode differs across git versions
+            with open(os.path.join(path, ".git", "info", "sparse-checkout"), "w") as f:
+                f.write(sparse_checkout_patterns())
+            peak_rss_kb = max(peak_rss_kb, run_git(["read-tree", "-mu", "HEAD"], cwd=path))
+        else:
+            # Clone the repository
+            Repo.clone_from(clone_url, path)
+        # As with the mirrors, keep the token out of the checkout's .git/config
+        run_git(["remote", "set-url", "origin", strip_credentials(clone_url)], cwd=path)
         logger.info(f"Successfully cloned repository to {path}")
+        return peak_rss_kb
     except Exception as e:
         logger.error(f"Failed to clone repository: {str(e)}")
         raise
 
+def sparse_checkout_patterns() -> str:
+    """Build non-cone sparse-checkout patterns matching every analyzable file extension."""
+    return "".join(f"*{ext}\n" for ext in sorted(CODE_FILE_EXTENSIONS))
+
+def run_git(args: List[str], cwd: Optional[str] = None) -> int:
+    """
+    Run a git command and return the peak RSS of the child process in KB.
+    The child is reaped with wait4 since RUSAGE_CHILDREN only reports a lifetime maximum.
+    """
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(["git", *args], cwd=cwd, stdout=subprocess.DEVNULL, stderr=stderr)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode != 0:
+            stderr.seek(0)
+            # Never echo the command line, it contains the clone token
+            raise Exception(f"git {args[0]} failed: {stderr.read().decode(errors='replace').strip()}")
+    return usage.ru_maxrss
+
+def checkout_repo(repo_id: int, clone_url: str, path: str) -> Dict[str, Any]:
+    """
+    Check out a repository for scanning according to SCAN_CLONE_MODE and return
+    clone metrics (duration, bytes on disk and peak RSS) for the scan summary.
+    """
+    started = time.perf_counter()
+    git_peak_rss_kb = 0
+    if SCAN_CLONE_MODE == "mirror":
+        mirror_cache.checkout(repo_id, clone_url, path)
+    else:
+        git_peak_rss_kb = clone_repo(clone_url, path, partial=SCAN_CLONE_MODE == "partial")
+    metrics = {
+        "clone_mode": SCAN_CLONE_MODE,
+        "clone_seconds": round(time.perf_counter() - started, 3),
+        "checkout_bytes": directory_size(path),
+        "worker_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if git_peak_rss_kb:
+        metrics["git_peak_rss_mb"] = round(git_peak_rss_kb / 1024, 1)
+    logger.info(f"Checkout metrics for repo {repo_id}: {metrics}")
+    return metrics
+
+def cleanup_checkout(repo_id: int, path: str) -> None:
+    """Remove a checkout created by checkout_repo."""
+    if SCAN_CLONE_MODE == "mirror":
+        mirror_cache.release(repo_id, path)
+    elif os.path.exists(path):
+        shutil.rmtree(path)
+
 def is_text_file(file_path: str) -> bool:
     """Check if a file is a text file that should be processed."""
     # Skip .git directory entirely
@@ -300,43 +324,36 @@ def is_code_file(file_path: str) -> bool:
         return False
     return ext in CODE_FILE_EXTENSIONS
 
-def should_send_to_llm(file_path: str, content: str, static_findings: list) -> bool:
-    # Send to LLM if static rules found something, or if file is 'interesting' (e.g., contains class/function definitions)
-    if static_findings:
-        return True
-    if re.search(r'(def |class |function |public |private |protected )', content):
-        return True
+# Line comment markers per extension. Block comments can share a line with code, so
+# their lines count as code; OCaml has no line comments at all.
+COMMENT_PREFIXES = {
+    '.py': ('#',), '.rb': ('#',), '.hs': ('--',), '.clj': (';',),
+    '.ml': (), '.vb': ("'",),
+}
+DEFAULT_COMMENT_PREFIXES = ('//',)
+
+def should_send_to_llm(file_path: str, content: str) -> bool:
+    """
+    Every file with code goes to the LLM; the static rules only report pattern-level
+    issues, so neither their findings nor their silence means a file was reviewed.
+    Only files that are empty or nothing but line comments are skipped.
+    """
+    prefixes = COMMENT_PREFIXES.get(os.path.splitext(file_path)[1].lower(), DEFAULT_COMMENT_PREFIXES)
+    for line in content.splitlines():
+        line = line.strip()
+        if line and not line.startswith(prefixes):
+            return True
     return False
 
-def batch_files_for_llm(files: List[tuple], batch_size_bytes: int = 100000) -> List[List[tuple]]:
+def batch_files_for_llm(files: List[tuple], token_budget: int = LLM_BATCH_TOKEN_BUDGET) -> List[List[BatchItem]]:
     """
-    Batches files for LLM analysis based on total size to avoid exceeding context window limits.
-    Aims for batches under a certain byte size as a proxy for token count.
+    Batches files for LLM analysis by estimated token count to fill, but not exceed, the
+    context window. Oversized files are split at function and class boundaries instead
+    of being skipped.
     """
-    batches = []
-    current_batch = []
-    current_batch_size = 0
-    for file_path, content in files:
-        file_size = len(content)
-        if file_size > batch_size_bytes:
-            # Handle files that are too large on their own
-            logger.warning(f"Skipping file {file_path} as it exceeds the single-file size limit of {batch_size_bytes} bytes.")
-            continue
-        
-        if current_batch and current_batch_size + file_size > batch_size_bytes:
-            batches.append(current_batch)
-            current_batch = []
-            current_batch_size = 0
-        
-        current_batch.append((file_path, content))
-        current_batch_size += file_size
-    
-    if current_batch:
-        batches.append(current_batch)
-        
-    return batches
+    return build_batches(files, get_language_parser, token_budget, get_file_ast)
 
-def make_llm_analysis_prompt(file_batch: List[tuple]) -> str:
+def make_llm_analysis_prompt(file_batch: List[BatchItem]) -> str:
     """
     Creates a detailed, structured prompt for the LLM to perform code analysis.
     """
@@ -357,7 +374,11 @@ Each finding object in the JSON array must have the following structure:
   }
 }
 
-Respond with a single JSON object where keys are the file paths and values are the JSON array of findings for that file. Example:
+The following issues are already detected by static rules and must NOT be reported: """ + STATIC_RULE_SUMMARY + """. Focus on issues that require understanding the code's behavior.
+
+Some entries are fragments of a larger file; their key ends in "#L<first>-<last>". For fragments, report line numbers relative to the first line of the fragment.
+
+Respond with a single JSON object where keys are the file keys exactly as given and values are the JSON array of findings for that file. Example:
 {
   "src/user/routes.py": [
     {
@@ -375,41 +396,68 @@ Respond with a single JSON object where keys are the file paths and values are t
 ---
 Files to analyze:
 """
-    for file_path, content in file_batch:
-        prompt += f"\n--- FILE: {file_path} ---\n```\n{content}\n```\n"
+    for item in file_batch:
+        prompt += f"\n--- FILE: {item.key} ---\n```\n{item.content}\n```\n"
 
     return prompt
 
-async def call_llm_for_analysis(file_batch: List[tuple]) -> List[Dict]:
+def normalize_llm_file_key(key: str) -> str:
+    """The LLM sometimes echoes a file key as "./src/a.py" or "/src/a.py"; strip that back off."""
+    key = key.strip().replace("\\", "/")
+    while key.startswith("./"):
+        key = key[2:]
+    return key.lstrip("/")
+
+def is_context_length_error(error: Exception) -> bool:
+    """True if the provider rejected the request because the prompt is too long."""
+    import openai
+    return isinstance(error, openai.BadRequestError) and (
+        getattr(error, "code", None) == "context_length_exceeded" or "maximum context length" in str(error)
+    )
+
+async def call_llm_for_analysis(file_batch: List[BatchItem]) -> Tuple[List[Dict], Set[str]]:
     """
     Calls the OpenAI API with a batch of files and parses the structured JSON response.
+    Batches rejected for context length are re-split and retried automatically.
+    Returns the findings and the paths of files whose analysis failed.
     """
     all_findings = []
     if not settings.OPENAI_API_KEY:
         logger.warning("OpenAI API key not configured. Skipping LLM analysis.")
-        return all_findings
+        return all_findings, set()
+
+    items_by_key = {item.key: item for item in file_batch}
+    items_by_key.update({normalize_llm_file_key(item.key): item for item in file_batch})
 
     prompt = make_llm_analysis_prompt(file_batch)
     
+    response = None
     try:
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
-            model="gpt-4o",
+        # Rate limits, concurrency and retries are handled by the process-wide dispatcher
+        response = await get_llm_dispatcher().chat_completion(
+            model=LLM_MODEL,
             messages=[{"role": "user", "content": prompt}],
             response_format={"type": "json_object"},
-            temperature=0.1
+            temperature=LLM_TEMPERATURE
         )
         
         response_text = response.choices[0].message.content
         analysis_results = json.loads(response_text)
 
-        for file_path, findings_list in analysis_results.items():
+        unmatched_keys = []
+        for file_key, findings_list in analysis_results.items():
+            item = items_by_key.get(file_key) or items_by_key.get(normalize_llm_file_key(file_key))
+            if item is None and findings_list:
+                unmatched_keys.append(file_key)
+            file_path = item.path if item else file_key
             if isinstance(findings_list, list):
                 for finding in findings_list:
                     # Validate the structure of the finding from the LLM
                     if all(k in finding for k in ["type", "category", "severity", "description", "recommendation", "location"]):
                         # Flatten the structure to match what the rest of the system expects
+                        line = finding["location"].get("line") if isinstance(finding["location"], dict) else None
+                        if item and isinstance(line, int):
+                            line += item.line_offset  # Fragment lines are relative to the fragment
                         flat_finding = {
                             "type": finding["type"],
                             "category": finding["category"],
@@ -417,25 +465,51 @@ async def call_llm_for_analysis(file_batch: List[tuple]) -> List[Dict]:
                             "description": finding["description"],
                             "recommendation": finding.get("recommendation"),
                             "location": file_path, # Top-level location is the file path
-                            "line": finding["location"].get("line")
+                            "line": line
                         }
                         all_findings.append(flat_finding)
                     else:
                         logger.warning(f"Malformed finding from LLM for file {file_path}: {finding}")
 
-    except json.JSONDecodeError:
+        if unmatched_keys:
+            # Findings that can't be tied to a file could belong to any file of the batch,
+            # so none of them is cached or marked as scanned as if it were clean
+            logger.warning(f"LLM returned findings for unknown files {unmatched_keys}; not caching this batch")
+            return all_findings, {item.path for item in file_batch}
+
+    except json.JSONDecodeError as e:
         logger.error(f"LLM returned malformed JSON. Raw response: {response.choices[0].message.content if response else 'No response'}")
+        # Reported as a failed batch so its files are neither cached nor marked as scanned
+        all_findings.append({
+            "type": "llm_error",
+            "category": "quality",
+            "severity": "high",
+            "description": f"The AI code analysis returned malformed JSON for a batch of files. Error: {str(e)}",
+            "location": "LLM Analysis Step"
+        })
+        return all_findings, {item.path for item in file_batch}
     except Exception as e:
+        if is_context_length_error(e):
+            smaller_batches = resplit_batch(file_batch, get_language_parser, get_file_ast)
+            if smaller_batches:
+                logger.warning(f"Batch of {len(file_batch)} items exceeded the context window; retrying as {len(smaller_batches)} batches")
+                results = await asyncio.gather(*[call_llm_for_analysis(b) for b in smaller_batches])
+                failed_paths = set()
+                for findings, failed in results:
+                    all_findings.extend(findings)
+                    failed_paths |= failed
+                return all_findings, failed_paths
         logger.error(f"LLM analysis failed for batch: {str(e)}")
         all_findings.append({
             "type": "llm_error",
             "category": "quality",
-                "severity": "high",
+            "severity": "high",
             "description": f"The AI code analysis failed for a batch of files. Error: {str(e)}",
             "location": "LLM Analysis Step"
         })
+        return all_findings, {item.path for item in file_batch}
     
-    return all_findings
+    return all_findings, set()
 
 def calculate_overall_scores(findings: List[Dict]) -> Dict[str, Any]:
     """
@@ -576,75 +650,198 @@ def get_risk_level(severity: str) -> str:
     }
     return risk_map.get(severity, "Medium")
 
-async def run_ai_compliance_scan(path: str, repo_id: int) -> Dict[str, Any]:
+async def run_ai_compliance_scan(
+    path: str,
+    repo_id: int,
+    user_id: str,
+    previous_scan: Optional[Dict[str, Any]] = None,
+    scan_id: Optional[str] = None,
+    clone_url: Optional[str] = None,
+) -> Tuple[Dict[str, Any], Dict[str, str]]:
     """
     Performs the main analysis of the repository using a powerful LLM for all code files.
+
+    When `previous_scan` recorded the commit it ran against, only files added or
+    modified since that commit are analyzed and findings for every other file are
+    carried forward. When `scan_id` is given, the ASTs of the scanned tree are archived
+    under it. `clone_url` authenticates fetching that commit into a shallow checkout.
+    Returns the scan results and the hashes of files that were successfully analyzed.
     """
     # --- Initialization ---
     all_findings = []
     processed_files_count = 0
     skipped_files_count = 0
     error_files_count = 0
-    file_metadata_collection = db.get_collection("file_metadata")
     files_for_llm = []
+    # Hashes of files sent for analysis, keyed by path. Only committed once their
+    # findings have been saved so a crash mid-scan never marks a file as scanned.
+    pending_hashes = {}
+    analyzed_hashes = {}
+    known_hashes = await FileMetadataCRUD.get_hash_map(repo_id, user_id)
 
-    # --- File Traversal and Collection ---
-    for root, dirs, files in os.walk(path):
-        # Skip directories like .git
-        if '.git' in dirs:
-            dirs.remove('.git')
+    # --- Incremental Mode: diff against the previously scanned commit ---
+    head_sha = await asyncio.to_thread(get_head_commit, path)
+    previous_results = (previous_scan or {}).get("results") or {}
+    previous_findings = await ScanCRUD.get_scan_findings(str(previous_scan["_id"])) if previous_scan else []
+    previous_sha = previous_results.get("scan_summary", {}).get("commit_sha")
+    change_set = None
+    if previous_sha and head_sha:
+        change_set = await asyncio.to_thread(compute_change_set, path, previous_sha, clone_url)
 
-        for file in files:
-            file_path = os.path.join(root, file)
-            relative_path = os.path.relpath(file_path, path)
-            
-            # We only want to analyze text-based code files
-            if not is_code_file(relative_path) or not can_read_as_text(file_path):
+    if change_set is not None:
+        scan_mode = "incremental"
+        # Files that failed analysis last time, or were never hashed, are retried too
+        retry_paths = set(previous_results.get("unanalyzed_paths", []))
+        def is_candidate(relative_path: str) -> bool:
+            return is_code_file(relative_path) and (
+                relative_path in change_set.changed
+                or relative_path in retry_paths
+                or relative_path not in known_hashes
+            )
+        await FileMetadataCRUD.delete_paths(repo_id, user_id, change_set.deleted)
+    else:
+        scan_mode = "full"
+        is_candidate = is_code_file
+    # Paths whose findings are copied from the previous scan instead of re-analyzed
+    unchanged_paths = set()
+
+    # --- Parallel File Discovery and Reading ---
+    discovery_stats = DiscoveryStats()
+    async for discovered in discover_files(path, is_candidate, discovery_stats):
+        relative_path = discovered.path
+        try:
+            # --- Hashing and Cache Check (Optional, can be disabled for full re-scans) ---
+            # Skipping is only safe when the previous scan holds findings to carry forward
+            if scan_mode == "full" and previous_scan and known_hashes.get(relative_path) == discovered.hash:
+                unchanged_paths.add(relative_path)
+                logger.info(f"Skipping unchanged file: {relative_path}")
                 skipped_files_count += 1
                 continue
-            
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-
-                # Skip empty or trivial files
-                if len(content.strip()) < 20:
-                    skipped_files_count += 1
-                    continue
-
-                # --- Hashing and Cache Check (Optional, can be disabled for full re-scans) ---
-                file_hash = compute_file_hash(content)
-                metadata = await file_metadata_collection.find_one({"repo_id": repo_id, "path": relative_path})
-                if metadata and metadata.get("hash") == file_hash:
-                    logger.info(f"Skipping unchanged file: {relative_path}")
-                    skipped_files_count += 1
-                    continue
-
-                files_for_llm.append((relative_path, content))
-                
-                # Update metadata to mark file as processed with the new hash
-                await file_metadata_collection.update_one(
-                    {"repo_id": repo_id, "path": relative_path},
-                    {"$set": {"hash": file_hash, "last_scanned": datetime.utcnow()}},
-                    upsert=True
-                )
-                processed_files_count += 1
-            except Exception as e:
-                logger.error(f"Error processing file {relative_path}: {str(e)}")
-                error_files_count += 1
+
+            files_for_llm.append((relative_path, discovered.content.decode('utf-8')))
+            pending_hashes[relative_path] = discovered.hash
+            processed_files_count += 1
+        except Exception as e:
+            logger.error(f"Error processing file {relative_path}: {str(e)}")
+            error_files_count += 1
+
+    skipped_files_count += discovery_stats.skipped_files_count
+    error_files_count += discovery_stats.error_files_count
+    if change_set is not None:
+        analyzed_paths = set(pending_hashes)
+        unchanged_paths = {
+            f.get("location") for f in previous_findings
+            if f.get("location") not in analyzed_paths
+            and f.get("location") not in change_set.changed
+            and f.get("location") not in change_set.deleted
+        }
+    logger.info(
+        f"Discovered {discovery_stats.discovered_files_count} files in "
+        f"{discovery_stats.elapsed_seconds:.2f}s ({discovery_stats.files_per_second} files/sec)"
+    )
     
+    # --- Static Rules: pattern-level issues are found locally, without the LLM ---
+    static_started = time.perf_counter()
+    static_findings_by_path = await run_static_rules(files_for_llm)
+    static_seconds = time.perf_counter() - static_started
+    static_findings_count = 0
+    for findings in static_findings_by_path.values():
+        all_findings.extend(findings)
+        static_findings_count += len(findings)
+    # Files without code never reach the LLM; their hashes stay uncommitted so they're
+    # never taken for reviewed, which costs nothing since they're skipped again
+    semantic_files = [
+        (file_path, content) for file_path, content in files_for_llm
+        if should_send_to_llm(file_path, content)
+    ]
+    no_code_paths = {file_path for file_path, _ in files_for_llm} - {file_path for file_path, _ in semantic_files}
+    logger.info(
+        f"Static rules found {static_findings_count} issues in {static_seconds:.2f}s; "
+        f"{len(semantic_files)} of {len(files_for_llm)} files have code for semantic review"
+    )
+
+    # --- Findings Cache Lookup: only cache misses are sent to the LLM ---
+    findings_cache = get_findings_cache()
+    cache_keys = {
+        file_path: make_cache_key(pending_hashes[file_path], LLM_PROMPT_VERSION, LLM_MODEL, LLM_TEMPERATURE)
+        for file_path, _ in semantic_files
+    }
+    cached = await findings_cache.get_many(cache_keys.values())
+    cache_misses = []
+    tokens_saved = 0
+    for file_path, content in semantic_files:
+        cached_findings = cached.get(cache_keys[file_path])
+        if cached_findings is None:
+            cache_misses.append((file_path, content))
+            continue
+        all_findings.extend(restore_findings(cached_findings, file_path))
+        analyzed_hashes[file_path] = pending_hashes[file_path]
+        tokens_saved += estimate_prompt_tokens(content)
+    cache_hits = len(semantic_files) - len(cache_misses)
+    logger.info(f"LLM findings cache: {cache_hits} hits, {len(cache_misses)} misses, ~{tokens_saved} tokens saved")
+
     # --- Batch and Parallel LLM Analysis ---
-    if files_for_llm:
-        logger.info(f"Submitting {len(files_for_llm)} files for LLM analysis...")
-        llm_batches = batch_files_for_llm(files_for_llm)
+    if cache_misses:
+        logger.info(f"Submitting {len(cache_misses)} files for LLM analysis...")
+        llm_batches = batch_files_for_llm(cache_misses)
         llm_tasks = [call_llm_for_analysis(batch) for batch in llm_batches]
-        list_of_findings_lists = await asyncio.gather(*llm_tasks)
-        for findings_list in list_of_findings_lists:
+        batch_results = await asyncio.gather(*llm_tasks)
+        failed_paths = set()
+        new_findings_by_path = {file_path: [] for file_path, _ in cache_misses}
+        for findings_list, failed in batch_results:
             all_findings.extend(findings_list)
+            failed_paths |= failed
+            for finding in findings_list:
+                if finding.get("location") in new_findings_by_path:
+                    new_findings_by_path[finding["location"]].append(finding)
+        # A file is analyzed only if every fragment of it succeeded; failed files are
+        # retried on the next scan by leaving their hashes uncommitted and uncached
+        new_cache_entries = {}
+        for file_path, findings in new_findings_by_path.items():
+            if file_path in failed_paths:
+                continue
+            analyzed_hashes[file_path] = pending_hashes[file_path]
+            new_cache_entries[cache_keys[file_path]] = findings
+        await findings_cache.put_many(new_cache_entries)
+
+    # --- Code Quality Rules: per function/class evaluation selected by Tree-sitter queries ---
+    rule_stats = {}
+    if RULES_ENGINE_ENABLED and semantic_files:
+        rule_findings, rule_failed_paths, rule_stats = await get_rules_engine().evaluate_files(
+            semantic_files, get_language_parser, LLM_MODEL, LLM_TEMPERATURE
+        )
+        all_findings.extend(rule_findings)
+        for file_path in rule_failed_paths:
+            analyzed_hashes.pop(file_path, None)
     
+    # Content hash of every code file in the scanned tree, read this scan or not
+    if change_set is not None:
+        tree_hashes = {
+            p: h for p, h in known_hashes.items()
+            if p not in change_set.deleted and p not in change_set.changed
+        }
+    else:
+        tree_hashes = {p: known_hashes[p] for p in unchanged_paths if p in known_hashes}
+    tree_hashes.update(pending_hashes)
+
+    # --- AST Archive: one packed object per scan, reusing ASTs of unchanged files ---
+    archive_metrics = {}
+    if AST_ARCHIVE_ENABLED and scan_id:
+        try:
+            archive_metrics = await asyncio.to_thread(
+                archive_scan_asts, repo_id, scan_id, dict(files_for_llm), tree_hashes
+            )
+        except Exception as e:
+            # ASTs are supplementary; never fail a scan over them
+            logger.error(f"Failed to archive ASTs for repo {repo_id}: {str(e)}")
+
     # --- Final Result Aggregation ---
-    logger.info(f"Total raw findings from LLM: {len(all_findings)}")
+    logger.info(f"Total raw findings from static rules and LLM: {len(all_findings)}")
     enhanced_findings = add_violation_metadata(all_findings)
+    carried_findings = carry_forward_findings(previous_findings, unchanged_paths)
+    if carried_findings:
+        logger.info(f"Carried forward {len(carried_findings)} findings for {len(unchanged_paths)} unchanged files")
+        enhanced_findings.extend(carried_findings)
     scores = calculate_overall_scores(enhanced_findings)
 
     logger.info(f"Scan complete: {processed_files_count} files processed, {skipped_files_count} skipped, {error_files_count} errors")
@@ -655,13 +852,30 @@ async def run_ai_compliance_scan(path: str, repo_id: int) -> Dict[str, Any]:
             "processed_files_count": processed_files_count,
             "skipped_files_count": skipped_files_count,
             "error_files_count": error_files_count,
+            **discovery_stats.as_dict(),
+            "scan_mode": scan_mode,
+            "commit_sha": head_sha,
+            "base_commit_sha": change_set.base_sha if change_set else None,
+            "carried_forward_findings_count": len(carried_findings),
+            "static_findings_count": static_findings_count,
+            "static_rules_seconds": round(static_seconds, 3),
+            "llm_files_count": len(semantic_files),
+            "llm_files_skipped_count": len(files_for_llm) - len(semantic_files),
+            "llm_cache_hits": cache_hits,
+            "llm_cache_misses": len(cache_misses),
+            "llm_cache_hit_rate": round(cache_hits / len(semantic_files), 3) if semantic_files else 0.0,
+            "llm_tokens_saved": tokens_saved,
+            "rule_stats": rule_stats,
+            **archive_metrics,
             "total_violations_found": len(enhanced_findings),
             "scan_timestamp": datetime.utcnow().isoformat()
         },
         "scores": scores,
         "findings": enhanced_findings,
+        # Files that could not be analyzed; retried by the next incremental scan
+        "unanalyzed_paths": sorted(set(pending_hashes) - set(analyzed_hashes) - no_code_paths),
     }
-    return scan_results
+    return scan_results, analyzed_hashes
 
 def get_grade_from_score(score: float) -> str:
     """Convert numerical score to letter grade."""
@@ -676,12 +890,15 @@ def get_grade_from_score(score: float) -> str:
     else:
         return "F"
 
-async def save_scan_results(scan_id: str, repo_id: int, user_id: str, results: Dict[str, Any]) -> None:
+async def save_scan_results(scan_id: str, repo_id: int, user_id: str, results: Dict[str, Any], file_hashes: Optional[Dict[str, str]] = None) -> None:
     """Save scan results to MongoDB using the structured ScanCRUD methods."""
     try:
         logger.info(f"Saving scan results for repo {repo_id}, user {user_id}, scan {scan_id}")
         
-        # Step 1: Update the primary scan document with the results
+        # Step 1: Save the findings, in bulk, to the violations collection where they are read from
+        await ScanCRUD.save_violations(repo_id, user_id, scan_id, results.get("findings", []))
+
+        # Step 2: Mark the scan completed; its document keeps only the summary and scores
         await ScanCRUD.update_scan_status(
             scan_id, 
             status="completed", 
@@ -690,15 +907,18 @@ async def save_scan_results(scan_id: str, repo_id: int, user_id: str, results: D
             results=results
         )
             
-        # Step 2: Save the individual violations for historical analysis
-        violations = results.get("findings", [])
-        if violations:
-            await ScanCRUD.save_violations(repo_id, user_id, scan_id, violations)
-            
         # Step 3: Save the calculated compliance scores for historical tracking
         scores = results.get("scores", {})
         if scores:
             await ScanCRUD.save_compliance_score(repo_id, user_id, scan_id, scores)
+
+        # Step 4: Fold the scan into the repo's dashboard summary and the user's daily analytics
+        await ScanCRUD.record_repo_summary(repo_id, user_id, scan_id, results)
+        await ScanCRUD.record_analytics_daily(user_id, scores.get("overall_score"))
+
+        # Step 5: Only now that findings are persisted, mark the analyzed files as scanned
+        if file_hashes:
+            await FileMetadataCRUD.bulk_upsert_hashes(repo_id, user_id, file_hashes)
             
         logger.info(f"Successfully saved all scan data for repo {repo_id} with scan_id {scan_id}")
             
@@ -735,39 +955,103 @@ async def run_scan_worker(request: Request):
                     "status": status,
                     "progress": progress,
                     "summary": summary,
-                    "results": results, # Send final results on completion
+                    # Send the final summary and scores on completion; clients page through findings
+                    "results": without_findings(results) if results else None,
                 }
             )
             logger.info(f"Broadcasted status update for scan {scan_id}: {status} ({progress}%)")
         except Exception as e:
             logger.error(f"Failed to update status for scan {scan_id}: {e}")
 
+    local_path = f"/tmp/repo-{repo_id}-{scan_id}"
     try:
         await update_status("cloning", 5, "Cloning repository...")
         clone_url = await get_gitlab_repo_clone_url(repo_id, user_id)
         
-        local_path = f"/tmp/repo-{repo_id}-{scan_id}"
         await update_status("cloning", 15, f"Cloning repository to {local_path}...")
-        clone_repo(clone_url, local_path)
+        clone_metrics = await asyncio.to_thread(checkout_repo, repo_id, clone_url, local_path)
         
         await update_status("scanning", 30, "Starting compliance and security scan...")
-        scan_results = await run_ai_compliance_scan(local_path, repo_id)
+        previous_scan = await ScanCRUD.get_latest_completed_scan(repo_id, user_id)
+        scan_results, analyzed_hashes = await run_ai_compliance_scan(
+            local_path, repo_id, user_id, previous_scan, scan_id, clone_url
+        )
+        scan_results["scan_summary"].update(clone_metrics)
         
         await update_status("saving", 95, "Finalizing and saving results...")
-        await save_scan_results(scan_id, repo_id, user_id, scan_results)
+        await save_scan_results(scan_id, repo_id, user_id, scan_results, analyzed_hashes)
         
         await update_status("completed", 100, "Scan complete.", results=scan_results)
         logger.info(f"Successfully completed scan for repo: {repo_id}")
 
+        # Search indexing runs as its own job so it never delays scan results
+        if CHUNK_INDEXING_ENABLED:
+            try:
+                mode = enqueue_index_job({"repo_id": repo_id, "user_id": user_id, "scan_id": scan_id}, run_index_job)
+                await ScanCRUD.update_index_status(scan_id, mode)
+            except Exception as e:
+                logger.error(f"Failed to start index job for scan {scan_id}: {str(e)}")
+
     except Exception as e:
         logger.error(f"Scan failed for repo_id {repo_id}, scan_id {scan_id}: {str(e)}")
         # Use the helper to notify client of failure
         await update_status("failed", 100, f"Scan failed: {str(e)}")
         
     finally:
-        # Clean up the cloned repository
-        if os.path.exists(local_path):
-            shutil.rmtree(local_path)
-        logger.info(f"Cleaned up temporary directory: {local_path}")
+        # Clean up the checkout; cached mirrors are kept for the next scan
+        try:
+            await asyncio.to_thread(cleanup_checkout, repo_id, local_path)
+            logger.info(f"Cleaned up temporary directory: {local_path}")
+        except Exception as e:
+            logger.error(f"Failed to clean up {local_path}: {str(e)}")
         
-    return {"status": "completed", "scan_id": scan_id}
\ No newline at end of file
+    return {"status": "completed", "scan_id": scan_id}
+
+async def run_index_job(repo_id: int, user_id: str, scan_id: str) -> Dict[str, Any]:
+    """
+    Bring the semantic search index up to date with the repository after a completed scan.
+    The tree and its hashes come from the checkout the job reads, so files deleted upstream
+    are dropped from the index and only new or changed files are chunked.
+    """
+    # Feeds the keyword index and, when configured, the vector store
+    store = get_search_index()
+    local_path = f"/tmp/repo-{repo_id}-{scan_id}-index"
+    try:
+        await ScanCRUD.update_index_status(scan_id, "indexing")
+        clone_url = await get_gitlab_repo_clone_url(repo_id, user_id)
+        await asyncio.to_thread(checkout_repo, repo_id, clone_url, local_path)
+        contents = CheckoutContents(local_path)
+        tree_hashes = await asyncio.to_thread(contents.hashes, is_code_file)
+        metrics = await ChunkIndexer(store).index_repo(repo_id, tree_hashes, contents, make_index_chunks)
+        await ScanCRUD.update_index_status(scan_id, "completed", metrics)
+        return metrics
+    except Exception as e:
+        logger.error(f"Index job failed for repo_id {repo_id}, scan_id {scan_id}: {str(e)}")
+        await ScanCRUD.update_index_status(scan_id, "failed")
+        raise
+    finally:
+        try:
+            await asyncio.to_thread(cleanup_checkout, repo_id, local_path)
+        except Exception as e:
+            logger.error(f"Failed to clean up {local_path}: {str(e)}")
+
+@router.post("/index")
+async def run_index_worker(request: Request):
+    """
+    Worker endpoint for the search indexing job queued after each completed scan.
+    """
+    data = await request.json()
+    repo_id = data.get("repo_id")
+    user_id = data.get("user_id")
+    scan_id = data.get("scan_id")
+
+    if not all([repo_id, user_id, scan_id]):
+        raise HTTPException(status_code=400, detail="Missing repo_id, user_id, or scan_id")
+
+    logger.info(f"Received index request for repo_id: {repo_id}, scan_id: {scan_id}")
+    try:
+        metrics = await run_index_job(repo_id, user_id, scan_id)
+    except Exception as e:
+        # A 500 makes Cloud Tasks retry the job with backoff
+        raise HTTPException(status_code=500, detail=f"Index job failed: {str(e)}")
+    return {"status": "completed", "scan_id": scan_id, "metrics": metrics}
@@ -0,0 +1,378 @@
+# worker/rules_engine.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from tree_sitter import Language
+from worker.grammars import grammars
+from worker.batching import LLM_BATCH_TOKEN_BUDGET, estimate_tokens
+from worker.llm_cache import get_findings_cache, make_cache_key
+from worker.llm_dispatcher import get_llm_dispatcher
+
+logger = logging.getLogger(__name__)
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rules", "code_quality_rules.json")
+# Evaluating rules costs one LLM call per matched function or class, so it is opt-in
+RULES_ENGINE_ENABLED = os.getenv("RULES_ENGINE_ENABLED", "false").lower() == "true"
+# Bump whenever make_rules_prompt changes so cached verdicts are not reused
+RULES_PROMPT_VERSION = "1"
+
+# Tree-sitter patterns per construct and language. Each pattern captures a node whose
+# enclosing function or class is what the rule is evaluated against. Captures starting
+# with "_" only anchor predicates. Patterns a grammar version does not support are dropped.
+CONSTRUCT_PATTERNS = {
+    "python": {
+        "function": ["(function_definition) @function"],
+        "class": ["(class_definition) @class"],
+        "if": ["(if_statement) @if"],
+        "loop": ["(for_statement) @loop", "(while_statement) @loop"],
+        "switch": ["(match_statement) @switch"],
+        "ternary": ["(conditional_expression) @ternary"],
+        "parameters": ["(parameters) @parameters"],
+        "comment": ["(comment) @comment"],
+        "collection": ["(list) @collection", "(set) @collection", "(dictionary) @collection"],
+        "test": [
+            '(function_definition name: (identifier) @test (#match? @test "^test"))',
+            '(class_definition name: (identifier) @test (#match? @test "^Test"))',
+        ],
+    },
+    "javascript": {
+        "function": [
+            "(function_declaration) @function", "(generator_function_declaration) @function",
+            "(function) @function", "(arrow_function) @function", "(method_definition) @function",
+        ],
+        "class": ["(class_declaration) @class"],
+        "if": ["(if_statement) @if"],
+        "loop": ["(for_statement) @loop", "(for_in_statement) @loop", "(while_statement) @loop", "(do_statement) @loop"],
+        "switch": ["(switch_statement) @switch"],
+        "ternary": ["(ternary_expression) @ternary"],
+        "parameters": ["(formal_parameters) @parameters"],
+        "comment": ["(comment) @comment"],
+        "collection": ["(array) @collection", "(object) @collection"],
+        "test": [
+            '(call_expression function: (identifier) @_fn arguments: (arguments [(arrow_function) (function)] @test) (#match? @_fn "^(describe|it|test)$"))',
+        ],
+    },
+    "java": {
+        "function": ["(method_declaration) @function", "(constructor_declaration) @function"],
+        "class": ["(class_declaration) @class", "(interface_declaration) @class", "(enum_declaration) @class"],
+        "if": ["(if_statement) @if"],
+        "loop": ["(for_statement) @loop", "(enhanced_for_statement) @loop", "(while_statement) @loop", "(do_statement) @loop"],
+        "switch": ["(switch_expression) @switch", "(switch_statement) @switch"],
+        "ternary": ["(ternary_expression) @ternary"],
+        "parameters": ["(formal_parameters) @parameters"],
+        "comment": ["(line_comment) @comment", "(block_comment) @comment", "(comment) @comment"],
+        "collection": ["(array_initializer) @collection", "(array_creation_expression) @collection"],
+        "test": [
+            '(method_declaration name: (identifier) @test (#match? @test "^test"))',
+            '(marker_annotation name: (identifier) @test (#eq? @test "Test"))',
+        ],
+    },
+    "go": {
+        "function": ["(function_declaration) @function", "(method_declaration) @function", "(func_literal) @function"],
+        "class": ["(type_declaration) @class"],
+        "if": ["(if_statement) @if"],
+        "loop": ["(for_statement) @loop"],
+        "switch": ["(expression_switch_statement) @switch", "(type_switch_statement) @switch", "(select_statement) @switch"],
+        "ternary": [],
+        "parameters": ["(parameter_list) @parameters"],
+        "comment": ["(comment) @comment"],
+        "collection": ["(composite_literal) @collection"],
+        "test": ['(function_declaration name: (identifier) @test (#match? @test "^(Test|Benchmark)"))'],
+    },
+}
+# TypeScript grammars are supersets of JavaScript with a few extra declarations
+CONSTRUCT_PATTERNS["typescript"] = {
+    **CONSTRUCT_PATTERNS["javascript"],
+    "class": [
+        "(class_declaration) @class", "(abstract_class_declaration) @class", "(interface_declaration) @class",
+    ],
+}
+CONSTRUCT_PATTERNS["tsx"] = CONSTRUCT_PATTERNS["typescript"]
+
+# Node types a rule is evaluated against: the nearest enclosing function or class
+UNIT_NODE_TYPES = {
+    "python": {"function_definition", "class_definition"},
+    "javascript": {
+        "function_declaration", "generator_function_declaration", "function",
+        "arrow_function", "method_definition", "class_declaration",
+    },
+    "java": {"method_declaration", "constructor_declaration", "class_declaration", "interface_declaration", "enum_declaration"},
+    "go": {"function_declaration", "method_declaration", "func_literal", "type_declaration"},
+}
+UNIT_NODE_TYPES["typescript"] = UNIT_NODE_TYPES["javascript"] | {"abstract_class_declaration", "interface_declaration"}
+UNIT_NODE_TYPES["tsx"] = UNIT_NODE_TYPES["typescript"]
+
+CLASS_NODE_TYPES = {
+    "class_definition", "class_declaration", "abstract_class_declaration",
+    "interface_declaration", "enum_declaration", "type_declaration",
+}
+
+# match_tags used in code_quality_rules.json and the construct each one selects.
+# Tags about naming, style or documentation apply to every function and class.
+TAG_CONSTRUCTS = {
+    "function": {"function"}, "def": {"function"}, "length": {"function"}, "complexity": {"function"},
+    "class": {"class"},
+    "if": {"if"}, "ternary": {"ternary"}, "switch": {"switch"}, "case": {"switch"},
+    "for": {"loop"}, "while": {"loop"}, "loop": {"loop"}, "expensive": {"loop"},
+    "parameters": {"parameters"}, "args": {"parameters"},
+    "comment": {"comment"},
+    "list": {"collection"}, "set": {"collection"}, "dict": {"collection"}, "array": {"collection"}, "lookup": {"collection"},
+    "test": {"test"}, "spec": {"test"}, "it": {"test"}, "describe": {"test"},
+    **{tag: {"function", "class"} for tag in (
+        "docstring", "variable", "name", "naming", "convention", "style", "indentation", "format",
+        "lint", "eslint", "flake8", "pylint", "whitespace", "trailing", "line", "wrap",
+        "copy", "duplicate", "similar",
+    )},
+}
+
+# Rules tagged with these judge a whole file rather than a function or class
+FILE_SCOPE_TAGS = {"file", "module"}
+
+RULE_CATEGORY = "quality"
+
+
+class NodeMatch(NamedTuple):
+    """A function or class together with the rules that apply to it."""
+    path: str
+    kind: str
+    start_line: int  # one-based
+    end_line: int
+    text: str
+    rule_ids: Tuple[str, ...]
+
+
+def load_rules(path: str = RULES_FILE) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class RulesEngine:
+    """
+    Evaluates code_quality_rules.json against the functions and classes its match_tags select.
+
+    Each rule's tags are compiled into a single Tree-sitter query per language, once, and
+    every node is sent to the LLM with all of its applicable rules bundled into one prompt.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = {rule["id"]: rule for rule in rules}
+        self.rule_constructs: Dict[str, Set[str]] = {}
+        for rule in rules:
+            tags = {tag.lower() for tag in rule.get("match_tags", [])}
+            if tags & FILE_SCOPE_TAGS:
+                logger.info(f"Rule {rule['id']} is file-scoped and is not evaluated per node")
+                continue
+            constructs = set().union(*(TAG_CONSTRUCTS.get(tag, set()) for tag in tags))
+            if constructs:
+                self.rule_constructs[rule["id"]] = constructs
+            else:
+                logger.warning(f"Rule {rule['id']} has no tags that map to a code construct: {sorted(tags)}")
+        self._queries: Dict[str, Any] = {}
+        self.stats = {rule_id: {"matched": 0, "evaluated": 0, "violations": 0} for rule_id in self.rule_constructs}
+
+    @classmethod
+    def from_file(cls, path: str = RULES_FILE) -> "RulesEngine":
+        return cls(load_rules(path))
+
+    def compile(self, language: Language) -> Optional[Any]:
+        """Compile, once per language, one query covering every construct any rule needs."""
+        if language.name in self._queries:
+            return self._queries[language.name]
+        needed = set().union(*self.rule_constructs.values()) if self.rule_constructs else set()
+        patterns = []
+        for construct, construct_patterns in CONSTRUCT_PATTERNS.get(language.name, {}).items():
+            if construct not in needed:
+                continue
+            for pattern in construct_patterns:
+                try:
+                    language.query(pattern)
+                    patterns.append(pattern)
+                except Exception:
+                    # Node type not present in this grammar version
+                    logger.debug(f"Skipping unsupported {language.name} pattern: {pattern}")
+        query = language.query("\n".join(patterns)) if patterns else None
+        self._queries[language.name] = query
+        return query
+
+    def match_nodes(self, path: str, content: str, language: Language) -> List[NodeMatch]:
+        """Find the functions and classes in a file that at least one rule applies to."""
+        query = self.compile(language)
+        if query is None:
+            return []
+        unit_types = UNIT_NODE_TYPES.get(language.name, set())
+        source = content.encode("utf-8")
+        tree = grammars.parse(language, source)
+
+        constructs_by_node: Dict[Tuple[int, int], Set[str]] = {}
+        nodes = {}
+        for node, construct in query.captures(tree.root_node):
+            if construct.startswith("_"):
+                continue
+            unit = node
+            while unit is not None and unit.type not in unit_types:
+                unit = unit.parent
+            if unit is None:
+                continue
+            key = (unit.start_byte, unit.end_byte)
+            nodes[key] = unit
+            constructs_by_node.setdefault(key, set()).add(construct)
+
+        matches = []
+        for key, constructs in sorted(constructs_by_node.items()):
+            rule_ids = tuple(sorted(
+                rule_id for rule_id, needed in self.rule_constructs.items() if needed & constructs
+            ))
+            if not rule_ids:
+                continue
+            unit = nodes[key]
+            matches.append(NodeMatch(
+                path=path,
+                kind="class" if unit.type in CLASS_NODE_TYPES else "function",
+                start_line=unit.start_point[0] + 1,
+                end_line=unit.end_point[0] + 1,
+                text=source[unit.start_byte:unit.end_byte].decode("utf-8", errors="replace"),
+                rule_ids=rule_ids,
+            ))
+        return matches
+
+    def make_rules_prompt(self, match: NodeMatch) -> str:
+        """Bundle every rule that applies to a node into a single prompt."""
+        prompt = (
+            f"You are a code quality reviewer. Evaluate the following {match.kind} from {match.path} "
+            f"(lines {match.start_line}-{match.end_line}) against each rule below.\n\n"
+            "Respond with a single JSON object whose keys are the rule ids exactly as given and whose "
+            'values are objects of the form { "compliant": true|false, "rationale": "<why>" }.\n\nRules:\n'
+        )
+        for rule_id in match.rule_ids:
+            rule = self.rules[rule_id]
+            prompt += f"- {rule_id} ({rule['title']}): {rule['prompt_template']}\n"
+        prompt += f"\n---\n```\n{match.text}\n```\n"
+        return prompt
+
+    def _verdict_is_valid(self, rule_id: str, verdict: Any) -> bool:
+        if not isinstance(verdict, dict):
+            return False
+        required = self.rules[rule_id].get("output_schema", {}).get("required", ["compliant", "rationale"])
+        return all(k in verdict for k in required) and isinstance(verdict.get("compliant"), bool)
+
+    def _to_findings(self, match: NodeMatch, verdicts: List[Dict[str, Any]]) -> List[Dict]:
+        findings = []
+        for verdict in verdicts:
+            rule_id = verdict["rule_id"]
+            if verdict["compliant"]:
+                continue
+            rule = self.rules[rule_id]
+            findings.append({
+                "type": rule_id,
+                "category": RULE_CATEGORY,
+                "severity": rule.get("severity", "low"),
+                "description": f"{rule['title']}: {verdict.get('rationale', '')}",
+                "recommendation": rule.get("description"),
+                "location": match.path,
+                "line": match.start_line,
+                "rule_id": rule_id,
+            })
+        return findings
+
+    async def evaluate_node(self, match: NodeMatch, model: str, temperature: float) -> List[Dict[str, Any]]:
+        """Evaluate one node against its rules and return the verdicts, cached by node text and rule set."""
+        node_hash = hashlib.sha256(f"{','.join(match.rule_ids)}\n{match.text}".encode()).hexdigest()
+        cache_key = make_cache_key(node_hash, f"rules-{RULES_PROMPT_VERSION}", model, temperature)
+        cache = get_findings_cache()
+        cached = await cache.get_many([cache_key])
+        if cache_key in cached:
+            return cached[cache_key]
+
+        response = await get_llm_dispatcher().chat_completion(
+            model=model,
+            messages=[{"role": "user", "content": self.make_rules_prompt(match)}],
+            response_format={"type": "json_object"},
+            temperature=temperature,
+        )
+        answer = json.loads(response.choices[0].message.content)
+        verdicts = []
+        for rule_id in match.rule_ids:
+            verdict = answer.get(rule_id)
+            if self._verdict_is_valid(rule_id, verdict):
+                verdicts.append({"rule_id": rule_id, "compliant": verdict["compliant"], "rationale": verdict.get("rationale", "")})
+            else:
+                logger.warning(f"Malformed verdict for rule {rule_id} in {match.path}:{match.start_line}: {verdict}")
+        await cache.put_many({cache_key: verdicts})
+        return verdicts
+
+    def match_files(
+        self, files: Iterable[Tuple[str, str]], get_language: Callable[[str], Optional[Language]]
+    ) -> List[NodeMatch]:
+        """Match the rules over (path, content) pairs. Files that fail to parse are logged and skipped."""
+        matches = []
+        for path, content in files:
+            language = get_language(path)
+            if language is None:
+                continue
+            try:
+                matches.extend(self.match_nodes(path, content, language))
+            except Exception as e:
+                logger.error(f"Rule matching failed for {path}: {str(e)}")
+        return matches
+
+    async def evaluate_files(
+        self,
+        files: Iterable[Tuple[str, str]],
+        get_language: Callable[[str], Optional[Language]],
+        model: str,
+        temperature: float,
+    ) -> Tuple[List[Dict], Set[str], Dict[str, Dict[str, int]]]:
+        """
+        Evaluate the rules over (path, content) pairs. Returns the findings, the paths for
+        which at least one node could not be evaluated and per-rule counts of nodes matched,
+        nodes evaluated and violations found.
+        """
+        stats = {rule_id: {"matched": 0, "evaluated": 0, "violations": 0} for rule_id in self.rule_constructs}
+        # Parsing every file is CPU-bound, so it runs off the event loop
+        matches = await asyncio.to_thread(self.match_files, files, get_language)
+
+        evaluable = []
+        for match in matches:
+            # Nodes that would not fit in a prompt are skipped rather than truncated
+            if estimate_tokens(match.path, match.text) > LLM_BATCH_TOKEN_BUDGET:
+                logger.warning(f"Skipping oversized {match.kind} at {match.path}:{match.start_line} for rule evaluation")
+                continue
+            evaluable.append(match)
+            for rule_id in match.rule_ids:
+                stats[rule_id]["matched"] += 1
+
+        results = await asyncio.gather(
+            *[self.evaluate_node(match, model, temperature) for match in evaluable],
+            return_exceptions=True,
+        )
+        findings = []
+        failed_paths = set()
+        for match, result in zip(evaluable, results):
+            if isinstance(result, Exception):
+                logger.error(f"Rule evaluation failed for {match.path}:{match.start_line}: {str(result)}")
+                failed_paths.add(match.path)
+                continue
+            for verdict in result:
+                stats[verdict["rule_id"]]["evaluated"] += 1
+                stats[verdict["rule_id"]]["violations"] += not verdict["compliant"]
+            findings.extend(self._to_findings(match, result))
+        # Lifetime totals for this worker, alongside the per-scan counts returned
+        for rule_id, counts in stats.items():
+            for name, value in counts.items():
+                self.stats[rule_id][name] += value
+        logger.info(f"Evaluated {len(evaluable)} nodes against code quality rules: {stats}")
+        return findings, failed_paths, stats
+
+
+_rules_engine: Optional[RulesEngine] = None
+
+
+def get_rules_engine() -> RulesEngine:
+    """Return the rules engine shared by all scans in this worker."""
+    global _rules_engine
+    if _rules_engine is None:
+        _rules_engine = RulesEngine.from_file()
+    return _rules_engine
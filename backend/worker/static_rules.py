@@ -0,0 +1,208 @@
+# worker/static_rules.py
+import asyncio
+import bisect
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATIC_RULES_WORKERS = int(os.getenv("STATIC_RULES_WORKERS", str(os.cpu_count() or 1)))
+# Below this many bytes the pool's startup and pickling cost more than the scan itself
+STATIC_RULES_INLINE_BYTES = int(os.getenv("STATIC_RULES_INLINE_BYTES", str(1024 * 1024)))
+# The worker already runs threads (Motor, discovery, to_thread), which forked children can deadlock on
+STATIC_RULES_START_METHOD = os.getenv("STATIC_RULES_START_METHOD", "forkserver")
+
+# Pattern rules from VIOLATION_CODES.md. QUAL001 and QUAL004 need the AST and are left to the LLM.
+STATIC_RULES = [
+    {
+        "code": "SEC001",
+        "type": "hardcoded_secret",
+        "category": "security",
+        "severity": "high",
+        "description": "Hardcoded secret detected in code",
+        "recommendation": "Use environment variables or secure secret management.",
+        "pattern": r"""(?i:\b(?:password|passwd|secret|token|api_?key|private_?key)\w*\s*[:=]\s*["'][^"'\s]{4,}["'])""",
+    },
+    {
+        "code": "SEC002",
+        "type": "eval_usage",
+        "category": "security",
+        "severity": "high",
+        "description": "Use of eval() function detected - potential security risk",
+        "recommendation": "Use safer alternatives like JSON.parse() or direct function calls.",
+        "pattern": r"""(?<![\w.])eval\s*\(""",
+    },
+    {
+        "code": "SEC003",
+        "type": "sql_injection_risk",
+        "category": "security",
+        "severity": "high",
+        "description": "Potential SQL injection vulnerability detected",
+        "recommendation": "Use parameterized queries or an ORM.",
+        "pattern": r"""\b(?:execute|query)\s*\(\s*(?:f["']|`[^`\n]*\$\{|["'][^"'\n]*["']\s*(?:%|\+|\.format\())""",
+    },
+    {
+        "code": "COMP001",
+        "type": "hardcoded_url",
+        "category": "compliance",
+        "severity": "medium",
+        "description": "Hardcoded URL found - consider using environment variables",
+        "recommendation": "Use environment variables or configuration files.",
+        "pattern": r"""\bhttps?://[^\s"'`<>)]+""",
+    },
+    {
+        "code": "COMP002",
+        "type": "no_input_validation",
+        "category": "compliance",
+        "severity": "high",
+        "description": "User input used without validation",
+        "recommendation": "Implement input validation and sanitization.",
+        "pattern": r"""\brequest\.(?:form|args|json)\s*\[""",
+    },
+    {
+        "code": "COMP003",
+        "type": "insecure_random",
+        "category": "compliance",
+        "severity": "medium",
+        "description": "Insecure random number generation detected",
+        "recommendation": "Use cryptographically secure random generators.",
+        "pattern": r"""\brandom\.randint\s*\(|\bMath\.random\s*\(""",
+    },
+    {
+        "code": "QUAL002",
+        "type": "todo_comment",
+        "category": "quality",
+        "severity": "info",
+        "description": "TODO/FIXME comment found in code",
+        "recommendation": "Address the TODO or create a proper ticket.",
+        "pattern": r"""(?:\#|//)\s*(?:TODO|FIXME)\b""",
+    },
+    {
+        "code": "QUAL003",
+        "type": "print_statement",
+        "category": "quality",
+        "severity": "low",
+        "description": "Print statement found in production code - consider using proper logging",
+        "recommendation": "Use a proper logging framework.",
+        "pattern": r"""(?<![\w.])print\s*\(""",
+        "extensions": {".py"},
+    },
+]
+
+RULES_BY_CODE = {rule["code"]: rule for rule in STATIC_RULES}
+
+# Every rule is one named alternative of a single regex, so each file is scanned in one pass
+COMBINED_PATTERN = re.compile(
+    "|".join(f"(?P<{rule['code']}>{rule['pattern']})" for rule in STATIC_RULES),
+    re.MULTILINE,
+)
+
+# Human-readable list for the LLM prompt of what the static rules already report
+STATIC_RULE_SUMMARY = ", ".join(rule["description"].split(" - ")[0].lower() for rule in STATIC_RULES)
+
+
+def scan_content(file_path: str, content: str) -> List[Dict]:
+    """Run every static rule over a file and return findings in the flat LLM finding shape."""
+    ext = os.path.splitext(file_path)[1].lower()
+    line_starts = [0] + [m.end() for m in re.finditer("\n", content)]
+    findings = []
+    seen = set()
+    for match in COMBINED_PATTERN.finditer(content):
+        rule = RULES_BY_CODE[match.lastgroup]
+        if "extensions" in rule and ext not in rule["extensions"]:
+            continue
+        line = bisect.bisect_right(line_starts, match.start())
+        # One finding per rule per line is enough
+        if (rule["code"], line) in seen:
+            continue
+        seen.add((rule["code"], line))
+        findings.append({
+            "type": rule["type"],
+            "category": rule["category"],
+            "severity": rule["severity"],
+            "description": f"{rule['description']}: {match.group(0).strip()[:120]}",
+            "recommendation": rule["recommendation"],
+            "location": file_path,
+            "line": line,
+            "rule_id": rule["code"],
+        })
+    return findings
+
+
+def scan_chunk(files: List[Tuple[str, str]]) -> Dict[str, List[Dict]]:
+    """Scan a chunk of files. Runs in a pool worker, so it must stay importable and picklable."""
+    return {file_path: scan_content(file_path, content) for file_path, content in files}
+
+
+def _chunk_files(files: List[Tuple[str, str]], chunk_count: int) -> List[List[Tuple[str, str]]]:
+    """Split files into roughly equal-sized chunks by content length."""
+    total = sum(len(content) for _, content in files)
+    target = max(1, total // chunk_count)
+    chunks, current, current_size = [], [], 0
+    for file_path, content in files:
+        current.append((file_path, content))
+        current_size += len(content)
+        if current_size >= target:
+            chunks.append(current)
+            current, current_size = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_static_rules_pool() -> ProcessPoolExecutor:
+    """Return the process pool shared by all scans in this worker."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=STATIC_RULES_WORKERS, mp_context=multiprocessing.get_context(STATIC_RULES_START_METHOD)
+        )
+    return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next call starts a fresh one."""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_static_rules(files: Iterable[Tuple[str, str]]) -> Dict[str, List[Dict]]:
+    """
+    Scan (path, content) pairs with the static rules and return findings keyed by path.
+    Large inputs are spread across a process pool; small ones are scanned in a thread.
+    If a pool worker dies, the scan is retried once on a new pool and then in a thread.
+    """
+    files = list(files)
+    if not files:
+        return {}
+    total_bytes = sum(len(content) for _, content in files)
+    if total_bytes < STATIC_RULES_INLINE_BYTES or STATIC_RULES_WORKERS <= 1:
+        return await asyncio.to_thread(scan_chunk, files)
+
+    loop = asyncio.get_running_loop()
+    # Several chunks per worker keeps the pool busy when file sizes are uneven
+    chunks = _chunk_files(files, STATIC_RULES_WORKERS * 4)
+    for attempt in range(2):
+        pool = get_static_rules_pool()
+        try:
+            results = await asyncio.gather(*[loop.run_in_executor(pool, scan_chunk, chunk) for chunk in chunks])
+            break
+        except BrokenProcessPool as e:
+            logger.warning(f"Static rules pool broke (attempt {attempt + 1}): {str(e)}")
+            _discard_pool(pool)
+    else:
+        return await asyncio.to_thread(scan_chunk, files)
+    findings_by_path = {}
+    for result in results:
+        findings_by_path.update(result)
+    return findings_by_path
@@ -34,17 +34,26 @@ export function ViolationsTab({ repoId }: ViolationsTabProps) {
       const token = getToken()
       if (!token) throw new Error("Authentication token not found.")
 
-      const response = await fetch(`${BACKEND_BASE_URL}/api/repos/${repoId}/violations`, {
-        headers: { 'Authorization': `Bearer ${token}` },
-      })
+      // Violations come a page at a time; show each page as it arrives
+      const loaded: Violation[] = []
+      let cursor: string | null = null
+      do {
+        const query: string = cursor ? `?cursor=${encodeURIComponent(cursor)}` : ""
+        const response: Response = await fetch(`${BACKEND_BASE_URL}/api/repos/${repoId}/violations${query}`, {
+          headers: { 'Authorization': `Bearer ${token}` },
+        })
 
-      if (!response.ok) {
-        const errorData = await response.json()
-        throw new Error(errorData.detail || "Failed to fetch violations.")
-      }
+        if (!response.ok) {
+          const errorData = await response.json()
+          throw new Error(errorData.detail || "Failed to fetch violations.")
+        }
 
-      const data = await response.json()
-      setViolations(data.violations || [])
+        const data = await response.json()
+        loaded.push(...(data.violations || []))
+        setViolations([...loaded])
+        setLoading(false)
+        cursor = data.next_cursor || null
+      } while (cursor)
     } catch (err) {
       setError(err instanceof Error ? err.message : "An unknown error occurred.")
     } finally {
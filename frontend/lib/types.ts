@@ -63,6 +63,7 @@ export interface ViolationsData {
   scan_id: string;
   scan_date: string;
   violations: any[];
+  next_cursor?: string | null;
   summary: {
     total_violations: number;
     critical_count: number;